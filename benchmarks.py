@@ -0,0 +1,168 @@
+"""
+Small benchmarks for the ODE models.
+
+Run with
+    python benchmarks.py <name>
+where <name> is one of the functions listed in BENCHMARKS.
+"""
+import os
+import subprocess
+import sys
+import time
+import timeit
+
+import numpy as np
+from scipy.integrate import solve_ivp
+
+from exp_decay import ExponentialDecay
+from pendulum import Pendulum, DampenedPendulum
+from double_pendulum import DoublePendulum
+from n_pendulum import NPendulum
+
+
+def benchmark_jacobian(B: float = 1000.0, T: float = 10.0) -> None:
+    """
+    Compares the implicit solvers with a finite difference Jacobian and with
+    the analytic one, on the stiff, heavily dampened pendulum and on the
+    double pendulum.
+    """
+    cases = [
+        (DampenedPendulum(B=B), np.array([np.pi / 6, 0.35]), f"B={B}"),
+        (DoublePendulum(), np.array([np.pi / 6, 0.35, 0, 0]), ""),
+    ]
+    for model, u0, label in cases:
+        _compare_jacobians(model, u0, T, label)
+
+
+def _compare_jacobians(model, u0: np.ndarray, T: float, label: str) -> None:
+    calls = 0
+
+    def rhs(t, u):
+        # solve_ivp does not count the calls made for finite differences.
+        nonlocal calls
+        calls += 1
+        return model(t, u)
+
+    print(f"{type(model).__name__}({label}), T={T}")
+    print(
+        f"{'method':<8}{'jacobian':<12}{'rhs calls':>10}{'nfev':>8}{'njev':>8}"
+        f"{'nlu':>8}{'time [ms]':>12}"
+    )
+    for method in ("Radau", "BDF", "LSODA"):
+        for label, jac in (("estimated", None), ("analytic", model.jacobian)):
+            calls = 0
+            start = time.perf_counter()
+            solution = solve_ivp(rhs, (0, T), u0, method=method, jac=jac)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{method:<8}{label:<12}{calls:>10}{solution.nfev:>8}"
+                f"{solution.njev:>8}{solution.nlu:>8}{1000 * elapsed:>12.2f}"
+            )
+    print()
+
+
+def _per_call(function, number: int) -> float:
+    """Best time per call in microseconds."""
+    return 1e6 * min(timeit.repeat(function, number=number, repeat=5)) / number
+
+
+def benchmark_rhs(N: int = 1000, number: int = 20000) -> None:
+    """
+    Cost of one call of the right hand side of each model, allocating a new
+    array and writing into a preallocated one, for a single state and for
+    an ensemble of N states.
+    """
+    cases = [
+        (ExponentialDecay(0.4), np.array([1.0])),
+        (Pendulum(), np.array([np.pi / 6, 0.35])),
+        (DampenedPendulum(B=0.5), np.array([np.pi / 6, 0.35])),
+        (DoublePendulum(), np.array([np.pi / 6, 0.35, 0.0, 0.0])),
+    ]
+    print(f"Time per call [us], ensemble of N={N}")
+    print(f"{'model':<18}{'single':>10}{'out=':>10}{'ensemble':>10}{'out=':>10}")
+    for model, u in cases:
+        ensemble = np.tile(u[:, None], (1, N))
+        out, ensemble_out = np.empty_like(u), np.empty_like(ensemble)
+        timings = [
+            _per_call(lambda: model(0.0, u), number),
+            _per_call(lambda: model(0.0, u, out=out), number),
+            _per_call(lambda: model(0.0, ensemble), number // 10),
+            _per_call(lambda: model(0.0, ensemble, out=ensemble_out), number // 10),
+        ]
+        print(f"{type(model).__name__:<18}" + "".join(f"{t:>10.2f}" for t in timings))
+    print()
+
+
+def benchmark_n_pendulum(
+    links=(2, 3, 5, 10, 20, 50), N: int = 1000, number: int = 2000
+) -> None:
+    """
+    Cost of one call of the right hand side of NPendulum against the number
+    of links, for a single state and for an ensemble of N states, with the
+    hand written DoublePendulum for comparison.
+    """
+    rng = np.random.default_rng(0)
+    print(f"Time per call [us], ensemble of N={N}")
+    print(f"{'model':<18}{'single':>10}{'ensemble':>12}{'per state':>12}")
+    cases = [("DoublePendulum", DoublePendulum(), 4)] + [
+        (f"NPendulum({n})", NPendulum(L=np.ones(n)), 2 * n) for n in links
+    ]
+    for name, model, num_states in cases:
+        u = rng.uniform(-1, 1, num_states)
+        ensemble = rng.uniform(-1, 1, (num_states, N))
+        # Fewer calls for the long chains, the ensemble calls grow like n**3.
+        calls = max(1, number // num_states)
+        single = _per_call(lambda: model(0.0, u), calls)
+        batch = _per_call(lambda: model(0.0, ensemble), max(1, calls // 50))
+        print(f"{name:<18}{single:>10.2f}{batch:>12.1f}{batch / N:>12.3f}")
+    print()
+
+
+_COLD_START = """
+import time
+start = time.perf_counter()
+import numpy as np
+from double_pendulum import DoublePendulum
+imported = time.perf_counter()
+DoublePendulum().solve(np.array([0.5, 0.0, 0.0, 0.0]), 1.0, 0.01, method={method!r})
+solved = time.perf_counter()
+print(imported - start, solved - imported)
+"""
+
+
+def benchmark_import(repeat: int = 5) -> None:
+    """
+    Cold start latency in a fresh interpreter: the time of
+    import double_pendulum, and of the first solve after it, with a native
+    integrator and with solve_ivp, which loads SciPy on first use. The best
+    of repeat processes is reported.
+    """
+    print(f"{'method':<10}{'import [ms]':>14}{'first solve [ms]':>18}")
+    for method in ("RK4", "RK45"):
+        timings = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", _COLD_START.format(method=method)],
+                capture_output=True,
+                text=True,
+                check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            ).stdout
+            timings.append([float(value) for value in output.split()])
+        import_time, solve_time = np.min(timings, axis=0)
+        print(f"{method:<10}{1000 * import_time:>14.1f}{1000 * solve_time:>18.1f}")
+    print()
+
+
+BENCHMARKS = {
+    "jacobian": benchmark_jacobian,
+    "rhs": benchmark_rhs,
+    "n_pendulum": benchmark_n_pendulum,
+    "import": benchmark_import,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
@@ -0,0 +1,246 @@
+import functools
+import hashlib
+import importlib
+import importlib.metadata
+import inspect
+import json
+import shutil
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+from ode import UniformTimeGrid
+from storage import HEADER, load_result, save_result
+
+
+@dataclass
+class CacheStats:
+    """Counters of a SolutionCache."""
+
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    bypassed: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / lookups if lookups else 0.0
+
+
+# Modules with the solvers, whose code is part of every key.
+SOLVER_MODULES = ("ode", "integrators")
+
+
+@functools.lru_cache(maxsize=None)
+def _solver_digest() -> str:
+    """
+    Hash of the source code of the solver modules and of the SciPy version,
+    which is read without importing SciPy.
+    """
+    digest = hashlib.sha256()
+    for name in SOLVER_MODULES:
+        digest.update(inspect.getsource(importlib.import_module(name)).encode())
+    try:
+        digest.update(importlib.metadata.version("scipy").encode())
+    except importlib.metadata.PackageNotFoundError:
+        pass
+    return digest.hexdigest()
+
+
+def _code_digest(cls: type) -> str:
+    """
+    Hash of the source code of a model class and its base classes, and of
+    the solvers.
+    """
+    digest = hashlib.sha256(_solver_digest().encode())
+    for base in cls.__mro__:
+        if base is object or base.__module__ in ("abc", "builtins"):
+            continue
+        try:
+            digest.update(inspect.getsource(base).encode())
+        except (OSError, TypeError):
+            digest.update(base.__qualname__.encode())
+    return digest.hexdigest()
+
+
+def _result_nbytes(result) -> int:
+    """Bytes of the arrays of a result, including its cached quantities."""
+    # A UniformTimeGrid only holds three numbers.
+    time = result.time
+    time_nbytes = 0 if isinstance(time, UniformTimeGrid) else np.asarray(time).nbytes
+    cached = getattr(result, "__dict__", {}).get("_cached", {})
+    cached_nbytes = sum(getattr(value, "nbytes", 0) for value in cached.values())
+    return time_nbytes + np.asarray(result.solution).nbytes + cached_nbytes
+
+
+class SolutionCache:
+    """
+    Content-addressed cache of solutions.
+
+    A solution is identified by the class of the model, the source code of
+    that class, its parameters, u0, T, dt, method and solver options, so
+    changing any of them gives a new entry instead of a stale one. Recently
+    used results are kept in memory up to max_bytes, and if directory is
+    given every result is also stored there with storage.save_result and
+    reopened with np.memmap on a later miss in memory.
+
+    The cached result objects are shared between callers, and should not be
+    changed in place. Solves with dense=True or events are not cached, as
+    the stored results could not give back the DenseResult or the events,
+    and are counted as bypassed instead.
+
+    Args.:
+    max_bytes: memory budget for the time and solution arrays, and the
+    cached quantities of the results, such as their kinematics. A result
+    is measured again every time it is stored or returned from memory.
+    directory: optional directory for the on-disk store.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 2**20,
+        directory: Optional[Union[str, Path]] = None,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory is not None else None
+        self.stats = CacheStats()
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._code_digests = {}
+
+    def model_key(self, model) -> str:
+        """The part of the key that identifies the model and its parameters."""
+        cls = type(model)
+        if cls not in self._code_digests:
+            self._code_digests[cls] = _code_digest(cls)
+        description = json.dumps(
+            {
+                "class": f"{cls.__module__}.{cls.__qualname__}",
+                "code": self._code_digests[cls],
+                "parameters": {
+                    name: repr(value) for name, value in model.parameters.items()
+                },
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(description.encode()).hexdigest()[:32]
+
+    def key(
+        self,
+        model,
+        u0: np.ndarray,
+        T: float,
+        dt: float,
+        method: Optional[str] = None,
+        **options,
+    ) -> str:
+        u0 = np.ascontiguousarray(u0)
+        digest = hashlib.sha256()
+        digest.update(str((u0.dtype.str, u0.shape)).encode())
+        digest.update(u0.tobytes())
+        description = json.dumps(
+            {
+                "T": repr(T),
+                "dt": repr(dt),
+                "method": method,
+                "options": {name: repr(value) for name, value in options.items()},
+            },
+            sort_keys=True,
+        )
+        digest.update(description.encode())
+        return f"{self.model_key(model)}-{digest.hexdigest()[:32]}"
+
+    def solve(
+        self,
+        model,
+        u0: np.ndarray,
+        T: float,
+        dt: float,
+        method: Optional[str] = None,
+        **options,
+    ):
+        """
+        Same as model.solve, or model.solve_batch for a two dimensional u0,
+        but returns the cached result when there is one.
+        """
+        if options.get("dense") or options.get("events"):
+            self.stats.bypassed += 1
+            return self._compute(model, u0, T, dt, method, options)
+
+        key = self.key(model, u0, T, dt, method, **options)
+        if key in self._entries:
+            self.stats.hits += 1
+            result = self._entries[key]
+            # Its cached quantities may have been computed since.
+            self._remember(key, result)
+            return result
+
+        path = self._path(key)
+        if path is not None and (path / HEADER).is_file():
+            self.stats.disk_hits += 1
+            result = load_result(path)
+            self._remember(key, result)
+            return result
+
+        self.stats.misses += 1
+        result = self._compute(model, u0, T, dt, method, options)
+        if path is not None:
+            save_result(result, path, model=model, method=method)
+        self._remember(key, result)
+        return result
+
+    @staticmethod
+    def _compute(model, u0, T, dt, method, options):
+        if np.ndim(u0) == 2:
+            return model.solve_batch(u0, T, dt, method=method, **options)
+        return model.solve(u0, T, dt, method=method, **options)
+
+    def _path(self, key: str) -> Optional[Path]:
+        if self.directory is None:
+            return None
+        return self.directory / key
+
+    def _forget(self, key: str) -> None:
+        del self._entries[key]
+        self.nbytes -= self._sizes.pop(key)
+
+    def _remember(self, key: str, result) -> None:
+        """Stores result as the most recently used entry, and evicts."""
+        if key in self._entries:
+            self._forget(key)
+        nbytes = _result_nbytes(result)
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = result
+        self._sizes[key] = nbytes
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            self._forget(next(iter(self._entries)))
+            self.stats.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        path = self._path(key)
+        return key in self._entries or (
+            path is not None and (path / HEADER).is_file()
+        )
+
+    def invalidate(self, model=None) -> None:
+        """
+        Removes the entries of one model, with its current parameters, or all
+        entries, from memory and disk.
+        """
+        prefix = self.model_key(model) if model is not None else ""
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            self._forget(key)
+        if self.directory is not None and self.directory.is_dir():
+            for path in self.directory.glob(f"{prefix}*"):
+                shutil.rmtree(path)
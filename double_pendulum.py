@@ -1,61 +1,282 @@
+import math
+
 from pendulum import *
+from pendulum import _chunks, _kinematics_out, _KinematicsResults
 
 
 class DoublePendulum(ODEModel):
+    structure = "hamiltonian"
+
     def __init__(self, L1=1, L2=1, g=9.81) -> None:
         self.L1 = L1
         self.L2 = L2
         self.g = g
 
-    def __call__(self, t: float, u: np.ndarray) -> np.ndarray:
+    def __call__(
+        self, t: float, u: np.ndarray, out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
         """
         Taking the derivative of u.
 
         Inputs:
         t: time
         u: array with theta (position) and omega (angular velocity) for two pendulums.
+        out: optional array to write du_dt into.
 
         Output:
         du_dt : time derivative of u array.
         """
         theta1, omega1, theta2, omega2 = u
 
+        if getattr(u, "ndim", 1) == 1:
+            # A single state: scalar math is much cheaper than NumPy calls.
+            sin, cos = math.sin, math.cos
+        else:
+            sin, cos = np.sin, np.cos
+
         dtheta1_dt = omega1
         dtheta2_dt = omega2
 
         dtheta = theta2 - theta1
+        sin_dtheta = sin(dtheta)
+        cos_dtheta = cos(dtheta)
+        sin_theta1 = sin(theta1)
+        sin_theta2 = sin(theta2)
 
         numerator1 = (
-            (self.L1 * (omega1**2) * np.sin(dtheta) * np.cos(dtheta))
-            + (self.g * np.sin(theta2) * np.cos(dtheta))
-            + (self.L2 * (omega2**2) * np.sin(dtheta))
-            - (2 * self.g * np.sin(theta1))
+            (self.L1 * (omega1**2) * sin_dtheta * cos_dtheta)
+            + (self.g * sin_theta2 * cos_dtheta)
+            + (self.L2 * (omega2**2) * sin_dtheta)
+            - (2 * self.g * sin_theta1)
         )
         numerator2 = (
-            (-self.L2 * (omega2**2) * np.sin(dtheta) * np.cos(dtheta))
-            + (2 * self.g * np.sin(theta1) * np.cos(dtheta))
-            - (2 * self.L1 * (omega1**2) * np.sin(dtheta))
-            - (2 * self.g * np.sin(theta2))
+            (-self.L2 * (omega2**2) * sin_dtheta * cos_dtheta)
+            + (2 * self.g * sin_theta1 * cos_dtheta)
+            - (2 * self.L1 * (omega1**2) * sin_dtheta)
+            - (2 * self.g * sin_theta2)
         )
 
-        denominator1 = (2 * self.L1) - (self.L1 * (np.cos(dtheta) * np.cos(dtheta)))
-        denominator2 = (2 * self.L2) - (self.L2 * (np.cos(dtheta) * np.cos(dtheta)))
+        denominator = 2 - cos_dtheta * cos_dtheta
+        domega1_dt = numerator1 / (self.L1 * denominator)
+        domega2_dt = numerator2 / (self.L2 * denominator)
+
+        return self._pack(out, dtheta1_dt, domega1_dt, dtheta2_dt, domega2_dt)
 
-        domega1_dt = numerator1 / denominator1
-        domega2_dt = numerator2 / denominator2
+    def jacobian(self, t: float, u: np.ndarray) -> np.ndarray:
+        """
+        Jacobian of the right hand side with respect to the state.
+
+        Inputs:
+        t: time
+        u: array with theta1, omega1, theta2, omega2, shape (4,) or (4, N).
+
+        Output:
+        J : array of shape (4, 4) or (4, 4, N).
+        """
+        theta1, omega1, theta2, omega2 = u
+        dtheta = theta2 - theta1
+        sin, cos = np.sin(dtheta), np.cos(dtheta)
+        sin1, cos1 = np.sin(theta1), np.cos(theta1)
+        sin2, cos2 = np.sin(theta2), np.cos(theta2)
 
-        return np.array([dtheta1_dt, domega1_dt, dtheta2_dt, domega2_dt])
+        numerator1 = (
+            self.L1 * omega1**2 * sin * cos
+            + self.g * sin2 * cos
+            + self.L2 * omega2**2 * sin
+            - 2 * self.g * sin1
+        )
+        numerator2 = (
+            -self.L2 * omega2**2 * sin * cos
+            + 2 * self.g * sin1 * cos
+            - 2 * self.L1 * omega1**2 * sin
+            - 2 * self.g * sin2
+        )
+        denominator1 = self.L1 * (2 - cos**2)
+        denominator2 = self.L2 * (2 - cos**2)
+
+        # Partial derivatives with respect to dtheta = theta2 - theta1.
+        dn1_ddtheta = (
+            self.L1 * omega1**2 * (cos**2 - sin**2)
+            - self.g * sin2 * sin
+            + self.L2 * omega2**2 * cos
+        )
+        dn2_ddtheta = (
+            -self.L2 * omega2**2 * (cos**2 - sin**2)
+            - 2 * self.g * sin1 * sin
+            - 2 * self.L1 * omega1**2 * cos
+        )
+        dd1_ddtheta = 2 * self.L1 * sin * cos
+        dd2_ddtheta = 2 * self.L2 * sin * cos
+
+        J = np.zeros((4, 4) + np.shape(theta1))
+        J[0, 1] = 1
+        J[2, 3] = 1
+
+        J[1, 0] = (
+            (-2 * self.g * cos1 - dn1_ddtheta) * denominator1
+            + numerator1 * dd1_ddtheta
+        ) / denominator1**2
+        J[1, 1] = 2 * self.L1 * omega1 * sin * cos / denominator1
+        J[1, 2] = (
+            (self.g * cos2 * cos + dn1_ddtheta) * denominator1
+            - numerator1 * dd1_ddtheta
+        ) / denominator1**2
+        J[1, 3] = 2 * self.L2 * omega2 * sin / denominator1
+
+        J[3, 0] = (
+            (2 * self.g * cos1 * cos - dn2_ddtheta) * denominator2
+            + numerator2 * dd2_ddtheta
+        ) / denominator2**2
+        J[3, 1] = -4 * self.L1 * omega1 * sin / denominator2
+        J[3, 2] = (
+            (-2 * self.g * cos2 + dn2_ddtheta) * denominator2
+            - numerator2 * dd2_ddtheta
+        ) / denominator2**2
+        J[3, 3] = -2 * self.L2 * omega2 * sin * cos / denominator2
+        return J
 
     @property
     def num_states(self) -> int:
         return 4
 
-    def _create_result(self, solution):
-        return DoublePendulumResults(solution.t, solution.y, self.L1, self.L2, self.g)
+    def to_canonical(self, u: np.ndarray) -> np.ndarray:
+        """
+        Canonical coordinates (theta1, p1, theta2, p2) of the state u,
+        with the conjugate momenta of two unit masses.
+        """
+        theta1, omega1, theta2, omega2 = u
+        coupling = self.L1 * self.L2 * np.cos(theta1 - theta2)
+        p1 = 2 * self.L1**2 * omega1 + coupling * omega2
+        p2 = self.L2**2 * omega2 + coupling * omega1
+        return np.array([theta1, p1, theta2, p2])
+
+    def _angular_velocities(self, z: np.ndarray):
+        theta1, p1, theta2, p2 = z
+        coupling = self.L1 * self.L2 * np.cos(theta1 - theta2)
+        determinant = 2 * self.L1**2 * self.L2**2 - coupling**2
+        omega1 = (self.L2**2 * p1 - coupling * p2) / determinant
+        omega2 = (2 * self.L1**2 * p2 - coupling * p1) / determinant
+        return omega1, omega2
+
+    def from_canonical(self, z: np.ndarray) -> np.ndarray:
+        omega1, omega2 = self._angular_velocities(z)
+        return np.array([z[0], omega1, z[2], omega2])
+
+    def canonical_rhs(self, t: float, z: np.ndarray) -> np.ndarray:
+        """
+        Hamilton's equations for the double pendulum.
+
+        Inputs:
+        t: time
+        z: canonical coordinates (theta1, p1, theta2, p2).
+
+        Output:
+        dz_dt : time derivative of z.
+        """
+        theta1, _, theta2, _ = z
+        omega1, omega2 = self._angular_velocities(z)
+        coupling = self.L1 * self.L2 * np.sin(theta1 - theta2) * omega1 * omega2
+        dp1_dt = -coupling - 2 * self.g * self.L1 * np.sin(theta1)
+        dp2_dt = coupling - self.g * self.L2 * np.sin(theta2)
+        return np.array([omega1, dp1_dt, omega2, dp2_dt])
+
+    def energy(self, u: np.ndarray) -> np.ndarray:
+        """Total energy, as total_energy of the results."""
+        theta1, omega1, theta2, omega2 = u[0], u[1], u[2], u[3]
+        L1, L2, g = self.L1, self.L2, self.g
+        potential = g * (2 * L1 + L2 - 2 * L1 * np.cos(theta1) - L2 * np.cos(theta2))
+        kinetic = (
+            (L1 * omega1) ** 2
+            + 0.5 * (L2 * omega2) ** 2
+            + L1 * L2 * omega1 * omega2 * np.cos(theta1 - theta2)
+        )
+        return potential + kinetic
+
+    def _create_result(self, time, solution):
+        return DoublePendulumResults(time, solution, self.L1, self.L2, self.g)
+
+
+def flip_event(terminal: bool = True):
+    """Event where one of the rods of a DoublePendulum passes over the top."""
+
+    @event(terminal=terminal, direction=1)
+    def flip(t, u):
+        return max(abs(u[0]), abs(u[2])) - np.pi
+
+    return flip
+
+
+def double_pendulum_kinematics(
+    theta1: np.ndarray,
+    omega1: np.ndarray,
+    theta2: np.ndarray,
+    omega2: np.ndarray,
+    L1: float,
+    L2: float,
+    g: float,
+    out: Optional[np.ndarray] = None,
+    chunk_size: int = KINEMATICS_CHUNK_SIZE,
+) -> np.ndarray:
+    """
+    Positions, velocities and energies of a double pendulum with unit masses.
+
+    Computed from the angles and angular velocities in one pass over the
+    data, chunk by chunk and straight into the output array.
+
+    Inputs:
+    theta1, omega1, theta2, omega2: arrays of the same shape, time along the
+    last axis.
+    L1, L2, g: lengths of the rods and gravity.
+    out: optional array of shape (11,) + theta1.shape to write into.
+    chunk_size: number of time points per chunk.
+
+    Output:
+    array with x1, y1, x2, y2, velocity_x1, velocity_y1, velocity_x2,
+    velocity_y2, potential_energy, kinetic_energy and total_energy along
+    the first axis.
+    """
+    out = _kinematics_out(out, (11,) + np.shape(theta1))
+    for chunk in _chunks(np.shape(theta1)[-1], chunk_size):
+        th1, om1, th2, om2 = theta1[chunk], omega1[chunk], theta2[chunk], omega2[chunk]
+        x1, y1, x2, y2, vx1, vy1, vx2, vy2, P, K, E = (row[chunk] for row in out)
+
+        np.sin(th1, out=x1)
+        x1 *= L1
+        np.cos(th1, out=y1)
+        y1 *= -L1
+        np.sin(th2, out=x2)
+        x2 *= L2
+        np.cos(th2, out=y2)
+        y2 *= -L2
+
+        np.multiply(om1, y1, out=vx1)
+        vx1 *= -1
+        np.multiply(om1, x1, out=vy1)
+        np.multiply(om2, y2, out=vx2)
+        vx2 *= -1
+        vx2 += vx1
+        np.multiply(om2, x2, out=vy2)
+        vy2 += vy1
+
+        x2 += x1
+        y2 += y1
+
+        np.add(y1, y2, out=P)
+        P += 2 * L1 + L2
+        P *= g
+
+        # E is used as scratch space before it gets its final value.
+        np.multiply(vx1, vx1, out=K)
+        for v in (vy1, vx2, vy2):
+            np.multiply(v, v, out=E)
+            K += E
+        K *= 0.5
+        np.add(P, K, out=E)
+    return out
 
 
 @dataclass
-class DoublePendulumResults:
+class DoublePendulumResults(_KinematicsResults):
     """
     Dataclass for storing results of the DoublePendulum class.
     Position, velocty, energy.
@@ -66,80 +287,88 @@ class DoublePendulumResults:
     L1: float
     L2: float
     g: float
+    cache: bool = field(default=True, repr=False, compare=False)
+    stats: Optional[SolveStats] = field(default=None, repr=False, compare=False)
+    t_events: Optional[List[np.ndarray]] = field(default=None, repr=False)
+    y_events: Optional[List[np.ndarray]] = field(default=None, repr=False)
 
     @property
     def theta1(self) -> np.ndarray:
-        return self.solution[0]
+        return self.solution[..., 0, :]
 
     @property
     def omega1(self) -> np.ndarray:
-        return self.solution[1]
+        return self.solution[..., 1, :]
 
     @property
     def theta2(self) -> np.ndarray:
-        return self.solution[2]
+        return self.solution[..., 2, :]
 
     @property
     def omega2(self) -> np.ndarray:
-        return self.solution[3]
+        return self.solution[..., 3, :]
+
+    def kinematics(
+        self, out: Optional[np.ndarray] = None, chunk_size: int = KINEMATICS_CHUNK_SIZE
+    ) -> np.ndarray:
+        """
+        Positions, velocities and energies, see double_pendulum_kinematics.
+        """
+        return double_pendulum_kinematics(
+            self.theta1,
+            self.omega1,
+            self.theta2,
+            self.omega2,
+            self.L1,
+            self.L2,
+            self.g,
+            out=out,
+            chunk_size=chunk_size,
+        )
 
     @property
     def x1(self) -> np.ndarray:
-        return self.L1 * np.sin(self.theta1)
+        return self._rows(0)
 
     @property
     def y1(self) -> np.ndarray:
-        return -self.L1 * np.cos(self.theta1)
+        return self._rows(1)
 
     @property
     def x2(self) -> np.ndarray:
-        return self.x1 + self.L2 * np.sin(self.theta2)
+        return self._rows(2)
 
     @property
     def y2(self) -> np.ndarray:
-        return self.y1 - self.L2 * np.cos(self.theta2)
+        return self._rows(3)
 
     @property
-    def potential_energy(self) -> np.ndarray:
-        P1 = self.g * (self.y1 + self.L1)
-        P2 = self.g * (self.y2 + self.L1 + self.L2)
-        return P1 + P2
+    def velocity_x1(self) -> np.ndarray:
+        return self._rows(4)
 
     @property
-    def velocity_x1(self) -> np.ndarray:
-        vx1 = np.gradient(self.x1, self.time)
-        return vx1
+    def velocity_y1(self) -> np.ndarray:
+        return self._rows(5)
 
     @property
     def velocity_x2(self) -> np.ndarray:
-        vx2 = np.gradient(self.x2, self.time)
-        return vx2
+        return self._rows(6)
 
     @property
-    def velocity_y1(self) -> np.ndarray:
-        vy1 = np.gradient(self.y1, self.time)
-        return vy1
+    def velocity_y2(self) -> np.ndarray:
+        return self._rows(7)
 
     @property
-    def velocity_y2(self) -> np.ndarray:
-        vy2 = np.gradient(self.y2, self.time)
-        return vy2
+    def potential_energy(self) -> np.ndarray:
+        return self._rows(8)
 
     @property
     def kinetic_energy(self) -> np.ndarray:
-        vx1 = self.velocity_x1
-        vx2 = self.velocity_x2
-        vy1 = self.velocity_y1
-        vy2 = self.velocity_y2
-
-        K1 = (1 / 2) * (vx1 * vx1 + vy1 * vy1)
-        K2 = (1 / 2) * (vx2 * vx2 + vy2 * vy2)
-        return K1 + K2
+        return self._rows(9)
 
     @property
     def total_energy(self) -> np.ndarray:
-        T = self.potential_energy + self.kinetic_energy
-        return T
+        return self._rows(10)
 
 
 def exercise_3d():
@@ -1,6 +1,4 @@
-from scipy.integrate import solve_ivp
 import numpy as np
-import matplotlib.pyplot as plt
 
 from ode import *
 
@@ -24,18 +22,31 @@ class ExponentialDecay(ODEModel):
 
         self._decay_constant = new_decay_constant
 
-    def __call__(self, t: float, u: np.ndarray) -> np.ndarray:
+    def __call__(
+        self, t: float, u: np.ndarray, out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
         """
         Compute the derivative of u at time t.
 
         Args:
         t (float): time
         u (array) : value of function
+        out (array): optional array to write the derivative into.
 
         Returns:
         array, derivative of u at time t.
         """
-        return -self.decay_constant * u
+        return np.multiply(u, -self.decay_constant, out=out)
+
+    def jacobian(self, t: float, u: np.ndarray) -> np.ndarray:
+        u = np.asarray(u)
+        return np.full((1, 1) + u.shape[1:], -self.decay_constant)
+
+    def analytic_solution(self, t: np.ndarray, u0: np.ndarray) -> np.ndarray:
+        """The exact solution u0 exp(-a t), see ODEModel.analytic_solution."""
+        return np.asarray(u0, dtype=float)[..., None] * np.exp(
+            -self.decay_constant * np.asarray(t)
+        )
 
     @property
     def num_states(self) -> int:
@@ -50,6 +61,8 @@ if __name__ == "__main__":
     timespan = (0, 10)
     t_eval = np.linspace(0, 10, 1000)
 
+    from scipy.integrate import solve_ivp
+
     solved = solve_ivp(model, timespan, initial_condition, t_eval=t_eval)
 
     plt.figure()
@@ -0,0 +1,121 @@
+"""
+Batch export of figures, headless and in parallel.
+
+The figures are drawn with plot_ode_solution and plot_energy on
+matplotlib Figure objects with an Agg canvas, which do not go through
+pyplot, so nothing is registered in its global state and no display is
+needed. Every worker process creates one figure with one axes, clears and
+reuses it for all its jobs, and closes it when it is done.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from ode import plot_ode_solution
+from pendulum import plot_energy
+
+PLOTS = {
+    "solution": plot_ode_solution,
+    "energy": plot_energy,
+}
+
+
+@dataclass
+class FigureJob:
+    """
+    One figure to export.
+
+    Either results is given, or the model is solved in the worker with
+    model.solve(u0, T, dt, method, **options), which avoids sending large
+    solutions to the worker processes.
+
+    Args.:
+    filename: file to save the figure to.
+    kind: "solution" for plot_ode_solution or "energy" for plot_energy.
+    title: optional title of the axes.
+    plot_options: passed on to the plot function, e.g. state_labels.
+    """
+
+    filename: str
+    kind: str = "solution"
+    results: object = None
+    model: object = None
+    u0: Optional[np.ndarray] = None
+    T: Optional[float] = None
+    dt: Optional[float] = None
+    method: Optional[str] = None
+    options: dict = field(default_factory=dict)
+    title: Optional[str] = None
+    plot_options: dict = field(default_factory=dict)
+
+    def get_results(self):
+        if self.results is not None:
+            return self.results
+        return self.model.solve(
+            self.u0, self.T, self.dt, self.method, **self.options
+        )
+
+
+def _render(
+    jobs: List[FigureJob], figsize: Tuple[float, float], dpi: int
+) -> List[str]:
+    """Renders jobs on one reused figure, runs in the worker processes."""
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    try:
+        for job in jobs:
+            ax.clear()
+            PLOTS[job.kind](job.get_results(), ax=ax, **job.plot_options)
+            if job.title is not None:
+                ax.set_title(job.title)
+            fig.savefig(job.filename)
+    finally:
+        fig.clear()
+    return [str(job.filename) for job in jobs]
+
+
+def export_figures(
+    jobs: Sequence[FigureJob],
+    max_workers: Optional[int] = None,
+    chunksize: Optional[int] = None,
+    figsize: Tuple[float, float] = (6.4, 4.8),
+    dpi: int = 100,
+) -> List[str]:
+    """
+    Renders and saves the figures of all jobs.
+
+    Args.:
+    jobs: the figures to export.
+    max_workers: number of processes, 1 renders everything in this process.
+    chunksize: number of jobs per task, each task reuses one figure. By
+    default the jobs are split in about four tasks per worker.
+    figsize, dpi: size of the figures.
+
+    Return: the filenames, in the order of the jobs.
+    """
+    for job in jobs:
+        if job.kind not in PLOTS:
+            raise ValueError(
+                f"Unknown kind of figure {job.kind!r}, use one of {list(PLOTS)}"
+            )
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, int(np.ceil(len(jobs) / (4 * max_workers))))
+    chunks = [list(jobs[i : i + chunksize]) for i in range(0, len(jobs), chunksize)]
+
+    if max_workers == 1 or len(chunks) <= 1:
+        results = [_render(chunk, figsize, dpi) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(_render, chunk, figsize, dpi) for chunk in chunks
+            ]
+            results = [future.result() for future in futures]
+    return [filename for filenames in results for filename in filenames]
@@ -0,0 +1,165 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from double_pendulum import DoublePendulum
+from integrators import METHODS
+
+
+def can_flip(
+    theta1: np.ndarray,
+    theta2: np.ndarray,
+    L1: float = 1.0,
+    L2: float = 1.0,
+    g: float = 9.81,
+) -> np.ndarray:
+    """
+    Whether a double pendulum released at rest from the angles theta1 and
+    theta2 has enough energy for one of the rods to pass over the top.
+
+    The potential energy is g (2 L1 + L2 - 2 L1 cos(theta1) - L2 cos(theta2)),
+    with unit masses as in DoublePendulum, so the lowest energy with the
+    first rod upside down is 4 g L1, and with the second one 2 g L2.
+    """
+    energy = g * (2 * L1 + L2 - 2 * L1 * np.cos(theta1) - L2 * np.cos(theta2))
+    return energy >= g * min(4 * L1, 2 * L2)
+
+
+def _flip_tile(
+    model: DoublePendulum,
+    theta1: np.ndarray,
+    theta2: np.ndarray,
+    T: float,
+    dt: float,
+    method: str,
+    options: dict,
+) -> np.ndarray:
+    """
+    Flip times of one tile of initial conditions, runs in the worker
+    processes. The whole tile is integrated as one ensemble, and every
+    trajectory is dropped from it with Integrator.retain once it flips.
+    """
+    flip_time = np.full(len(theta1), np.inf)
+    zeros = np.zeros_like(theta1)
+    integrator = METHODS[method](
+        model, np.array([theta1, zeros, theta2, zeros]), **options
+    )
+    active = np.arange(len(theta1))
+    num_steps = int(round(T / dt))
+    for k in range(num_steps):
+        if not len(active):
+            break
+        integrator.step(k * dt, dt)
+        u = integrator.u
+        flipped = (np.abs(u[0]) > np.pi) | (np.abs(u[2]) > np.pi)
+        if flipped.any():
+            flip_time[active[flipped]] = (k + 1) * dt
+            active = active[~flipped]
+            integrator.retain(~flipped)
+    return flip_time
+
+
+@dataclass
+class FlipMap:
+    """
+    Time until the first flip of a double pendulum released at rest, over a
+    grid of initial angles. flip_time[i, j] belongs to theta2[i] and
+    theta1[j], and is inf where the pendulum did not flip before T.
+    """
+
+    theta1: np.ndarray
+    theta2: np.ndarray
+    flip_time: np.ndarray
+    T: float
+    dt: float
+
+    def image(self, cmap: str = "viridis") -> np.ndarray:
+        """
+        The map as an RGBA image of shape (len(theta2), len(theta1), 4) and
+        dtype uint8, with theta2 increasing upwards, the flip times on a
+        logarithmic color scale and black where there is no flip.
+        """
+        from matplotlib import colormaps
+        from matplotlib.colors import LogNorm
+
+        norm = LogNorm(vmin=self.dt, vmax=self.T)
+        flip_time = self.flip_time[::-1]
+        rgba = colormaps[cmap](norm(np.clip(flip_time, self.dt, self.T)))
+        rgba[~np.isfinite(flip_time)] = (0.0, 0.0, 0.0, 1.0)
+        return (255 * rgba).round().astype(np.uint8)
+
+    def save_image(self, filename: str, cmap: str = "viridis") -> None:
+        """Writes the image with one pixel per initial condition."""
+        import matplotlib.pyplot as plt
+
+        plt.imsave(filename, self.image(cmap))
+
+
+def flip_map(
+    theta1: np.ndarray,
+    theta2: np.ndarray,
+    T: float = 10.0,
+    dt: float = 0.01,
+    L1: float = 1.0,
+    L2: float = 1.0,
+    g: float = 9.81,
+    method: str = "RK4",
+    tile_size: int = 2**14,
+    max_workers: Optional[int] = None,
+    **options,
+) -> FlipMap:
+    """
+    Computes the time until the first flip, when one of the rods passes over
+    the top, for every combination of the initial angles.
+
+    Initial conditions that do not have the energy to flip are skipped, the
+    others are split into tiles that are integrated in parallel as
+    ensembles with a native integrator. The flip times are accurate to dt.
+
+    Args.:
+    theta1, theta2: one dimensional grids of initial angles.
+    T: end time, trajectories that have not flipped by then get inf.
+    dt: time step.
+    L1, L2, g: parameters of the DoublePendulum.
+    method: one of the native methods in integrators.METHODS.
+    tile_size: number of initial conditions per task.
+    max_workers: number of processes, 1 computes everything in this process.
+    options: passed on to the integrator.
+    """
+    theta1 = np.asarray(theta1, dtype=float)
+    theta2 = np.asarray(theta2, dtype=float)
+    grid1, grid2 = np.meshgrid(theta1, theta2)
+    flip_time = np.full(grid1.shape, np.inf)
+    candidates = np.flatnonzero(can_flip(grid1, grid2, L1, L2, g))
+
+    model = DoublePendulum(L1=L1, L2=L2, g=g)
+    tiles = [
+        candidates[start : start + tile_size]
+        for start in range(0, len(candidates), tile_size)
+    ]
+    arguments = [
+        (model, grid1.flat[tile], grid2.flat[tile], T, dt, method, options)
+        for tile in tiles
+    ]
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers == 1 or len(tiles) <= 1:
+        results = [_flip_tile(*args) for args in arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_flip_tile, *args) for args in arguments]
+            results = [future.result() for future in futures]
+
+    for tile, result in zip(tiles, results):
+        flip_time.flat[tile] = result
+    return FlipMap(theta1, theta2, flip_time, T, dt)
+
+
+if __name__ == "__main__":
+    angles = np.linspace(-3, 3, 200)
+    result = flip_map(angles, angles, T=10, dt=0.01)
+    result.save_image("flip_map.png")
@@ -0,0 +1,612 @@
+import inspect
+
+import numpy as np
+from typing import Dict, Optional, Type
+
+
+def accepts_out(model) -> bool:
+    """
+    Whether model(t, u, out=...) can write into a given array, as models
+    following the ODEModel protocol do.
+    """
+    try:
+        return "out" in inspect.signature(model).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+class Integrator:
+    """
+    Base class for the native integrators.
+
+    An integrator owns the current state, u, which is advanced in place by
+    step. The state has shape (num_states,) for a single trajectory or
+    (num_states, N) for an ensemble, and the model is called on the whole
+    array.
+
+    Args.:
+    model: callable rhs(t, u), usually an ODEModel.
+    u0: initial state.
+    """
+
+    def __init__(self, model, u0: np.ndarray, **options) -> None:
+        if options:
+            raise TypeError(
+                f"Unknown options for {type(self).__name__}: {', '.join(options)}"
+            )
+        self.model = model
+        self.u = np.array(u0, dtype=float)
+        self.model_takes_out = accepts_out(model)
+        self.nfev = 0
+        self.naccepted = 0
+        self.nrejected = 0
+        self._events: Optional[_EventTracker] = None
+
+    def step(self, t: float, h: float) -> None:
+        """
+        Advance self.u from time t to time t + h, or only up to the end of
+        the internal step with a terminal event.
+        """
+        raise NotImplementedError
+
+    def _step_taken(self, t0: float, t1: float) -> bool:
+        """
+        Must be called by step after every accepted internal step from t0
+        to t1, returns whether a terminal event occurred in it.
+        """
+        return self._events is not None and self._events.check(t0, t1)
+
+    def reset(self) -> None:
+        """Must be called after self.u has been changed from the outside."""
+
+    def retain(self, mask: np.ndarray) -> None:
+        """
+        Keeps only the trajectories of an ensemble where mask is True, so
+        that the ones that are done are no longer integrated. The internal
+        state of the integrator is kept for the remaining trajectories.
+        """
+        self.u = self.u[..., mask]
+
+    def _output_array(
+        self, t_eval: np.ndarray, out: Optional[np.ndarray]
+    ) -> np.ndarray:
+        shape = self.u.shape + (len(t_eval),)
+        if out is None:
+            return np.empty(shape)
+        if out.shape != shape:
+            raise ValueError(f"out must have shape {shape}, not {out.shape}")
+        return out
+
+    def _derivative(self, t: float, u: np.ndarray) -> np.ndarray:
+        self.nfev += 1
+        return np.asarray(self.model(t, u), dtype=float)
+
+    def integrate(
+        self, t_eval: np.ndarray, out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Steps through the output times t_eval, starting from self.u at
+        t_eval[0], and copies the state at every output time into out.
+
+        Returns: the solution array, shape u.shape + (len(t_eval),).
+        """
+        out = self._output_array(t_eval, out)
+        out[..., 0] = self.u
+        for k in range(1, len(t_eval)):
+            self.step(t_eval[k - 1], t_eval[k] - t_eval[k - 1])
+            out[..., k] = self.u
+        return out
+
+    def integrate_until(
+        self, t_eval: np.ndarray, events: list, out: Optional[np.ndarray] = None
+    ):
+        """
+        Same as integrate, but checks the events after every internal step,
+        with the conventions of solve_ivp: an event is a function g(t, u)
+        with the optional attributes terminal and direction, and it occurs
+        where g changes sign, from negative to positive only if
+        direction > 0, and from positive to negative only if direction < 0.
+        The time of an event is located by bisection on the cubic Hermite
+        interpolant of the internal step, and the integration stops at the
+        first terminal event.
+
+        Returns: (out, t_events, y_events), where out only contains the
+        output times up to a terminal event, and t_events and y_events hold
+        for every event the times and states where it occurred.
+        """
+        out = self._output_array(t_eval, out)
+        out[..., 0] = self.u
+        tracker = self._events = _EventTracker(self, events, t_eval[0])
+        try:
+            for k in range(1, len(t_eval)):
+                self.step(t_eval[k - 1], t_eval[k] - t_eval[k - 1])
+                if tracker.t_terminal is not None:
+                    # The step ended at the event, which may be before t_eval[k].
+                    if t_eval[k] > tracker.t_terminal:
+                        out = out[..., :k]
+                    else:
+                        out[..., k] = self.u
+                        out = out[..., : k + 1]
+                    break
+                out[..., k] = self.u
+        finally:
+            self._events = None
+        return (out, *tracker.arrays(self.u.shape))
+
+
+class _EventTracker:
+    """
+    Checks events at the end of every internal step of an integrator, and
+    records where they occurred.
+    """
+
+    def __init__(self, integrator: Integrator, events: list, t0: float) -> None:
+        self.integrator = integrator
+        self.events = events
+        # Kept at full precision, the output array may be float32.
+        self.y = integrator.u.copy()
+        self.g = [event(t0, self.y) for event in events]
+        self.t_events = [[] for _ in events]
+        self.y_events = [[] for _ in events]
+        self.t_terminal: Optional[float] = None
+
+    def check(self, t0: float, t1: float) -> bool:
+        """
+        Looks for events in the step from t0 to t1, which ended in the
+        current state of the integrator. Returns whether one was terminal.
+        """
+        y0, y1 = self.y, self.integrator.u.copy()
+        g_new = [event(t1, y1) for event in self.events]
+        found = [
+            i
+            for i, event in enumerate(self.events)
+            if _crosses(self.g[i], g_new[i], getattr(event, "direction", 0))
+        ]
+        self.y, self.g = y1, g_new
+        if not found:
+            return False
+
+        f0 = self.integrator._derivative(t0, y0)
+        f1 = self.integrator._derivative(t1, y1)
+        roots = []
+        for i in found:
+            t, y = _locate_event(self.events[i], t0, t1, y0, y1, f0, f1)
+            roots.append((t, i, y))
+        for t, i, y in sorted(roots, key=lambda root: root[0]):
+            self.t_events[i].append(t)
+            self.y_events[i].append(y)
+            if getattr(self.events[i], "terminal", False):
+                self.t_terminal = t
+                return True
+        return False
+
+    def arrays(self, shape: tuple):
+        """Lists of event times and states as arrays, like solve_ivp returns."""
+        return (
+            [np.array(times, dtype=float) for times in self.t_events],
+            [
+                np.array(states, dtype=float).reshape((-1,) + shape)
+                for states in self.y_events
+            ],
+        )
+
+
+def _crosses(g0: float, g1: float, direction: float) -> bool:
+    """Whether an event changes sign in the given direction, as in solve_ivp."""
+    up = g0 <= 0 <= g1
+    down = g0 >= 0 >= g1
+    if direction > 0:
+        return up
+    if direction < 0:
+        return down
+    return up or down
+
+
+def _locate_event(
+    event,
+    t0: float,
+    t1: float,
+    y0: np.ndarray,
+    y1: np.ndarray,
+    f0: np.ndarray,
+    f1: np.ndarray,
+    max_iterations: int = 100,
+):
+    """
+    Bisection for the root of an event in [t0, t1], on the cubic Hermite
+    interpolant of the states y0, y1 and derivatives f0, f1 at the ends.
+
+    Returns: the time and the interpolated state of the event.
+    """
+    h = t1 - t0
+
+    def state(t):
+        s = (t - t0) / h
+        h00 = (1 + 2 * s) * (1 - s) ** 2
+        h10 = s * (1 - s) ** 2
+        h01 = s * s * (3 - 2 * s)
+        h11 = s * s * (s - 1)
+        return h00 * y0 + h10 * h * f0 + h01 * y1 + h11 * h * f1
+
+    g0 = event(t0, y0)
+    a, b = t0, t1
+    for _ in range(max_iterations):
+        middle = 0.5 * (a + b)
+        if middle in (a, b):
+            break
+        g = event(middle, state(middle))
+        if (g0 <= 0) == (g <= 0) and g != 0:
+            a, g0 = middle, g
+        else:
+            b = middle
+    return b, state(b)
+
+
+class FixedStepIntegrator(Integrator):
+    """
+    Base class for methods that take one fixed step per call to _fixed_step.
+
+    Args.:
+    max_step: optional upper bound on the internal step size. Longer steps
+    are split into equally sized substeps.
+    """
+
+    def __init__(
+        self, model, u0: np.ndarray, max_step: Optional[float] = None, **options
+    ) -> None:
+        super().__init__(model, u0, **options)
+        self.max_step = max_step
+
+    def _fixed_step(self, t: float, h: float) -> None:
+        raise NotImplementedError
+
+    def step(self, t: float, h: float) -> None:
+        num_substeps = 1
+        if self.max_step is not None and h > self.max_step:
+            num_substeps = int(np.ceil(h / self.max_step))
+        h_sub = h / num_substeps
+        for i in range(num_substeps):
+            self._fixed_step(t + i * h_sub, h_sub)
+            t_end = t + h if i == num_substeps - 1 else t + (i + 1) * h_sub
+            if self._step_taken(t + i * h_sub, t_end):
+                return
+
+
+class ExplicitRungeKutta(FixedStepIntegrator):
+    """
+    Explicit Runge-Kutta method given by a Butcher tableau.
+
+    All stage derivatives are stored in one preallocated array, and the stage
+    states are built in a scratch buffer, so a step does not allocate
+    anything beyond what the model itself returns.
+    """
+
+    A: np.ndarray
+    B: np.ndarray
+    C: np.ndarray
+    # First same as last: the last stage is the derivative at the new state.
+    fsal = False
+
+    def __init__(self, model, u0: np.ndarray, **options) -> None:
+        super().__init__(model, u0, **options)
+        self.K = np.empty((len(self.B),) + self.u.shape)
+        self.y = np.empty_like(self.u)
+        self.tmp = np.empty_like(self.u)
+        self._first_stage_ready = False
+
+    def reset(self) -> None:
+        self._first_stage_ready = False
+
+    def retain(self, mask: np.ndarray) -> None:
+        super().retain(mask)
+        self.K = self.K[..., mask]
+        self.y = self.y[..., mask]
+        self.tmp = self.tmp[..., mask]
+
+    def _stages(self, t: float, h: float) -> None:
+        """Fill self.K with the stage derivatives of a step from (t, self.u)."""
+        K, y, tmp = self.K, self.y, self.tmp
+        first = 1 if self._first_stage_ready else 0
+        for i in range(first, len(self.B)):
+            y[...] = self.u
+            for j in range(i):
+                if self.A[i, j] != 0:
+                    np.multiply(K[j], h * self.A[i, j], out=tmp)
+                    y += tmp
+            if self.model_takes_out:
+                self.model(t + self.C[i] * h, y, out=K[i])
+            else:
+                K[i] = self.model(t + self.C[i] * h, y)
+        self.nfev += len(self.B) - first
+
+    def _accept(self) -> None:
+        """Add the increment stored in self.y to the state."""
+        self.u += self.y
+        self.naccepted += 1
+        if self.fsal:
+            self.K[0] = self.K[-1]
+            self._first_stage_ready = True
+
+    def _combine(self, weights: np.ndarray, h: float, out: np.ndarray) -> None:
+        """Write h * sum(weights[i] * K[i]) into out."""
+        out[...] = 0.0
+        for i, weight in enumerate(weights):
+            if weight != 0:
+                np.multiply(self.K[i], h * weight, out=self.tmp)
+                out += self.tmp
+
+    def _fixed_step(self, t: float, h: float) -> None:
+        self._stages(t, h)
+        self._combine(self.B, h, self.y)
+        self._accept()
+
+
+class RK4(ExplicitRungeKutta):
+    """Classic fourth order Runge-Kutta method with a fixed step."""
+
+    A = np.array(
+        [
+            [0, 0, 0, 0],
+            [1 / 2, 0, 0, 0],
+            [0, 1 / 2, 0, 0],
+            [0, 0, 1, 0],
+        ]
+    )
+    B = np.array([1 / 6, 1 / 3, 1 / 3, 1 / 6])
+    C = np.array([0, 1 / 2, 1 / 2, 1])
+
+
+class DormandPrince(ExplicitRungeKutta):
+    """
+    Embedded Runge-Kutta pair of order 5(4) by Dormand and Prince.
+
+    Every output interval is covered by as many adaptive substeps as needed
+    to keep the local error estimate within rtol and atol, and the last
+    substep is shortened to land exactly on the output time. The step size
+    is kept between calls to step. With adaptive=False the fifth order
+    solution is used with fixed steps, like RK4.
+
+    Args.:
+    rtol, atol: relative and absolute tolerance of the error estimate.
+    first_step: optional initial step size, defaults to the first interval.
+    adaptive: whether to use the error estimate to control the step size.
+    """
+
+    A = np.array(
+        [
+            [0, 0, 0, 0, 0, 0, 0],
+            [1 / 5, 0, 0, 0, 0, 0, 0],
+            [3 / 40, 9 / 40, 0, 0, 0, 0, 0],
+            [44 / 45, -56 / 15, 32 / 9, 0, 0, 0, 0],
+            [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729, 0, 0, 0],
+            [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656, 0, 0],
+            [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0],
+        ]
+    )
+    B = np.array([35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0])
+    C = np.array([0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1, 1])
+    E = B - np.array(
+        [5179 / 57600, 0, 7571 / 16695, 393 / 640, -92097 / 339200, 187 / 2100, 1 / 40]
+    )
+    order = 4
+    fsal = True
+
+    safety = 0.9
+    min_factor = 0.2
+    max_factor = 10.0
+
+    def __init__(
+        self,
+        model,
+        u0: np.ndarray,
+        rtol: float = 1e-6,
+        atol: float = 1e-9,
+        first_step: Optional[float] = None,
+        adaptive: bool = True,
+        **options,
+    ) -> None:
+        super().__init__(model, u0, **options)
+        self.rtol = rtol
+        self.atol = atol
+        self.h = first_step
+        self.adaptive = adaptive
+        self.error = np.empty_like(self.u)
+        self.scale = np.empty_like(self.u)
+
+    def retain(self, mask: np.ndarray) -> None:
+        super().retain(mask)
+        self.error = self.error[..., mask]
+        self.scale = self.scale[..., mask]
+
+    def _error_norm(self, h: float) -> float:
+        """
+        RMS norm of the scaled local error of the step stored in K, the
+        largest of the norms of the trajectories for an ensemble, so that
+        every trajectory meets the tolerances on its own.
+        """
+        self._combine(self.E, h, self.error)
+        scale = self.scale
+        np.add(self.u, self.y, out=scale)
+        np.abs(scale, out=scale)
+        np.abs(self.u, out=self.tmp)
+        np.maximum(scale, self.tmp, out=scale)
+        scale *= self.rtol
+        scale += self.atol
+        self.error /= scale
+        self.error *= self.error
+        return float(np.sqrt(np.max(np.mean(self.error, axis=0))))
+
+    def step(self, t: float, h: float) -> None:
+        if not self.adaptive:
+            return super().step(t, h)
+
+        t_end = t + h
+        if self.h is None:
+            self.h = h
+        if self.max_step is not None:
+            self.h = min(self.h, self.max_step)
+
+        while t < t_end:
+            h_try = min(self.h, t_end - t)
+            self._stages(t, h_try)
+            self._combine(self.B, h_try, self.y)
+            error_norm = self._error_norm(h_try)
+
+            if error_norm == 0:
+                factor = self.max_factor
+            else:
+                factor = self.safety * error_norm ** (-1 / (self.order + 1))
+            factor = min(self.max_factor, max(self.min_factor, factor))
+
+            if error_norm <= 1:
+                self._accept()
+                t_start = t
+                t = t_end if h_try == t_end - t else t + h_try
+                # Only grow the step if the full suggested step was taken,
+                # otherwise the shortened last substep would shrink it.
+                if h_try == self.h or factor < 1:
+                    self.h = h_try * factor
+                if self._step_taken(t_start, t):
+                    return
+            else:
+                self.nrejected += 1
+                self.h = h_try * factor
+
+            if self.max_step is not None:
+                self.h = min(self.h, self.max_step)
+
+
+class VelocityVerlet(FixedStepIntegrator):
+    """
+    Velocity Verlet (leapfrog) method for separable models.
+
+    Symplectic and second order, so the energy error of a conservative model
+    stays bounded instead of drifting, even with large steps. The model must
+    have structure "separable" and provide position_states and
+    velocity_states (slices into the state) and acceleration(t, q).
+    """
+
+    def __init__(self, model, u0: np.ndarray, **options) -> None:
+        super().__init__(model, u0, **options)
+        if getattr(model, "structure", None) != "separable":
+            raise ValueError(
+                f"{type(self).__name__} needs a separable model, "
+                f"{type(model).__name__} is not."
+            )
+        self.q = self.u[model.position_states]
+        self.v = self.u[model.velocity_states]
+        self.a = np.array(model.acceleration(0.0, self.q), dtype=float)
+        self.nfev += 1
+        # Whether self.a is the acceleration at the current state, which it
+        # is after every step, until the state is changed with reset.
+        self.a_valid = True
+
+    def reset(self) -> None:
+        self.a_valid = False
+
+    def retain(self, mask: np.ndarray) -> None:
+        super().retain(mask)
+        self.q = self.u[self.model.position_states]
+        self.v = self.u[self.model.velocity_states]
+        self.a = self.a[..., mask]
+
+    def _fixed_step(self, t: float, h: float) -> None:
+        if not self.a_valid:
+            self.a[...] = self.model.acceleration(t, self.q)
+            self.nfev += 1
+        self.v += (h / 2) * self.a
+        self.q += h * self.v
+        self.a[...] = self.model.acceleration(t + h, self.q)
+        self.nfev += 1
+        self.v += (h / 2) * self.a
+        self.a_valid = True
+        self.naccepted += 1
+
+
+class ImplicitMidpoint(FixedStepIntegrator):
+    """
+    Implicit midpoint rule in canonical coordinates.
+
+    Symplectic and second order for any Hamiltonian model, separable or not.
+    The model must have structure "hamiltonian" or "separable" and provide
+    to_canonical, from_canonical and canonical_rhs. The implicit equation is
+    solved by fixed point iteration, which converges as long as the step is
+    small compared to the fastest time scale of the model.
+
+    Args.:
+    tol: tolerance of the fixed point iteration.
+    max_iterations: raise RuntimeError if not converged after this many.
+    """
+
+    def __init__(
+        self,
+        model,
+        u0: np.ndarray,
+        tol: float = 1e-12,
+        max_iterations: int = 100,
+        **options,
+    ) -> None:
+        super().__init__(model, u0, **options)
+        if getattr(model, "structure", None) not in ("hamiltonian", "separable"):
+            raise ValueError(
+                f"{type(self).__name__} needs a Hamiltonian model, "
+                f"{type(model).__name__} is not."
+            )
+        self.tol = tol
+        self.max_iterations = max_iterations
+
+    def _fixed_step(self, t: float, h: float) -> None:
+        z = self.model.to_canonical(self.u)
+        z_new = z + h * self.model.canonical_rhs(t, z)
+        self.nfev += 1
+        tol = self.tol * (1 + np.max(np.abs(z)))
+        for _ in range(self.max_iterations):
+            z_mid = 0.5 * (z + z_new)
+            z_next = z + h * self.model.canonical_rhs(t + h / 2, z_mid)
+            self.nfev += 1
+            converged = np.max(np.abs(z_next - z_new)) <= tol
+            z_new = z_next
+            if converged:
+                break
+        else:
+            raise RuntimeError(
+                f"Implicit midpoint iteration did not converge at t={t}, "
+                f"try a smaller step than {h}."
+            )
+        self.u[...] = self.model.from_canonical(z_new)
+        self.naccepted += 1
+
+
+METHODS: Dict[str, Type[Integrator]] = {
+    "RK4": RK4,
+    "DOPRI5": DormandPrince,
+    "Verlet": VelocityVerlet,
+    "ImplicitMidpoint": ImplicitMidpoint,
+}
+
+
+def integrate(
+    model,
+    u0: np.ndarray,
+    t_eval: np.ndarray,
+    method: str = "RK4",
+    out: Optional[np.ndarray] = None,
+    **options,
+) -> np.ndarray:
+    """
+    Integrates an ODE with one of the native integrators.
+
+    The state is advanced from one output time to the next and copied
+    straight into the output array, so no intermediate trajectory is stored.
+
+    Args.:
+    model: callable rhs(t, u), usually an ODEModel.
+    u0: initial state, shape (num_states,) or (num_states, N).
+    t_eval: increasing output times, the first one is the initial time.
+    method: name of the integrator, one of the keys of METHODS.
+    out: optional array of shape u0.shape + (len(t_eval),) to write into.
+    options: passed on to the integrator, e.g. rtol, atol or max_step.
+
+    Returns: the solution array, shape u0.shape + (len(t_eval),).
+    """
+    return METHODS[method](model, u0, **options).integrate(t_eval, out)
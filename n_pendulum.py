@@ -0,0 +1,289 @@
+"""
+A chain of N pendulums, each hanging from the bob of the previous one.
+
+The state is interleaved like the one of DoublePendulum, (theta1, omega1,
+theta2, omega2, ..., thetaN, omegaN), and with N=2 and unit masses the model
+is the DoublePendulum.
+
+With mu[i, j] the total mass hanging at or below link max(i, j), the
+equations of motion are the linear system
+
+    sum_j A[i, j] domega_j/dt = -sum_j S[i, j] omega_j**2 - g mu[i, i] L_i sin(theta_i)
+
+with the mass matrix A[i, j] = mu[i, j] L_i L_j cos(theta_i - theta_j) and
+S[i, j] = mu[i, j] L_i L_j sin(theta_i - theta_j). The matrices of all
+states of an ensemble are assembled at once and solved with one batched
+np.linalg.solve.
+"""
+from pendulum import *
+from pendulum import _chunks, _kinematics_out, _KinematicsResults
+
+
+def _links_last(a: np.ndarray) -> np.ndarray:
+    """Moves the link axis of theta or omega to the end, for the matrices."""
+    return np.moveaxis(a, 0, -1)
+
+
+class NPendulum(ODEModel):
+    structure = "hamiltonian"
+
+    def __init__(self, L=(1.0, 1.0, 1.0), M=None, g=9.81) -> None:
+        """
+        Args.:
+        L: lengths of the rods from the pivot down, one per link.
+        M: masses of the bobs, a number for all of them or one per link.
+        Unit masses by default, as in DoublePendulum.
+        g: gravity.
+        """
+        self.L = np.array(L, dtype=float).reshape(-1)
+        if M is None:
+            M = 1.0
+        self.M = np.broadcast_to(np.asarray(M, dtype=float), self.L.shape).copy()
+        self.g = g
+
+    @property
+    def N(self) -> int:
+        """Number of links."""
+        return len(self.L)
+
+    @property
+    def num_states(self) -> int:
+        return 2 * self.N
+
+    def _coupling(self):
+        """
+        mu[i, j] L_i L_j, and the coefficients g mu[i, i] L_i of the gravity
+        terms.
+        """
+        # Mass at or below each link.
+        below = np.cumsum(self.M[::-1])[::-1]
+        index = np.arange(self.N)
+        mu = below[np.maximum.outer(index, index)]
+        return mu * np.outer(self.L, self.L), self.g * below * self.L
+
+    def _matrices(self, theta: np.ndarray):
+        """
+        The mass matrix A and S (see the module docstring) for the angles
+        theta of shape (..., N), and the gravity terms, shape (..., N).
+        """
+        coupling, gravity = self._coupling()
+        # cos and sin of the differences from those of the angles, which
+        # takes N instead of N**2 evaluations of the trigonometric functions.
+        sin, cos = np.sin(theta), np.cos(theta)
+        A = cos[..., :, None] * cos[..., None, :]
+        A += sin[..., :, None] * sin[..., None, :]
+        A *= coupling
+        S = sin[..., :, None] * cos[..., None, :]
+        S -= cos[..., :, None] * sin[..., None, :]
+        S *= coupling
+        return A, S, gravity * sin
+
+    def __call__(
+        self, t: float, u: np.ndarray, out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Time derivative of the state.
+
+        Args.:
+        t: time.
+        u: thetas and omegas interleaved, shape (2N,) or (2N, num_trajectories).
+        out: optional array to write du_dt into.
+
+        Returns: du_dt, the array out if it was given.
+        """
+        u = np.asarray(u)
+        omega = _links_last(u[1::2])
+        A, S, gravity = self._matrices(_links_last(u[0::2]))
+        forcing = -(S @ (omega**2)[..., None])[..., 0] - gravity
+        domega_dt = np.linalg.solve(A, forcing[..., None])[..., 0]
+
+        if out is None:
+            out = np.empty(u.shape)
+        out[0::2] = u[1::2]
+        out[1::2] = np.moveaxis(domega_dt, -1, 0)
+        return out
+
+    def to_canonical(self, u: np.ndarray) -> np.ndarray:
+        """
+        Canonical coordinates (theta1, p1, ..., thetaN, pN) of the state u,
+        with the conjugate momenta p = A omega.
+        """
+        u = np.asarray(u)
+        A, _, _ = self._matrices(_links_last(u[0::2]))
+        p = (A @ _links_last(u[1::2])[..., None])[..., 0]
+        z = np.array(u, dtype=float)
+        z[1::2] = np.moveaxis(p, -1, 0)
+        return z
+
+    def from_canonical(self, z: np.ndarray) -> np.ndarray:
+        z = np.asarray(z)
+        A, _, _ = self._matrices(_links_last(z[0::2]))
+        omega = np.linalg.solve(A, _links_last(z[1::2])[..., None])[..., 0]
+        u = np.array(z, dtype=float)
+        u[1::2] = np.moveaxis(omega, -1, 0)
+        return u
+
+    def canonical_rhs(self, t: float, z: np.ndarray) -> np.ndarray:
+        """
+        Hamilton's equations for the chain, in the coordinates of
+        to_canonical.
+        """
+        z = np.asarray(z)
+        A, S, gravity = self._matrices(_links_last(z[0::2]))
+        omega = np.linalg.solve(A, _links_last(z[1::2])[..., None])[..., 0]
+        dp_dt = -omega * (S @ omega[..., None])[..., 0] - gravity
+        dz_dt = np.empty(z.shape)
+        dz_dt[0::2] = np.moveaxis(omega, -1, 0)
+        dz_dt[1::2] = np.moveaxis(dp_dt, -1, 0)
+        return dz_dt
+
+    def energy(self, u: np.ndarray) -> np.ndarray:
+        """Total energy, as total_energy of the results."""
+        theta, omega = u[0::2], u[1::2]
+        L = self.L.reshape((-1,) + (1,) * (np.ndim(theta) - 1))
+        velocity_x = np.cumsum(L * np.cos(theta) * omega, axis=0)
+        velocity_y = np.cumsum(L * np.sin(theta) * omega, axis=0)
+        kinetic = 0.5 * np.tensordot(self.M, velocity_x**2 + velocity_y**2, 1)
+        gravity = self.g * np.cumsum(self.M[::-1])[::-1] * self.L
+        return np.tensordot(gravity, 1 - np.cos(theta), 1) + kinetic
+
+    def _create_result(self, time, solution):
+        return NPendulumResults(time, solution, self.L, self.M, self.g)
+
+
+def n_pendulum_kinematics(
+    theta: np.ndarray,
+    omega: np.ndarray,
+    L: np.ndarray,
+    M: np.ndarray,
+    g: float,
+    out: Optional[np.ndarray] = None,
+    chunk_size: int = KINEMATICS_CHUNK_SIZE,
+) -> np.ndarray:
+    """
+    Positions, velocities and energies of a chain of N pendulums, computed
+    chunk by chunk and straight into the output array.
+
+    Args.:
+    theta, omega: arrays of shape (N, ..., num_timepoints), the link first
+    and time along the last axis.
+    L, M: lengths of the rods and masses of the bobs, N each.
+    g: gravity.
+    out: optional array of shape (4 N + 3,) + theta.shape[1:] to write into.
+    chunk_size: number of time points per chunk.
+
+    Return: array with the N rows of x, y, velocity_x and velocity_y of the
+    bobs, then potential_energy, kinetic_energy and total_energy, along the
+    first axis.
+    """
+    N = len(L)
+    shape = np.shape(theta)[1:]
+    out = _kinematics_out(out, (4 * N + 3,) + shape)
+    L = np.asarray(L, dtype=float).reshape((N,) + (1,) * len(shape))
+    M = np.asarray(M, dtype=float)
+    # Potential energy of the bobs at their lowest point, the reference.
+    lowest = g * np.dot(M, np.cumsum(L))
+
+    for chunk in _chunks(shape[-1], chunk_size):
+        th, om = theta[chunk], omega[chunk]
+        x, y, vx, vy = (out[i * N : (i + 1) * N][chunk] for i in range(4))
+        P, K, E = (row[chunk] for row in out[-3:])
+
+        np.sin(th, out=x)
+        x *= L
+        np.cos(th, out=y)
+        y *= -L
+        np.multiply(om, y, out=vx)
+        vx *= -1
+        np.multiply(om, x, out=vy)
+        for row in (x, y, vx, vy):
+            np.cumsum(row, axis=0, out=row)
+
+        np.einsum("k,k...->...", g * M, y, out=P)
+        P += lowest
+        # E is used as scratch space before it gets its final value.
+        np.einsum("k,k...,k...->...", 0.5 * M, vx, vx, out=K)
+        np.einsum("k,k...,k...->...", 0.5 * M, vy, vy, out=E)
+        K += E
+        np.add(P, K, out=E)
+    return out
+
+
+@dataclass
+class NPendulumResults(_KinematicsResults):
+    """
+    Dataclass for storing results of the NPendulum class.
+
+    The quantities of the bobs, e.g. x, have the link along the first axis,
+    so x[-1] is the position of the last bob.
+    """
+
+    time: np.ndarray
+    solution: np.ndarray
+    L: np.ndarray
+    M: np.ndarray
+    g: float
+    cache: bool = field(default=True, repr=False, compare=False)
+    stats: Optional[SolveStats] = field(default=None, repr=False, compare=False)
+    t_events: Optional[List[np.ndarray]] = field(default=None, repr=False)
+    y_events: Optional[List[np.ndarray]] = field(default=None, repr=False)
+
+    def __post_init__(self) -> None:
+        # Lists when the result is loaded with storage.load_result.
+        self.L = np.asarray(self.L, dtype=float)
+        self.M = np.asarray(self.M, dtype=float)
+
+    @property
+    def N(self) -> int:
+        return len(self.L)
+
+    @property
+    def theta(self) -> np.ndarray:
+        """Angles, shape (N, ..., num_timepoints)."""
+        return np.moveaxis(self.solution[..., 0::2, :], -2, 0)
+
+    @property
+    def omega(self) -> np.ndarray:
+        return np.moveaxis(self.solution[..., 1::2, :], -2, 0)
+
+    def kinematics(
+        self, out: Optional[np.ndarray] = None, chunk_size: int = KINEMATICS_CHUNK_SIZE
+    ) -> np.ndarray:
+        """Positions, velocities and energies, see n_pendulum_kinematics."""
+        return n_pendulum_kinematics(
+            self.theta,
+            self.omega,
+            self.L,
+            self.M,
+            self.g,
+            out=out,
+            chunk_size=chunk_size,
+        )
+
+    @property
+    def x(self) -> np.ndarray:
+        return self._rows(slice(self.N))
+
+    @property
+    def y(self) -> np.ndarray:
+        return self._rows(slice(self.N, 2 * self.N))
+
+    @property
+    def velocity_x(self) -> np.ndarray:
+        return self._rows(slice(2 * self.N, 3 * self.N))
+
+    @property
+    def velocity_y(self) -> np.ndarray:
+        return self._rows(slice(3 * self.N, 4 * self.N))
+
+    @property
+    def potential_energy(self) -> np.ndarray:
+        return self._rows(-3)
+
+    @property
+    def kinetic_energy(self) -> np.ndarray:
+        return self._rows(-2)
+
+    @property
+    def total_energy(self) -> np.ndarray:
+        return self._rows(-1)
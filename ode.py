@@ -1,78 +1,1179 @@
 import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
 from typing import NamedTuple
-from scipy.integrate import solve_ivp
 import abc
+import importlib
+from dataclasses import dataclass
+from time import perf_counter
 from typing import Optional, List
-import matplotlib.pyplot as plt
+
+from integrators import METHODS, accepts_out
+
+# Methods of solve_ivp that make use of the Jacobian of the right hand side.
+IMPLICIT_METHODS = ("Radau", "BDF", "LSODA")
+# Method that evaluates ODEModel.analytic_solution instead of integrating.
+ANALYTIC = "analytic"
+# Method used with method=None when there is no analytic solution.
+DEFAULT_METHOD = "RK45"
+# Default tolerances of solve_ivp.
+SOLVE_IVP_RTOL = 1e-3
+SOLVE_IVP_ATOL = 1e-6
 
 
 class InvalidInitialConditionError(RuntimeError):
     pass
 
 
+class _LazyModule:
+    """
+    Stands in for a module that is only imported on first attribute access.
+
+    SciPy and matplotlib take most of the time of importing the models, but
+    are not needed to solve with the native integrators, so they are only
+    loaded when solve_ivp is used or something is plotted.
+    """
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+
+    def __getattr__(self, attribute: str):
+        if attribute == "_name":
+            raise AttributeError(attribute)
+        return getattr(importlib.import_module(self._name), attribute)
+
+
+plt = _LazyModule("matplotlib.pyplot")
+
+
+def _add_optional(a, b):
+    return None if a is None or b is None else a + b
+
+
+@dataclass
+class SolveStats:
+    """
+    Statistics of a solve, or the sum over several solves.
+
+    wall_time is measured around the solver and nfev, njev and nlu are the
+    counts reported by it (for solve_ivp nfev excludes the evaluations for
+    finite difference Jacobians). rhs_calls and rhs_time count every call
+    of the right hand side, and are only recorded with profile=True. Step
+    counts the solver does not report are None, as is rejected_steps for
+    solve_ivp.
+
+    Stats can be added, e.g. sum(stats_list), to aggregate several solves.
+    """
+
+    method: str
+    wall_time: float = 0.0
+    nfev: int = 0
+    njev: int = 0
+    nlu: int = 0
+    accepted_steps: Optional[int] = None
+    rejected_steps: Optional[int] = None
+    rhs_calls: Optional[int] = None
+    rhs_time: Optional[float] = None
+    status: int = 0
+    message: str = ""
+    num_solves: int = 1
+
+    @property
+    def success(self) -> bool:
+        return self.status >= 0
+
+    @property
+    def rhs_fraction(self) -> Optional[float]:
+        """Fraction of the wall time spent in the right hand side."""
+        if self.rhs_time is None or not self.wall_time:
+            return None
+        return self.rhs_time / self.wall_time
+
+    def __add__(self, other: "SolveStats") -> "SolveStats":
+        if not isinstance(other, SolveStats):
+            return NotImplemented
+        # The status and message of the worst solve are kept.
+        worst = self if self.status <= other.status else other
+        return SolveStats(
+            method=self.method if self.method == other.method else "mixed",
+            wall_time=self.wall_time + other.wall_time,
+            nfev=self.nfev + other.nfev,
+            njev=self.njev + other.njev,
+            nlu=self.nlu + other.nlu,
+            accepted_steps=_add_optional(self.accepted_steps, other.accepted_steps),
+            rejected_steps=_add_optional(self.rejected_steps, other.rejected_steps),
+            rhs_calls=_add_optional(self.rhs_calls, other.rhs_calls),
+            rhs_time=_add_optional(self.rhs_time, other.rhs_time),
+            status=worst.status,
+            message=worst.message,
+            num_solves=self.num_solves + other.num_solves,
+        )
+
+    def __radd__(self, other) -> "SolveStats":
+        # Lets sum() start from 0.
+        if other == 0:
+            return self
+        return NotImplemented
+
+
+class _ProfiledModel:
+    """
+    Wraps a model to count and time the calls of its right hand side,
+    including acceleration and canonical_rhs for the symplectic methods.
+    Everything else is looked up on the model.
+    """
+
+    def __init__(self, model) -> None:
+        self.model = model
+        self.model_takes_out = accepts_out(model)
+        self.calls = 0
+        self.time = 0.0
+
+    def _timed(self, function, *args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.time += perf_counter() - start
+            self.calls += 1
+
+    def __call__(self, t, u, out=None):
+        if out is None:
+            return self._timed(self.model, t, u)
+        if self.model_takes_out:
+            return self._timed(self.model, t, u, out=out)
+        out[...] = self._timed(self.model, t, u)
+        return out
+
+    def acceleration(self, t, q):
+        return self._timed(self.model.acceleration, t, q)
+
+    def canonical_rhs(self, t, z):
+        return self._timed(self.model.canonical_rhs, t, z)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+def _attach(result, **values):
+    """
+    Sets optional fields of a result object, such as stats, on a copy for
+    NamedTuple results.
+    """
+    if isinstance(result, tuple):
+        return result._replace(**values)
+    for name, value in values.items():
+        setattr(result, name, value)
+    return result
+
+
+class UniformTimeGrid(NDArrayOperatorsMixin):
+    """
+    The time points t0 + dt * k for k = 0, ..., n - 1, stored as the three
+    numbers instead of an array.
+
+    It can be used like a read only one dimensional array: len, indexing,
+    arithmetic and NumPy functions work, and a slice with a step is again a
+    UniformTimeGrid. Only np.asarray(grid), or functions that need all the
+    values, create the array. Other array attributes and methods, such as
+    copy, max, astype or tolist, are those of that array.
+    """
+
+    ndim = 1
+    dtype = np.dtype(np.float64)
+
+    def __init__(self, t0: float, dt: float, n: int) -> None:
+        self.t0 = float(t0)
+        self.dt = float(dt)
+        self.n = int(n)
+
+    def __repr__(self) -> str:
+        return f"UniformTimeGrid(t0={self.t0!r}, dt={self.dt!r}, n={self.n!r})"
+
+    @property
+    def shape(self) -> tuple:
+        return (self.n,)
+
+    @property
+    def size(self) -> int:
+        return self.n
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        values = self.t0 + self.dt * np.arange(self.n)
+        return values if dtype is None else values.astype(dtype)
+
+    def __iter__(self):
+        return iter(np.asarray(self))
+
+    def __getattr__(self, name: str):
+        # Not for the fields, which are missing while e.g. copy.copy or
+        # pickle rebuild the object.
+        if name.startswith("_") or name in ("t0", "dt", "n"):
+            raise AttributeError(name)
+        return getattr(np.asarray(self), name)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.t0 + self.dt * range(self.n)[index]
+        if isinstance(index, slice):
+            points = range(self.n)[index]
+            return UniformTimeGrid(
+                self.t0 + self.dt * points.start, self.dt * points.step, len(points)
+            )
+        return np.asarray(self)[index]
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = tuple(
+            np.asarray(x) if isinstance(x, UniformTimeGrid) else x for x in inputs
+        )
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+
+def _compact(time, solution, dt: float, dtype, implicit_time: bool):
+    """Time and solution of a solve on the dt grid, stored as asked for."""
+    if dtype is not None:
+        solution = solution.astype(dtype, copy=False)
+    if implicit_time:
+        time = UniformTimeGrid(time[0], dt, len(time))
+    return time, solution
+
+
+def event(function=None, *, terminal: bool = False, direction: float = 0):
+    """
+    Marks a function g(t, u) as an event for solve, which occurs where g
+    changes sign, as for solve_ivp. Can be used as a decorator, with or
+    without arguments.
+
+    Args.:
+    terminal: stop the integration at the first occurrence.
+    direction: only count crossings from negative to positive if > 0, or
+    from positive to negative if < 0.
+    """
+
+    def mark(function):
+        function.terminal = terminal
+        function.direction = direction
+        return function
+
+    return mark if function is None else mark(function)
+
+
+def energy_below(model, threshold: float, terminal: bool = True):
+    """Event where the energy of the model falls below threshold."""
+
+    @event(terminal=terminal, direction=-1)
+    def energy_below_threshold(t, u):
+        return model.energy(u) - threshold
+
+    return energy_below_threshold
+
+
 class ODEModel(abc.ABC):
+    # Structure used by the symplectic integrators in integrators.py:
+    # None, "separable" (position_states, velocity_states and acceleration)
+    # or "hamiltonian" (to_canonical, from_canonical and canonical_rhs).
+    structure: Optional[str] = None
+
     @abc.abstractmethod
-    def __call__(self, t: float, u: np.ndarray) -> np.ndarray:
+    def __call__(
+        self, t: float, u: np.ndarray, out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        The right hand side of the ODE.
+
+        Args.:
+        t: time.
+        u: state, shape (num_states,) or (num_states, N) for an ensemble.
+        out: optional array with the shape of u to write the derivative
+        into, so that the integrators can call the model without allocating.
+        It must not be the same array as u.
+
+        Returns: du_dt, the array out if it was given.
+        """
         pass
 
+    @staticmethod
+    def _pack(out: Optional[np.ndarray], *rows) -> np.ndarray:
+        """Stacks the derivatives of the states, into out if it is given."""
+        if out is None:
+            return np.array(rows)
+        for i, row in enumerate(rows):
+            out[i] = row
+        return out
+
     @property
     def num_states(self) -> int:
         raise NotImplementedError
 
-    def _create_result(self, solution):
-        return ODEResult(time=solution.t, solution=solution.y)
+    @property
+    def parameters(self) -> dict:
+        """The parameters of the model, as keyword arguments to its constructor."""
+        return {name.lstrip("_"): value for name, value in vars(self).items()}
+
+    def jacobian(self, t: float, u: np.ndarray) -> np.ndarray:
+        """
+        Jacobian of the right hand side with respect to the state.
+
+        Models that implement it get it passed to the implicit solvers,
+        which otherwise estimate it with finite differences.
+
+        Args.:
+        t: time.
+        u: state, shape (num_states,) or (num_states, N).
+
+        Returns: array of shape (num_states, num_states) + u.shape[1:].
+        """
+        raise NotImplementedError
+
+    @property
+    def has_jacobian(self) -> bool:
+        return type(self).jacobian is not ODEModel.jacobian
+
+    def _batch_jacobian(self, num_trajectories: int):
+        """
+        Sparse Jacobian of the flattened ensemble used by solve_batch.
+
+        The Jacobian is block diagonal, entry (a, b, i) of the vectorized
+        jacobian sits at row a * N + i and column b * N + i.
+        """
+        a, b, i = np.indices((self.num_states,) * 2 + (num_trajectories,))
+        rows = (a * num_trajectories + i).reshape(-1)
+        cols = (b * num_trajectories + i).reshape(-1)
+        from scipy.sparse import coo_matrix
+
+        size = self.num_states * num_trajectories
+        shape = (self.num_states, num_trajectories)
+
+        def jac(t, y):
+            J = self.jacobian(t, y.reshape(shape))
+            return coo_matrix((J.reshape(-1), (rows, cols)), (size, size)).tocsc()
+
+        return jac
+
+    def energy(self, u: np.ndarray) -> np.ndarray:
+        """
+        Total energy of the state u, shape (num_states,) or (num_states, N),
+        for models where it is defined, e.g. for energy_below.
+        """
+        raise NotImplementedError
+
+    def analytic_solution(
+        self, t: np.ndarray, u0: np.ndarray
+    ) -> Optional[np.ndarray]:
+        """
+        Exact solution on the time points t, for models that have one. It is
+        used by solve with method="analytic", and by default when it exists.
+
+        Args.:
+        t: time points, shape (m,).
+        u0: state at time 0, shape (num_states,) or (num_states, N).
+
+        Returns: array of shape u0.shape + (m,), or None if there is no
+        closed form, e.g. for these parameters.
+        """
+        return None
+
+    def acceleration(self, t: float, q: np.ndarray) -> np.ndarray:
+        """
+        Second time derivative of the positions of a separable model.
+
+        Args.:
+        t: time.
+        q: the position states, u[self.position_states].
+
+        Returns: array with the same shape as q.
+        """
+        raise NotImplementedError
+
+    def to_canonical(self, u: np.ndarray) -> np.ndarray:
+        """Canonical coordinates of the state u. The identity by default."""
+        return u
+
+    def from_canonical(self, z: np.ndarray) -> np.ndarray:
+        """Inverse of to_canonical."""
+        return z
+
+    def canonical_rhs(self, t: float, z: np.ndarray) -> np.ndarray:
+        """Hamilton's equations in canonical coordinates."""
+        return self(t, z)
+
+    def _create_result(self, time: np.ndarray, solution: np.ndarray):
+        return ODEResult(time=time, solution=solution)
+
+    def _solve_ivp(
+        self,
+        u0: np.ndarray,
+        t_eval: Optional[np.ndarray],
+        method: str,
+        options: dict,
+        timespan: Optional[tuple] = None,
+        model=None,
+    ):
+        """
+        Solves the ODE with solve_ivp on the grid t_eval, or returns the
+        accepted steps over timespan if t_eval is None.
+
+        Args:
+        u0: initial state of shape (num_states,), or (num_states, N) for an
+        ensemble, which is flattened so that the right hand side still sees
+        the whole ensemble in a single call. solve_ivp controls the error of
+        the flattened system with one RMS norm, in which a single trajectory
+        only has a weight of 1 / N, so rtol and atol are divided by sqrt(N)
+        for an ensemble. The RMS error of every trajectory then stays within
+        the tolerances, as in a solve of that trajectory alone.
+        model: right hand side to call instead of self, e.g. a
+        _ProfiledModel.
+
+        Returns:
+        the result of solve_ivp, with y reshaped to u0.shape + (len(t),).
+        """
+        from scipy.integrate import solve_ivp
+
+        options = dict(options)
+        model = self if model is None else model
+        if u0.ndim == 1:
+            rhs = model
+            if method in IMPLICIT_METHODS and self.has_jacobian:
+                options.setdefault("jac", self.jacobian)
+        else:
+            shape = u0.shape
+
+            def rhs(t, y):
+                return np.asarray(model(t, y.reshape(shape))).reshape(-1)
+
+            scale = np.sqrt(shape[1])
+            options["rtol"] = np.divide(options.get("rtol", SOLVE_IVP_RTOL), scale)
+            options["atol"] = np.divide(options.get("atol", SOLVE_IVP_ATOL), scale)
+
+            # LSODA only takes dense Jacobians, which do not scale with N.
+            if method in ("Radau", "BDF") and self.has_jacobian:
+                options.setdefault("jac", self._batch_jacobian(shape[1]))
+
+        if t_eval is not None:
+            timespan = (t_eval[0], t_eval[-1])
+        solution = solve_ivp(
+            rhs, timespan, u0.reshape(-1), method=method, t_eval=t_eval, **options
+        )
+        solution.y = solution.y.reshape(u0.shape + (-1,))
+        return solution
+
+    def _run(
+        self,
+        u0: np.ndarray,
+        t_eval: Optional[np.ndarray],
+        method: str,
+        options: dict,
+        profile: bool = False,
+        out: Optional[np.ndarray] = None,
+        timespan: Optional[tuple] = None,
+        events: Optional[list] = None,
+    ):
+        """
+        Solves the ODE with a native integrator on t_eval, or with
+        _solve_ivp, and collects the SolveStats of the solve.
 
-    def solve(self, u0: np.ndarray, T: float, dt: float, method: str = "RK45"):
+        Args:
+        u0: initial state, shape (num_states,) or (num_states, N).
+        profile: count and time the calls of the right hand side.
+        out: optional output array for the native integrators.
+        events: optional list of events, see solve.
+
+        Returns:
+        the time points, the solution of shape u0.shape + (len(time),), the
+        SolveStats, and the lists t_events and y_events of the times and
+        states of every event, which are None without events.
+        """
+        if method in (None, ANALYTIC):
+            solved = self._run_analytic(u0, t_eval, method, options, events)
+            if solved is not None:
+                return solved
+            method = DEFAULT_METHOD
+        model = _ProfiledModel(self) if profile else self
+        stats = SolveStats(method)
+        t_events = y_events = None
+        start = perf_counter()
+        if method in METHODS:
+            integrator = METHODS[method](model, u0, **options)
+            if events:
+                y, t_events, y_events = integrator.integrate_until(t_eval, events, out)
+                time = t_eval[: y.shape[-1]]
+                terminated = any(
+                    getattr(event, "terminal", False) and len(times)
+                    for event, times in zip(events, t_events)
+                )
+                stats.status = 1 if terminated else 0
+            else:
+                time, y = t_eval, integrator.integrate(t_eval, out)
+            stats.nfev = integrator.nfev
+            stats.accepted_steps = integrator.naccepted
+            stats.rejected_steps = integrator.nrejected
+        else:
+            if profile and t_eval is not None:
+                # The step count is only known from the dense output.
+                options = dict(options, dense_output=True)
+            if events:
+                options = dict(options, events=events)
+            solution = self._solve_ivp(u0, t_eval, method, options, timespan, model)
+            time, y = solution.t, solution.y
+            if events:
+                t_events, y_events = solution.t_events, solution.y_events
+            stats.nfev, stats.njev = solution.nfev, solution.njev
+            stats.nlu = solution.nlu
+            stats.status, stats.message = solution.status, solution.message
+            if t_eval is None:
+                stats.accepted_steps = len(time) - 1
+            elif solution.sol is not None:
+                stats.accepted_steps = len(solution.sol.ts) - 1
+        stats.wall_time = perf_counter() - start
+        if profile:
+            stats.rhs_calls, stats.rhs_time = model.calls, model.time
+        return time, y, stats, t_events, y_events
+
+    def _run_analytic(
+        self,
+        u0: np.ndarray,
+        t_eval: Optional[np.ndarray],
+        method: Optional[str],
+        options: dict,
+        events: Optional[list] = None,
+    ):
+        """
+        Evaluates the analytic solution on t_eval, with the return values of
+        _run. With method=None the options are meant for the numerical
+        default, and None is returned to fall back to it whenever the
+        analytic solution does not apply.
+        """
+        if method is None:
+            if events or t_eval is None:
+                return None
+            options = {}
+        elif events:
+            raise ValueError(f"events are not supported with method={ANALYTIC!r}")
+        elif t_eval is None:
+            raise ValueError(f"dense output is not supported with method={ANALYTIC!r}")
+
+        start = perf_counter()
+        y = self.analytic_solution(t_eval, u0, **options)
+        if y is None:
+            if method is None:
+                return None
+            raise ValueError(f"{type(self).__name__} has no analytic solution")
+        stats = SolveStats(
+            ANALYTIC, wall_time=perf_counter() - start, rhs_calls=0, rhs_time=0.0
+        )
+        return t_eval, y, stats, None, None
+
+    def _solve_dense(
+        self,
+        u0: np.ndarray,
+        T: float,
+        dt: float,
+        method: str,
+        options: dict,
+        profile: bool = False,
+    ) -> "DenseResult":
+        """
+        Solves the ODE and keeps an interpolant instead of a fixed grid.
+
+        The nodes of the interpolant are the accepted steps of solve_ivp, or
+        the points of the dt grid for the native integrators, together with
+        the derivatives there, computed in one vectorized call of the model.
+
+        Args:
+        u0: initial state, shape (num_states,) or (num_states, N).
+        """
+        if method in METHODS:
+            t_eval, timespan = np.arange(0, T + dt, dt), None
+        else:
+            t_eval, timespan = None, (0, T)
+        time, y, stats, _, _ = self._run(
+            u0, t_eval, method, options, profile, timespan=timespan
+        )
+        derivative = np.asarray(self(time, y), dtype=float)
+        interpolant = HermiteInterpolant(time, y, derivative)
+        return DenseResult(self, interpolant, T, dt, batch=u0.ndim == 2, stats=stats)
+
+    def solve(
+        self,
+        u0: np.ndarray,
+        T: float,
+        dt: float,
+        method: Optional[str] = None,
+        dense: bool = False,
+        profile: bool = False,
+        events=None,
+        dtype=None,
+        implicit_time: bool = False,
+        **options,
+    ):
+        """
+        Solves the ODE from time 0 to T with output every dt.
+
+        Args:
+        u0: initial condition, shape (num_states,).
+        method: one of the native methods in integrators.METHODS, "analytic"
+        for the analytic_solution of the model, otherwise the method is
+        passed to solve_ivp. By default the analytic solution is used if
+        there is one, and DEFAULT_METHOD otherwise, or with dense or events.
+        dense: return a DenseResult that can be evaluated at any time.
+        profile: also count and time the calls of the right hand side.
+        events: an event function g(t, u), or a list of them, with the
+        optional attributes terminal and direction as for solve_ivp, see
+        also the event decorator. A terminal event stops the solve, and the
+        output ends at the last time point before it. Events are checked
+        after every internal step, so the fixed step methods need a
+        max_step below the time between sign changes when dt is larger.
+        dtype: dtype of the stored solution, e.g. np.float32 to halve its
+        memory. The integration itself is always done in float64. The
+        native methods write every time point straight into the smaller
+        array, while solve_ivp returns the whole float64 solution, which is
+        then converted, so the peak memory is only lower with the native
+        methods, or with solve_stream.
+        implicit_time: store the time points as a UniformTimeGrid instead
+        of an array.
+        options: extra options for the integrator, e.g. rtol or atol.
+
+        Returns:
+        result object with the SolveStats of the solve as its stats, and
+        with events, t_events and y_events with the times and states where
+        every event occurred.
+        """
         if len(u0) == self.num_states:
-            timespan = (0, T)
+            u0 = np.asarray(u0)
+            if callable(events):
+                events = [events]
+            if dense:
+                if events:
+                    raise ValueError("events are not supported with dense=True")
+                return self._solve_dense(u0, T, dt, method, options, profile)
             t_eval = np.arange(0, T + dt, dt)
-            solution = solve_ivp(self, timespan, u0, t_eval=t_eval)
-            return self._create_result(solution)
+            out = None
+            if dtype is not None and method in METHODS:
+                out = np.empty(u0.shape + (len(t_eval),), dtype=dtype)
+            time, solution, stats, t_events, y_events = self._run(
+                u0, t_eval, method, options, profile, out, events=events
+            )
+            time, solution = _compact(time, solution, dt, dtype, implicit_time)
+            result = self._create_result(time, solution)
+            if events:
+                result = _attach(result, t_events=t_events, y_events=y_events)
+            return _attach(result, stats=stats)
         else:
             raise InvalidInitialConditionError
 
+    def _check_batch(self, u0: np.ndarray) -> np.ndarray:
+        u0 = np.asarray(u0)
+        if u0.ndim != 2 or u0.shape[1] != self.num_states:
+            raise InvalidInitialConditionError
+        return u0
+
+    def solve_batch(
+        self,
+        u0: np.ndarray,
+        T: float,
+        dt: float,
+        method: Optional[str] = None,
+        dense: bool = False,
+        profile: bool = False,
+        dtype=None,
+        implicit_time: bool = False,
+        **options,
+    ):
+        """
+        Solves the ODE for an ensemble of initial conditions at once.
+
+        The right hand side is evaluated on the whole ensemble in a single
+        call, with the states along the first axis and the trajectories
+        along the second, so that u[0] is the first state of every
+        trajectory. The adaptive methods take the same steps for the whole
+        ensemble, controlled so that every trajectory meets the tolerances
+        on its own. A trajectory then has the accuracy of a solve of it
+        alone, but the results are not identical, and depend on the other
+        trajectories through the step sizes.
+
+        Args:
+        u0: array of shape (N, num_states), one initial condition per row.
+        T: end time.
+        dt: time step of the output grid.
+        method: as for solve, the analytic solution is evaluated for the
+        whole ensemble at once.
+        dense: return a DenseResult that can be evaluated at any time.
+        profile: also count and time the calls of the right hand side.
+        dtype, implicit_time: storage of the solution and the time points,
+        as for solve.
+        options: extra options for the integrator, e.g. rtol or atol.
+
+        Returns:
+        result object with solution of shape (N, num_states, num_timepoints)
+        and the SolveStats of the solve as its stats.
+        """
+        u0 = self._check_batch(u0)
+        if "events" in options:
+            raise ValueError("events are only supported by solve")
+        if dense:
+            return self._solve_dense(u0.T, T, dt, method, options, profile)
+        t_eval = np.arange(0, T + dt, dt)
+
+        out = None
+        if method in METHODS:
+            # Write straight into the (N, num_states, num_timepoints) layout.
+            out = np.empty(u0.shape + (len(t_eval),), dtype=dtype).transpose(1, 0, 2)
+        time, y, stats, _, _ = self._run(u0.T, t_eval, method, options, profile, out)
+        time, y = _compact(time, y.transpose(1, 0, 2), dt, dtype, implicit_time)
+        return _attach(self._create_result(time, y), stats=stats)
+
+    def solve_stream(
+        self,
+        u0: np.ndarray,
+        T: float,
+        dt: float,
+        chunk_size: int = 10000,
+        method: Optional[str] = None,
+        dtype=None,
+        implicit_time: bool = False,
+        **options,
+    ):
+        """
+        Solves the ODE segment by segment and yields the solution in chunks.
+
+        The time grid is the same as for solve, but at most chunk_size time
+        points are in memory at once, so very long horizons can be processed
+        with constant memory. The state at the end of one segment is the
+        initial condition of the next. The native integrators keep their
+        internal state across segments, while solve_ivp is restarted for
+        every segment.
+
+        Args:
+        u0: initial condition, shape (num_states,), or (N, num_states) to
+        stream an ensemble like solve_batch.
+        T: end time.
+        dt: time step of the output grid.
+        chunk_size: maximal number of time points per chunk.
+        method, dtype, implicit_time, options: as for solve.
+
+        Yields:
+        result objects, like those returned by solve, for consecutive,
+        non-overlapping parts of the time grid.
+        """
+        u0 = np.asarray(u0, dtype=float)
+        batch = u0.ndim == 2
+        if batch:
+            u = self._check_batch(u0).T
+        elif len(u0) == self.num_states:
+            u = u0
+        else:
+            raise InvalidInitialConditionError
+        # Same number of points as np.arange(0, T + dt, dt).
+        num_timepoints = int(np.ceil((T + dt) / dt))
+        analytic_options = None
+        if method in (None, ANALYTIC):
+            # Whether the analytic solution applies, from its value at t=0.
+            analytic_options = options if method == ANALYTIC else {}
+            if self.analytic_solution(np.zeros(1), u, **analytic_options) is None:
+                if method == ANALYTIC:
+                    raise ValueError(f"{type(self).__name__} has no analytic solution")
+                method, analytic_options = DEFAULT_METHOD, None
+        initial = u
+        integrator = METHODS[method](self, u, **options) if method in METHODS else None
+
+        t_previous = None
+        for start in range(0, num_timepoints, chunk_size):
+            time = np.arange(start, min(start + chunk_size, num_timepoints)) * dt
+            if batch:
+                chunk = np.empty(u0.shape + (len(time),), dtype=dtype)
+                y = chunk.transpose(1, 0, 2)
+            else:
+                chunk = y = np.empty(u.shape + (len(time),), dtype=dtype)
+
+            values = None
+            if analytic_options is not None:
+                # Every chunk straight from the initial condition.
+                values = self.analytic_solution(time, initial, **analytic_options)
+                if values is None:
+                    if method == ANALYTIC:
+                        raise ValueError(
+                            f"{type(self).__name__} has no analytic solution"
+                        )
+                    # Continue numerically from the end of the last chunk.
+                    method, analytic_options = DEFAULT_METHOD, None
+            if values is not None:
+                y[...] = values
+                u, t_previous = values[..., -1], time[-1]
+            elif integrator is not None:
+                for k, t in enumerate(time):
+                    if t_previous is not None:
+                        integrator.step(t_previous, t - t_previous)
+                    y[..., k] = integrator.u
+                    t_previous = t
+            else:
+                if t_previous is None:
+                    t_eval = time
+                else:
+                    t_eval = np.concatenate(([t_previous], time))
+                if len(t_eval) == 1:
+                    y[..., 0] = u
+                else:
+                    solved = self._solve_ivp(u, t_eval, method, options).y
+                    y[...] = solved[..., len(t_eval) - len(time) :]
+                    # The next segment starts from the float64 state.
+                    u = solved[..., -1].copy()
+                t_previous = time[-1]
+            if implicit_time:
+                time = UniformTimeGrid(time[0], dt, len(time))
+            yield self._create_result(time, chunk)
+
 
 class ODEResult(NamedTuple):
     time: np.ndarray
     solution: np.ndarray
+    stats: Optional[SolveStats] = None
+    t_events: Optional[List[np.ndarray]] = None
+    y_events: Optional[List[np.ndarray]] = None
 
     @property
     def num_states(self):
-        return self.solution.shape[0]
+        return self.solution.shape[-2]
 
     @property
     def num_timepoints(self):
-        return self.solution.shape[1]
+        return self.solution.shape[-1]
+
+    @property
+    def num_trajectories(self):
+        """Number of trajectories, 1 unless the result comes from solve_batch."""
+        return self.solution.shape[0] if self.solution.ndim == 3 else 1
+
+
+class HermiteInterpolant:
+    """
+    Piecewise cubic Hermite interpolation of a solution.
+
+    Only the states and derivatives at the nodes are stored, two arrays of
+    the size of the solution at the nodes, and the cubic between two nodes
+    is evaluated on demand. The error is of fourth order in the distance
+    between the nodes.
+
+    Args.:
+    time: increasing node times, shape (n,).
+    y, derivative: states and their time derivatives at the nodes, time
+    along the last axis.
+    """
+
+    def __init__(self, time: np.ndarray, y: np.ndarray, derivative: np.ndarray):
+        self.time = time
+        self.y = y
+        self.derivative = derivative
+
+    @property
+    def nbytes(self) -> int:
+        return self.time.nbytes + self.y.nbytes + self.derivative.nbytes
+
+    def __call__(self, times) -> np.ndarray:
+        """The interpolated states at times, time along the last axis."""
+        times = np.asarray(times, dtype=float)
+        t_start, t_end = self.time[0], self.time[-1]
+        # Allow for round off in grids like np.arange(0, T + dt, dt).
+        tol = 1e-9 * max(1.0, abs(t_end - t_start))
+        if np.any(times < t_start - tol) or np.any(times > t_end + tol):
+            raise ValueError(f"Can only interpolate between {t_start} and {t_end}")
+        if len(self.time) == 1:
+            return np.repeat(self.y, times.size, axis=-1).reshape(
+                self.y.shape[:-1] + times.shape
+            )
+        i = np.searchsorted(self.time, times, side="right") - 1
+        i = np.clip(i, 0, len(self.time) - 2)
+        h = self.time[i + 1] - self.time[i]
+        s = (times - self.time[i]) / h
+        s2 = s * s
+        s3 = s2 * s
+        return (
+            (2 * s3 - 3 * s2 + 1) * self.y[..., i]
+            + ((s3 - 2 * s2 + s) * h) * self.derivative[..., i]
+            + (3 * s2 - 2 * s3) * self.y[..., i + 1]
+            + ((s3 - s2) * h) * self.derivative[..., i + 1]
+        )
+
+
+class DenseResult:
+    """
+    Solution that can be evaluated at any time between 0 and T.
+
+    Returned by solve and solve_batch with dense=True. The states are only
+    computed when asked for, with at to get the model's usual result object
+    (so derived quantities such as theta or total_energy of a pendulum are
+    evaluated at those times only), or with resample for a uniform grid.
+    Like an ODEResult it also has time and solution, on the dt grid given to
+    solve, and other attributes are looked up on the result for that grid,
+    which is computed the first time it is needed.
+    """
+
+    def __init__(
+        self,
+        model,
+        interpolant: HermiteInterpolant,
+        T: float,
+        dt: float,
+        batch: bool,
+        stats: Optional[SolveStats] = None,
+    ) -> None:
+        self.model = model
+        self.interpolant = interpolant
+        self.T = T
+        self.dt = dt
+        self.batch = batch
+        self.stats = stats
+        self._result = None
+
+    @property
+    def num_steps(self) -> int:
+        """Number of intervals between stored nodes."""
+        return len(self.interpolant.time) - 1
+
+    def __call__(self, times) -> np.ndarray:
+        """States at the given times, laid out like solve or solve_batch."""
+        y = self.interpolant(times)
+        return y.swapaxes(0, 1) if self.batch else y
+
+    def at(self, times):
+        """The model's result object evaluated at the given times."""
+        times = np.asarray(times, dtype=float)
+        return self.model._create_result(times, self(times))
+
+    def resample(self, dt: float, start: float = 0.0, stop: Optional[float] = None):
+        """The model's result object on a uniform grid from start to stop."""
+        stop = self.T if stop is None else stop
+        return self.at(np.arange(start, stop + dt, dt))
+
+    @property
+    def result(self):
+        """The result object on the dt grid given to solve."""
+        if self._result is None:
+            self._result = self.resample(self.dt)
+        return self._result
+
+    @property
+    def grid(self) -> np.ndarray:
+        """The dt grid given to solve, without evaluating the solution."""
+        return np.arange(0, self.T + self.dt, self.dt)
+
+    @property
+    def time(self) -> np.ndarray:
+        return self.result.time
+
+    @property
+    def solution(self) -> np.ndarray:
+        return self.result.solution
+
+    @property
+    def num_states(self) -> int:
+        return self.model.num_states
+
+    @property
+    def num_timepoints(self) -> int:
+        return len(self.grid)
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.result, name)
+
+
+class cached_quantity:
+    """
+    Decorator for derived quantities of the result classes.
+
+    Works like a property, but the value is computed at most once and kept
+    until one of the fields of the result is replaced, see CachedResults.
+    """
+
+    def __init__(self, function) -> None:
+        self.function = function
+        self.name = function.__name__
+        self.__doc__ = function.__doc__
+
+    def __get__(self, results, owner=None):
+        if results is None:
+            return self
+        if not results.cache:
+            return self.function(results)
+        cached = results.__dict__.setdefault("_cached", {})
+        if self.name not in cached:
+            cached[self.name] = self.function(results)
+        return cached[self.name]
+
+
+class CachedResults:
+    """
+    Mixin for result dataclasses with cached_quantity properties.
+
+    The cached values are thrown away whenever a field, such as solution, is
+    assigned a new value. Changing an array in place is not detected, call
+    clear_cache afterwards. Set the field cache to False to compute every
+    quantity on each access instead, which keeps the memory use down.
+    """
+
+    cache: bool
+
+    def __setattr__(self, name: str, value) -> None:
+        super().__setattr__(name, value)
+        self.clear_cache()
+
+    def clear_cache(self) -> None:
+        self.__dict__.pop("_cached", None)
+
+
+# Plots of more time points than this are decimated by default.
+DECIMATION_THRESHOLD = 10000
+# Number of time points read at once while decimating.
+DECIMATION_CHUNK_SIZE = 2**16
+
+
+def _minmax_buckets(time: np.ndarray, values: np.ndarray, bucket_size: int):
+    """Minimum and maximum, in time order, of every bucket of each row."""
+    m = values.shape[-1]
+    padding = -m % bucket_size
+    if padding:
+        # Repeating the last point does not change the minima and maxima.
+        values = np.concatenate(
+            (values, np.repeat(values[:, -1:], padding, axis=-1)), axis=-1
+        )
+    buckets = values.reshape(len(values), -1, bucket_size)
+    low, high = buckets.argmin(axis=-1), buckets.argmax(axis=-1)
+    offset = np.arange(buckets.shape[1]) * bucket_size
+    index = np.stack(
+        (np.minimum(low, high) + offset, np.maximum(low, high) + offset), axis=-1
+    ).reshape(len(values), -1)
+    index = np.minimum(index, m - 1)
+    return time[index], np.take_along_axis(values, index, axis=-1)
+
+
+def minmax_decimate(
+    time: np.ndarray,
+    values,
+    num_buckets: int,
+    chunk_size: int = DECIMATION_CHUNK_SIZE,
+):
+    """
+    Shape preserving decimation for plotting: the time points are split in
+    num_buckets buckets, and only the minimum and maximum of every bucket
+    are kept, so that a line drawn with one bucket per pixel looks the same
+    as the full line.
+
+    The data is read chunk by chunk, so values can be a memory mapped
+    array, and is only ever sliced.
+
+    Args.:
+    time: array-like of shape (n,).
+    values: array-like of shape (k, n) or (n,), or a function that returns
+    the rows of shape (k, m) for a slice of the time points.
+    num_buckets: number of buckets, e.g. the width of the plot in pixels.
+    chunk_size: number of time points read at once.
+
+    Return: times and values of the kept points, both of shape (k, 2 *
+    num_buckets) at most, or (2 * num_buckets,) for one dimensional values.
+    """
+    n = len(time)
+    bucket_size = max(1, -(-n // num_buckets))
+    chunk_size = max(1, chunk_size // bucket_size) * bucket_size
+    if callable(values):
+        rows, squeeze = values, False
+    else:
+        squeeze = np.ndim(values) == 1
+
+        def rows(chunk):
+            return values[..., chunk]
+
+    times, kept = [], []
+    for start in range(0, n, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        chunk_time = np.asarray(time[chunk])
+        chunk_values = np.atleast_2d(np.asarray(rows(chunk), dtype=float))
+        t, v = _minmax_buckets(chunk_time, chunk_values, bucket_size)
+        times.append(t)
+        kept.append(v)
+    times, kept = np.concatenate(times, axis=-1), np.concatenate(kept, axis=-1)
+    return (times[0], kept[0]) if squeeze else (times, kept)
+
+
+def _plot_width(ax) -> int:
+    """Width of the axes in pixels."""
+    return max(1, int(ax.get_window_extent().width))
+
+
+def _plot_rows(ax, time, values, labels, decimate: Optional[bool]) -> None:
+    """
+    Plots every row of values against time, decimated with minmax_decimate
+    to the pixel width of the axes if decimate is True, or if it is None
+    and there are more than DECIMATION_THRESHOLD time points.
+    """
+    if decimate is None:
+        decimate = len(time) > DECIMATION_THRESHOLD
+    if decimate:
+        time, values = minmax_decimate(time, values, _plot_width(ax))
+    elif callable(values):
+        values = values(slice(None))
+    for i, label in enumerate(labels):
+        t = time[i] if np.ndim(time) == 2 else time
+        ax.plot(t, values[i], label=label)
+
+
+def _finish_plot(fig, filename: Optional[str]) -> None:
+    """Saves the figure to filename if given, otherwise shows it."""
+    if filename:
+        fig.savefig(filename)
+    else:
+        plt.show()
 
 
 def plot_ode_solution(
     results: ODEResult,
     state_labels: Optional[List[str]] = None,
     filename: Optional[str] = None,
+    decimate: Optional[bool] = None,
+    ax=None,
 ) -> None:
     '''
     Makes plot of solution to an ODE. 
 
     Args.:
     results: instance of the ODEResult NamedTuple, contains two numpy arrays.
+    Memory mapped results and DenseResult are read chunk by chunk.
     state_labels: Optional list of the state variables names.
     filename: optional, should be given if you want to save the figure.
+    decimate: draw only the minimum and maximum per pixel, by default if
+    there are more than DECIMATION_THRESHOLD time points.
+    ax: optional matplotlib axes to draw into, instead of a new pyplot
+    figure. The figure of ax is then only saved if filename is given, and
+    never shown.
 
     Return: None, only matplotlib pyplot. 
     '''
-    plt.figure()
-    plt.xlabel("Time")
-    plt.ylabel("ODE solution")
-    plt.grid()
-    if state_labels:
-        for i in range(len(state_labels)):
-            plt.plot(results.time, results.solution[i], label = state_labels[i])
-        plt.legend()
-    else:
-        for i in range(len(results.solution)):
-            plt.plot(results.time, results.solution[i])
+    new_figure = ax is None
+    if new_figure:
+        plt.figure()
+        ax = plt.gca()
+    ax.set_xlabel("Time")
+    ax.set_ylabel("ODE solution")
+    ax.grid(True)
+    if isinstance(results, DenseResult):
+        # Only evaluate the interpolant on the chunks being decimated.
+        time = results.grid
 
-    if filename:
-        plt.savefig(filename)
+        def values(chunk):
+            return results(time[chunk])
+
+        num_states = results.num_states
     else:
-        plt.show()
+        time, values = results.time, results.solution
+        num_states = len(values)
+    labels = state_labels if state_labels else [None] * num_states
+    _plot_rows(ax, time, values, labels, decimate)
+    if state_labels:
+        ax.legend()
+
+    if new_figure:
+        _finish_plot(ax.figure, filename)
+    elif filename:
+        ax.figure.savefig(filename)
@@ -1,62 +1,170 @@
-from dataclasses import dataclass
+import math
+from dataclasses import dataclass, field, replace
 
 from ode import *
+from ode import _finish_plot, _plot_rows
+
+
+# Number of time points handled at once by the kinematics kernels, small
+# enough for the temporaries of one chunk to stay in the CPU cache.
+KINEMATICS_CHUNK_SIZE = 2**14
+
+
+def _chunks(n: int, chunk_size: int):
+    """Slices along the time axis covering n points."""
+    for start in range(0, n, chunk_size):
+        yield (..., slice(start, start + chunk_size))
+
+
+def _kinematics_out(out: Optional[np.ndarray], shape: tuple) -> np.ndarray:
+    if out is None:
+        return np.empty(shape)
+    if out.shape != shape:
+        raise ValueError(f"out must have shape {shape}, not {out.shape}")
+    return out
+
+
+def pendulum_kinematics(
+    theta: np.ndarray,
+    omega: np.ndarray,
+    L: float,
+    g: float,
+    out: Optional[np.ndarray] = None,
+    chunk_size: int = KINEMATICS_CHUNK_SIZE,
+) -> np.ndarray:
+    """
+    Positions, velocities and energies (per unit mass) of a pendulum.
+
+    Everything is computed from the angle and the angular velocity, one
+    chunk of time points at a time and straight into the output array,
+    without temporary arrays.
+
+    Args.:
+    theta, omega: arrays of the same shape, time along the last axis.
+    L, g: length of the rod and gravity.
+    out: optional array of shape (7,) + theta.shape to write into.
+    chunk_size: number of time points per chunk.
+
+    Return: array with x, y, velocity_x, velocity_y, potential_energy,
+    kinetic_energy and total_energy along the first axis.
+    """
+    out = _kinematics_out(out, (7,) + np.shape(theta))
+    for chunk in _chunks(np.shape(theta)[-1], chunk_size):
+        th, om = theta[chunk], omega[chunk]
+        x, y, vx, vy, P, K, E = (row[chunk] for row in out)
+        np.sin(th, out=x)
+        x *= L
+        np.cos(th, out=y)
+        y *= -L
+        np.multiply(om, y, out=vx)
+        vx *= -1
+        np.multiply(om, x, out=vy)
+        np.add(y, L, out=P)
+        P *= g
+        np.multiply(om, om, out=K)
+        K *= 0.5 * L * L
+        np.add(P, K, out=E)
+    return out
+
+
+class _KinematicsResults(CachedResults):
+    """
+    Mixin for the pendulum result classes, whose positions, velocities and
+    energies are rows of the table returned by kinematics.
+    """
+
+    def kinematics(
+        self, out: Optional[np.ndarray] = None, chunk_size: int = KINEMATICS_CHUNK_SIZE
+    ) -> np.ndarray:
+        raise NotImplementedError
+
+    @cached_quantity
+    def _kinematics(self) -> np.ndarray:
+        return self.kinematics()
+
+    def _rows(self, index) -> np.ndarray:
+        """
+        Row or rows of the kinematics table. With cache=False the table is
+        computed for one chunk of time points at a time, and only the rows
+        asked for are kept.
+        """
+        if self.cache:
+            return self._kinematics[index]
+        n = self.solution.shape[-1]
+        rows = None
+        for chunk in _chunks(n, KINEMATICS_CHUNK_SIZE):
+            time, solution = self.time[chunk[-1]], self.solution[chunk]
+            part = replace(self, time=time, solution=solution)
+            values = part.kinematics()[index]
+            if rows is None:
+                rows = np.empty(values.shape[:-1] + (n,))
+            rows[chunk] = values
+        return self.kinematics()[index] if rows is None else rows
 
 
 @dataclass
-class PendulumResults:
+class PendulumResults(_KinematicsResults):
     time: np.ndarray
     solution: np.ndarray
     L: float
     g: float
+    cache: bool = field(default=True, repr=False, compare=False)
+    stats: Optional[SolveStats] = field(default=None, repr=False, compare=False)
+    t_events: Optional[List[np.ndarray]] = field(default=None, repr=False)
+    y_events: Optional[List[np.ndarray]] = field(default=None, repr=False)
 
     @property
     def theta(self) -> np.ndarray:
-        return self.solution[0]
+        return self.solution[..., 0, :]
 
     @property
     def omega(self) -> np.ndarray:
-        return self.solution[1]
+        return self.solution[..., 1, :]
+
+    def kinematics(
+        self, out: Optional[np.ndarray] = None, chunk_size: int = KINEMATICS_CHUNK_SIZE
+    ) -> np.ndarray:
+        """
+        Positions, velocities and energies, see pendulum_kinematics.
+        """
+        return pendulum_kinematics(
+            self.theta, self.omega, self.L, self.g, out=out, chunk_size=chunk_size
+        )
 
     @property
     def x(self) -> np.ndarray:
-        x = self.L * np.sin(self.theta)
-        return x
+        return self._rows(0)
 
     @property
     def y(self) -> np.ndarray:
-        y = -self.L * np.cos(self.theta)
-        return y
-
-    @property
-    def potential_energy(self) -> np.ndarray:
-        P = self.g * (self.y + self.L)
-        return P
+        return self._rows(1)
 
     @property
     def velocity_x(self) -> np.ndarray:
-        vx = np.gradient(self.x, self.time)
-        return vx
+        return self._rows(2)
 
     @property
     def velocity_y(self) -> np.ndarray:
-        vy = np.gradient(self.y, self.time)
-        return vy
+        return self._rows(3)
+
+    @property
+    def potential_energy(self) -> np.ndarray:
+        return self._rows(4)
 
     @property
     def kinetic_energy(self) -> np.ndarray:
-        vx = self.velocity_x
-        vy = self.velocity_y
-        K = (1 / 2) * (vx * vx + vy * vy)
-        return K
+        return self._rows(5)
 
     @property
     def total_energy(self) -> np.ndarray:
-        T = self.potential_energy + self.kinetic_energy
-        return T
+        return self._rows(6)
 
 
 class Pendulum(ODEModel):
+    structure = "separable"
+    position_states = slice(0, 1)
+    velocity_states = slice(1, 2)
+
     def __init__(self, M=1, L=1, g=9.81) -> None:
         self.g = g  # gravity [m^2/s]
         self.L = L  # length of rod [m]
@@ -66,12 +174,15 @@ class Pendulum(ODEModel):
     def num_states(self) -> int:
         return 2
 
-    def __call__(self, t: float, u: np.ndarray) -> np.ndarray:
+    def __call__(
+        self, t: float, u: np.ndarray, out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
         """
         Finds time derivative of position and angular velocity of pendulum.
 
         Input:
         u: numpy array, first index as theta (position), second index as omega (angular velocity)
+        out: optional array to write du_dt into.
 
         Returns:
         du_dt: time derivative of u.
@@ -79,55 +190,193 @@ class Pendulum(ODEModel):
         theta = u[0]
         omega = u[1]
 
-        theta_dt = omega
-        omega_dt = -(self.g / self.L) * np.sin(theta)
+        if getattr(u, "ndim", 1) == 1:
+            # A single state: scalar math is much cheaper than NumPy calls.
+            return self._pack(out, omega, -(self.g / self.L) * math.sin(theta))
 
-        du_dt = np.array([theta_dt, omega_dt])
-        return du_dt
+        if out is None:
+            out = np.empty(np.shape(u))
+        out[0] = omega
+        np.sin(theta, out=out[1])
+        out[1] *= -(self.g / self.L)
+        return out
 
-    def _create_result(self, solution) -> PendulumResults:
-        return PendulumResults(solution.t, solution.y, self.L, self.g)
+    def jacobian(self, t: float, u: np.ndarray) -> np.ndarray:
+        """
+        Jacobian of the right hand side with respect to (theta, omega).
+
+        Input:
+        u: numpy array with theta and omega, shape (2,) or (2, N).
+
+        Returns:
+        J: array of shape (2, 2) or (2, 2, N).
+        """
+        theta = np.asarray(u[0])
+        J = np.zeros((2, 2) + theta.shape)
+        J[0, 1] = 1
+        J[1, 0] = -(self.g / self.L) * np.cos(theta)
+        return J
+
+    def acceleration(self, t: float, q: np.ndarray) -> np.ndarray:
+        return -(self.g / self.L) * np.sin(q)
+
+    def energy(self, u: np.ndarray) -> np.ndarray:
+        """Total energy per unit mass, as total_energy of the results."""
+        theta, omega = u[0], u[1]
+        return self.g * self.L * (1 - np.cos(theta)) + 0.5 * (self.L * omega) ** 2
+
+    def analytic_solution(
+        self, t: np.ndarray, u0: np.ndarray, small_angle: bool = False
+    ) -> Optional[np.ndarray]:
+        """
+        Exact solution in Jacobi elliptic functions, for a swinging as well
+        as for a rotating pendulum, see ODEModel.analytic_solution. None on
+        the separatrix between the two, where the pendulum creeps up to the
+        top, e.g. from u0 = (pi, 0), so that it is integrated numerically.
+
+        With small_angle=True it is instead the solution of the linearized
+        equation, with sin(theta) replaced by theta, which is only accurate
+        for small amplitudes.
+        """
+        t = np.asarray(t, dtype=float)
+        theta0 = np.asarray(u0[0], dtype=float)[..., None]
+        omega0 = np.asarray(u0[1], dtype=float)[..., None]
+        frequency = np.sqrt(self.g / self.L)
+
+        if small_angle:
+            cos, sin = np.cos(frequency * t), np.sin(frequency * t)
+            theta = theta0 * cos + omega0 / frequency * sin
+            omega = omega0 * cos - theta0 * frequency * sin
+            return np.array([theta, omega])
+
+        from scipy.special import ellipj, ellipk, ellipkinc
+
+        # Whole turns are added back at the end, the rest is in [-pi, pi].
+        turns = np.round(theta0 / (2 * np.pi))
+        theta0 = theta0 - 2 * np.pi * turns
+        # k**2 = sin(theta_max / 2)**2, above 1 the pendulum goes round.
+        k2 = np.sin(theta0 / 2) ** 2 + (omega0 / (2 * frequency)) ** 2
+        if np.any(np.isclose(k2, 1.0)):
+            # On or next to the separatrix, where the period diverges and the
+            # elliptic functions lose their accuracy.
+            return None
+        sign = np.where(omega0 < 0, -1.0, 1.0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Swinging: sin(theta / 2) = k sn(frequency t + phase, k**2).
+            m = np.minimum(k2, 1.0)
+            k = np.sqrt(m)
+            s = np.clip(np.where(k > 0, np.sin(theta0 / 2) / k, 0.0), -1, 1)
+            phase = ellipkinc(np.arcsin(s), m)
+            # On the way back, where cn < 0.
+            phase = np.where(omega0 < 0, 2 * ellipk(m) - phase, phase)
+            sn, cn, _, _ = ellipj(frequency * t + phase, m)
+            swinging = (2 * np.arcsin(k * sn), 2 * k * frequency * cn)
+
+            # Rotating: theta / 2 = sign am(k frequency t + phase, 1 / k**2).
+            k = np.sqrt(np.maximum(k2, 1.0))
+            phase = ellipkinc(sign * theta0 / 2, 1 / k**2)
+            _, _, dn, am = ellipj(k * frequency * t + phase, 1 / k**2)
+            rotating = (2 * sign * am, 2 * sign * k * frequency * dn)
+
+        going_round = k2 >= 1
+        theta = np.where(going_round, rotating[0], swinging[0])
+        omega = np.where(going_round, rotating[1], swinging[1])
+        solution = np.array([theta + 2 * np.pi * turns, omega])
+        if not np.all(np.isfinite(solution)):
+            return None
+        return solution
+
+    def _create_result(self, time, solution) -> PendulumResults:
+        return PendulumResults(time, solution, self.L, self.g)
+
+
+def theta_crossing(
+    value: float = 0.0, direction: float = 0, terminal: bool = False, state: int = 0
+):
+    """
+    Event where an angle, by default theta of a Pendulum, crosses value.
+    Use state=2 for theta2 of a DoublePendulum.
+    """
+
+    @event(terminal=terminal, direction=direction)
+    def theta_crosses(t, u):
+        return u[state] - value
+
+    return theta_crosses
 
 
 def exercise_2b():
     """
     Making an instance of the class Pendulum,
-    and solving the ODE.
+    and solving the ODE numerically, with RK45 rather than the exact
+    solution.
     """
     model = Pendulum(M=1)
     u0 = np.array([np.pi / 6, 0.35])
     T = 10.0
     dt = 0.01
 
-    result = model.solve(u0, T, dt)
+    result = model.solve(u0, T, dt, method="RK45")
     plot_ode_solution(
         results=result, state_labels=["theta", "omega"], filename="exercise_2b.png"
     )
 
 
-def plot_energy(results: PendulumResults, filename: Optional[str] = None) -> None:
+def plot_energy(
+    results: PendulumResults,
+    filename: Optional[str] = None,
+    decimate: Optional[bool] = None,
+    ax=None,
+) -> None:
     """
     Function that plots kinetic, potential and total energy of a pendulum.
 
     Args:
-    results: object of PendulumResults
+    results: object of PendulumResults or DoublePendulumResults, or a
+    DenseResult of one of the pendulums.
     filename: optional filename for saving plot as file.
+    decimate: draw only the minimum and maximum per pixel, by default if
+    there are more than DECIMATION_THRESHOLD time points. The energies are
+    then computed chunk by chunk, so memory mapped and dense results are
+    never evaluated all at once.
+    ax: optional matplotlib axes to draw into, instead of a new pyplot
+    figure. The figure of ax is then only saved if filename is given, and
+    never shown.
     """
 
-    plt.figure()
-    plt.xlabel("Time")
-    plt.ylabel("Energy")
-    plt.grid()
-
-    plt.plot(results.time, results.potential_energy, label="Potential energy")
-    plt.plot(results.time, results.kinetic_energy, label="Kinetic energy")
-    plt.plot(results.time, results.total_energy, label="Total energy")
-    plt.legend()
-
-    if filename:
-        plt.savefig(filename)
-    else:
-        plt.show()
+    new_figure = ax is None
+    if new_figure:
+        plt.figure()
+        ax = plt.gca()
+    ax.set_xlabel("Time")
+    ax.set_ylabel("Energy")
+    ax.grid(True)
+
+    dense = isinstance(results, DenseResult)
+    time = results.grid if dense else results.time
+
+    def energies(chunk):
+        if dense:
+            part = results.at(time[chunk])
+        else:
+            part = replace(
+                results,
+                time=time[chunk],
+                solution=results.solution[..., chunk],
+                cache=False,
+            )
+        # The kinematics tables end with potential, kinetic and total energy.
+        return part.kinematics()[-3:]
+
+    labels = ["Potential energy", "Kinetic energy", "Total energy"]
+    _plot_rows(ax, time, energies, labels, decimate)
+    ax.legend()
+
+    if new_figure:
+        _finish_plot(ax.figure, filename)
+    elif filename:
+        ax.figure.savefig(filename)
 
 
 def exercise_2g():
@@ -139,33 +388,57 @@ def exercise_2g():
     dt = 0.01
 
     model = Pendulum()
-    solved_model = model.solve(u0, T, dt)
+    solved_model = model.solve(u0, T, dt, method="RK45")
     plot_energy(solved_model, filename="energy_single.png")
 
 
 class DampenedPendulum(Pendulum):
+    # Damping breaks the conservation of energy.
+    structure = None
+
     def __init__(self, B: float, M=1, L=1, g=9.81) -> None:
         super().__init__(M, L, g)
         self.B = B
 
-    def __call__(self, t: float, u: np.ndarray) -> np.ndarray:
+    def __call__(
+        self, t: float, u: np.ndarray, out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
         """
         Finds time derivative of position and angular velocity of pendulum.
 
         Input:
         u: numpy array, first index as theta (position), second index as omega (angular velocity)
+        out: optional array to write du_dt into.
 
         Returns:
         du_dt: time derivative of u.
         """
-        theta_dt = super().__call__(t, u)[0]
-
         theta = u[0]
         omega = u[1]
-        omega_dt = -(self.g / self.L) * np.sin(theta) - self.B * omega
 
-        du_dt = np.array([theta_dt, omega_dt])
-        return du_dt
+        if getattr(u, "ndim", 1) == 1:
+            omega_dt = -(self.g / self.L) * math.sin(theta) - self.B * omega
+            return self._pack(out, omega, omega_dt)
+
+        out = super().__call__(t, u, out)
+        # out[0] is used as scratch space for the damping term.
+        np.multiply(omega, self.B, out=out[0])
+        out[1] -= out[0]
+        out[0] = omega
+        return out
+
+    def jacobian(self, t: float, u: np.ndarray) -> np.ndarray:
+        J = super().jacobian(t, u)
+        J[1, 1] = -self.B
+        return J
+
+    def analytic_solution(
+        self, t: np.ndarray, u0: np.ndarray, small_angle: bool = False
+    ) -> Optional[np.ndarray]:
+        """The solution of Pendulum without damping, otherwise None."""
+        if self.B != 0:
+            return None
+        return super().analytic_solution(t, u0, small_angle)
 
 
 def exercise_2h():
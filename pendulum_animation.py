@@ -0,0 +1,230 @@
+"""
+Animations of the double pendulum, rendered off screen and streamed frame
+by frame to ffmpeg.
+
+Only the rods, the bobs and the trail are redrawn for every frame, on top
+of a copy of the static background (axes and grid), and every frame is
+written to the encoder as soon as it is drawn, so memory use does not grow
+with the length of the animation.
+"""
+import subprocess
+import tempfile
+from dataclasses import replace
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from ode import DenseResult
+from double_pendulum import DoublePendulumResults
+
+
+class RingBuffer:
+    """The last capacity points of a curve, in a fixed size array."""
+
+    def __init__(self, capacity: int) -> None:
+        self.points = np.empty((capacity, 2))
+        self.capacity = capacity
+        self.size = 0
+        self.start = 0
+
+    def append(self, x: float, y: float) -> None:
+        end = (self.start + self.size) % self.capacity
+        self.points[end] = x, y
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def ordered(self) -> Tuple[np.ndarray, np.ndarray]:
+        """x and y of the stored points, oldest first."""
+        index = (self.start + np.arange(self.size)) % self.capacity
+        points = self.points[index]
+        return points[:, 0], points[:, 1]
+
+
+def resample(results, fps: float, speed: float = 1.0) -> DoublePendulumResults:
+    """
+    The results at the frame times of a video with fps frames per second,
+    where speed seconds of the simulation pass per second of video. The
+    angles are interpolated linearly, or evaluated on the interpolant of a
+    DenseResult, so the positions are only computed for the frames.
+    """
+    if isinstance(results, DenseResult):
+        start, stop = 0.0, results.T
+    else:
+        start, stop = results.time[0], results.time[-1]
+    frame_dt = speed / fps
+    times = start + frame_dt * np.arange(int(np.floor((stop - start) / frame_dt)) + 1)
+    if isinstance(results, DenseResult):
+        return results.at(times)
+    solution = np.array(
+        [np.interp(times, results.time, state) for state in results.solution]
+    )
+    return replace(results, time=times, solution=solution, stats=None)
+
+
+class DoublePendulumAnimation:
+    """
+    Renderer of double pendulum animations.
+
+    Args.:
+    results: DoublePendulumResults of a single trajectory, or a DenseResult
+    of a DoublePendulum.
+    fps: frames per second of the video. The trajectory is resampled to
+    the frame times instead of drawing every time step.
+    speed: seconds of simulated time per second of video.
+    trail: number of frames the path of the second bob is shown for, 0 for
+    no trail.
+    figsize, dpi: size of the frames, figsize * dpi pixels.
+    """
+
+    def __init__(
+        self,
+        results,
+        fps: float = 30.0,
+        speed: float = 1.0,
+        trail: int = 0,
+        figsize: Tuple[float, float] = (4.0, 4.0),
+        dpi: int = 100,
+    ) -> None:
+        self.fps = fps
+        self.frames_results = resample(results, fps, speed)
+        self.trail = trail
+
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        ax = self.figure.add_subplot()
+        self.ax = ax
+        length = 1.1 * (self.frames_results.L1 + self.frames_results.L2)
+        ax.set_xlim(-length, length)
+        ax.set_ylim(-length, length)
+        ax.set_aspect("equal")
+        ax.grid()
+
+        # Animated artists are left out of canvas.draw, so that the
+        # background can be copied without them.
+        (self.trail_line,) = ax.plot([], [], "-", lw=1, alpha=0.5, animated=True)
+        (self.rods,) = ax.plot([], [], "-", color="k", lw=2, animated=True)
+        (self.bobs,) = ax.plot([], [], "o", color="tab:red", ms=8, animated=True)
+        self.artists = [self.trail_line, self.rods, self.bobs]
+
+    @property
+    def num_frames(self) -> int:
+        return len(self.frames_results.time)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Width and height of the frames in pixels."""
+        return self.canvas.get_width_height()
+
+    def frames(self) -> Iterator[np.ndarray]:
+        """
+        Draws the frames one after the other.
+
+        Yields: the frame as an RGBA array of shape (height, width, 4), a view
+        of the canvas that is overwritten by the next frame.
+        """
+        self.canvas.draw()
+        background = self.canvas.copy_from_bbox(self.figure.bbox)
+        trail = RingBuffer(self.trail) if self.trail > 0 else None
+        results = self.frames_results
+        x1, y1, x2, y2 = results.x1, results.y1, results.x2, results.y2
+
+        for k in range(self.num_frames):
+            self.canvas.restore_region(background)
+            self.rods.set_data([0, x1[k], x2[k]], [0, y1[k], y2[k]])
+            self.bobs.set_data([x1[k], x2[k]], [y1[k], y2[k]])
+            if trail is not None:
+                trail.append(x2[k], y2[k])
+                self.trail_line.set_data(*trail.ordered())
+            for artist in self.artists:
+                self.ax.draw_artist(artist)
+            yield np.asarray(self.canvas.buffer_rgba())
+
+    def save(
+        self,
+        filename: str,
+        codec: str = "libx264",
+        ffmpeg: str = "ffmpeg",
+        extra_args: Optional[list] = None,
+    ) -> None:
+        """
+        Encodes the animation with ffmpeg, which reads the raw frames from a
+        pipe, so that no frame is kept after it has been written.
+
+        Args.:
+        filename: output video file, e.g. animation.mp4.
+        codec: video codec for ffmpeg.
+        ffmpeg: path of the ffmpeg executable.
+        extra_args: more ffmpeg output options.
+        """
+        width, height = self.size
+        command = [
+            ffmpeg,
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "rgba",
+            "-s",
+            f"{width}x{height}",
+            "-r",
+            str(self.fps),
+            "-i",
+            "-",
+            "-an",
+            "-vcodec",
+            codec,
+            # Most codecs need even frame sizes.
+            "-vf",
+            "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-pix_fmt",
+            "yuv420p",
+            *(extra_args or []),
+            str(filename),
+        ]
+        # A file rather than a pipe, which ffmpeg could fill up and block on
+        # while frames are written to it.
+        with tempfile.TemporaryFile() as errors:
+            try:
+                process = subprocess.Popen(
+                    command, stdin=subprocess.PIPE, stderr=errors
+                )
+            except FileNotFoundError as error:
+                raise RuntimeError(
+                    f"{ffmpeg} was not found, it is needed to write videos."
+                ) from error
+            broken_pipe = False
+            try:
+                for frame in self.frames():
+                    process.stdin.write(frame.data)
+            except BrokenPipeError:
+                # ffmpeg exited early, reported below with its output.
+                broken_pipe = True
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    broken_pipe = True
+                status = process.wait()
+            if status != 0 or broken_pipe:
+                errors.seek(0)
+                output = errors.read().decode(errors="replace").strip()
+                message = f"{ffmpeg} exited with status {status}"
+                if broken_pipe:
+                    message += " before all frames were written"
+                raise RuntimeError(f"{message}: {output}")
+
+
+def animate_double_pendulum(results, filename: str, **options) -> None:
+    """Writes an animation of the results to a video, see DoublePendulumAnimation."""
+    save_options = {
+        name: options.pop(name)
+        for name in ("codec", "ffmpeg", "extra_args")
+        if name in options
+    }
+    DoublePendulumAnimation(results, **options).save(filename, **save_options)
@@ -0,0 +1,273 @@
+"""
+Summaries of solutions that are updated chunk by chunk, so that they can be
+computed during a streaming solve without storing the trajectory.
+
+A reducer gets consecutive, non-overlapping chunks of the time grid with
+update(time, solution), where solution has the layout of solve, shape
+(num_states, m), or of solve_batch, shape (N, num_states, m), and returns
+its summary from result(), with one value per trajectory for a batch.
+"""
+import abc
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+
+class Reducer(abc.ABC):
+    @abc.abstractmethod
+    def update(self, time: np.ndarray, solution: np.ndarray) -> None:
+        """Adds the next chunk of the solution."""
+
+    @abc.abstractmethod
+    def result(self):
+        """The summary of all chunks so far."""
+
+
+class _Crossings(Reducer):
+    """
+    Base class for reducers that look for upward crossings of zero of one
+    state, linearly interpolated between the time points. The last time
+    point of every chunk is kept to find crossings between chunks.
+
+    Args.:
+    state: index of the state.
+    wrap: treat the state as an angle, so that crossings of any multiple
+    of 2 pi count and the jumps between -pi and pi do not.
+    """
+
+    def __init__(self, state: int = 0, wrap: bool = False) -> None:
+        self.state = state
+        self.wrap = wrap
+        self._last = None
+
+    def _crossings(self, time: np.ndarray, solution: np.ndarray):
+        """
+        Returns: the times, the solution with the previous time point in
+        front, the mask of the intervals with a crossing and the fractions
+        of those intervals where the crossings are.
+        """
+        if self._last is not None:
+            time = np.concatenate(([self._last[0]], time))
+            solution = np.concatenate((self._last[1], solution), axis=-1)
+        self._last = (time[-1], solution[..., -1:].copy())
+
+        value = solution[..., self.state, :]
+        if self.wrap:
+            value = np.mod(value + np.pi, 2 * np.pi) - np.pi
+        before, after = value[..., :-1], value[..., 1:]
+        mask = (before < 0) & (after >= 0)
+        if self.wrap:
+            mask &= after - before < np.pi
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fraction = np.where(mask, -before / (after - before), 0.0)
+        return time, solution, mask, fraction
+
+
+class MaxAbsolute(Reducer):
+    """Largest absolute value of one state, e.g. max |theta| with state=0."""
+
+    def __init__(self, state: int = 0) -> None:
+        self.state = state
+        self.value = None
+
+    def update(self, time: np.ndarray, solution: np.ndarray) -> None:
+        chunk_max = np.max(np.abs(solution[..., self.state, :]), axis=-1)
+        if self.value is None:
+            self.value = chunk_max
+        else:
+            self.value = np.maximum(self.value, chunk_max)
+
+    def result(self):
+        return self.value
+
+
+class EnergySummary(NamedTuple):
+    mean: np.ndarray
+    min: np.ndarray
+    max: np.ndarray
+    # Energy at the last time point minus the initial energy.
+    drift: np.ndarray
+    # Largest deviation from the initial energy, relative to it.
+    max_relative_deviation: np.ndarray
+
+
+class EnergyStatistics(Reducer):
+    """
+    Mean, minimum, maximum and drift of the total energy, given by
+    model.energy.
+    """
+
+    def __init__(self, model) -> None:
+        self.model = model
+        self.count = 0
+        self.sum = self.min = self.max = None
+        self.initial = self.final = self.max_deviation = None
+
+    def update(self, time: np.ndarray, solution: np.ndarray) -> None:
+        energy = self.model.energy(np.moveaxis(solution, -2, 0))
+        if self.initial is None:
+            self.initial = energy[..., 0]
+            self.sum = np.zeros_like(self.initial)
+            self.min = np.full_like(self.initial, np.inf)
+            self.max = np.full_like(self.initial, -np.inf)
+            self.max_deviation = np.zeros_like(self.initial)
+        self.count += energy.shape[-1]
+        self.sum = self.sum + energy.sum(axis=-1)
+        self.min = np.minimum(self.min, energy.min(axis=-1))
+        self.max = np.maximum(self.max, energy.max(axis=-1))
+        deviation = np.abs(energy - self.initial[..., None]).max(axis=-1)
+        self.max_deviation = np.maximum(self.max_deviation, deviation)
+        self.final = energy[..., -1]
+
+    def result(self) -> EnergySummary:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            relative = self.max_deviation / np.abs(self.initial)
+        return EnergySummary(
+            mean=self.sum / self.count,
+            min=self.min,
+            max=self.max,
+            drift=self.final - self.initial,
+            max_relative_deviation=relative,
+        )
+
+
+class ZeroCrossingPeriod(_Crossings):
+    """
+    Estimate of the period of an oscillation from the upward zero crossings
+    of one state, e.g. theta of a Pendulum. Only the number of crossings
+    and the first and last crossing time are kept.
+
+    result() is the mean time between crossings, nan with fewer than two.
+    """
+
+    def __init__(self, state: int = 0, wrap: bool = False) -> None:
+        super().__init__(state, wrap)
+        self.count = 0
+        self.first = None
+        self.last = None
+
+    def update(self, time: np.ndarray, solution: np.ndarray) -> None:
+        time, _, mask, fraction = self._crossings(time, solution)
+        crossing_time = time[:-1] + fraction * np.diff(time)
+        first = np.where(mask, crossing_time, np.inf).min(axis=-1)
+        last = np.where(mask, crossing_time, -np.inf).max(axis=-1)
+        if self.first is None:
+            self.first, self.last = first, last
+        else:
+            self.first = np.where(np.isfinite(self.first), self.first, first)
+            self.last = np.where(np.isfinite(last), last, self.last)
+        self.count = self.count + mask.sum(axis=-1)
+
+    def result(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            period = (self.last - self.first) / (self.count - 1)
+        return np.where(self.count >= 2, period, np.nan)
+
+
+class Section(NamedTuple):
+    time: np.ndarray
+    # Shape (n, len(states)), the interpolated states at the crossings.
+    points: np.ndarray
+    # Index of the trajectory of every point for a batch, otherwise None.
+    trajectory: Optional[np.ndarray]
+
+
+class PoincareSection(_Crossings):
+    """
+    Poincaré section: the given states, linearly interpolated, wherever
+    section_state crosses zero upwards. The default is (theta1, omega1) at
+    the crossings of theta2 = 0 (modulo 2 pi) of a DoublePendulum. Only the
+    points of the section are stored.
+    """
+
+    def __init__(
+        self,
+        section_state: int = 2,
+        states: Sequence[int] = (0, 1),
+        wrap: bool = True,
+    ) -> None:
+        super().__init__(section_state, wrap)
+        self.states = list(states)
+        self._times: List[np.ndarray] = []
+        self._points: List[np.ndarray] = []
+        self._trajectories: List[np.ndarray] = []
+        self._batch = False
+
+    def update(self, time: np.ndarray, solution: np.ndarray) -> None:
+        self._batch = solution.ndim == 3
+        time, solution, mask, fraction = self._crossings(time, solution)
+        index = np.nonzero(mask)
+        interval = index[-1]
+        s = fraction[index]
+        # Time points along the second last axis, selected states last.
+        values = np.moveaxis(solution[..., self.states, :], -2, -1)
+        before = values[index[:-1] + (interval,)]
+        after = values[index[:-1] + (interval + 1,)]
+        dt = time[interval + 1] - time[interval]
+        self._times.append(time[interval] + s * dt)
+        self._points.append(before + s[:, None] * (after - before))
+        if self._batch:
+            self._trajectories.append(index[0])
+
+    def result(self) -> Section:
+        if not self._times:
+            return Section(np.empty(0), np.empty((0, len(self.states))), None)
+        return Section(
+            time=np.concatenate(self._times),
+            points=np.concatenate(self._points),
+            trajectory=np.concatenate(self._trajectories) if self._batch else None,
+        )
+
+
+def run_reducers(chunks: Iterable, reducers: Sequence[Reducer]) -> list:
+    """
+    Feeds result chunks, e.g. from ODEModel.solve_stream, to the reducers.
+
+    Returns: the results of the reducers, in the same order.
+    """
+    for chunk in chunks:
+        for reducer in reducers:
+            reducer.update(chunk.time, chunk.solution)
+    return [reducer.result() for reducer in reducers]
+
+
+def reduce_solve(
+    model,
+    u0: np.ndarray,
+    T: float,
+    dt: float,
+    reducers: Sequence[Reducer],
+    chunk_size: int = 1000,
+    method: Optional[str] = None,
+    **options,
+) -> list:
+    """
+    Solves the model with solve_stream and returns the results of the
+    reducers, so that only chunk_size time points are in memory at a time.
+    """
+    chunks = model.solve_stream(u0, T, dt, chunk_size, method, **options)
+    return run_reducers(chunks, reducers)
+
+
+class _ResultChunk(NamedTuple):
+    time: np.ndarray
+    solution: np.ndarray
+
+
+def reduce_result(
+    result, reducers: Sequence[Reducer], chunk_size: int = 100000
+) -> list:
+    """
+    Runs the reducers over a stored result, e.g. one opened with
+    storage.load_result, chunk by chunk, so that a memory mapped solution is
+    never read at once.
+    """
+    n = len(result.time)
+    chunks = (
+        _ResultChunk(
+            np.asarray(result.time[start : start + chunk_size]),
+            np.asarray(result.solution[..., start : start + chunk_size]),
+        )
+        for start in range(0, n, chunk_size)
+    )
+    return run_reducers(chunks, reducers)
@@ -0,0 +1,316 @@
+"""
+Asyncio front end for solving many trajectories of the same model.
+
+Requests with the same model class, parameters, T, dt, method and options
+that arrive within a short window are coalesced into one solve_batch call,
+which runs in a worker pool so that the event loop is not blocked, and the
+trajectories are handed back to the individual callers:
+
+    async with SolveService(window=0.005) as service:
+        results = await asyncio.gather(
+            *(service.solve_async(Pendulum(), u0, T=10, dt=0.01) for u0 in u0s)
+        )
+
+Every caller gets the result object of model.solve, with the SolveStats of
+the whole batch as its stats. The values are those of model.solve for the
+fixed step native methods, e.g. RK4, and for analytic solutions, up to
+rounding. The adaptive methods, among them the default RK45 for models
+without an analytic solution, take the same steps for the whole batch.
+Every trajectory still meets the tolerances, see ODEModel.solve_batch, but
+it differs from model.solve within them, and depends on which other
+requests shared its batch. Pass a fixed step method for results that do
+not depend on the other requests.
+"""
+import asyncio
+import collections
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ode import InvalidInitialConditionError, _attach
+
+
+def _normalize(value) -> str:
+    """
+    Key of a parameter or option, the same for NumPy and Python numbers or
+    arrays and lists with the same values, e.g. np.float64(0.1) and 0.1.
+    """
+    return repr(np.asarray(value).tolist())
+
+
+def _request_key(model, T: float, dt: float, method: Optional[str], options: dict):
+    """Requests with the same key can be solved together."""
+    cls = type(model)
+    parameters = model.parameters.items()
+    return (
+        f"{cls.__module__}.{cls.__qualname__}",
+        tuple(sorted((name, _normalize(value)) for name, value in parameters)),
+        _normalize(T),
+        _normalize(dt),
+        method,
+        tuple(sorted((name, _normalize(value)) for name, value in options.items())),
+    )
+
+
+def _solve_batch(model, u0: np.ndarray, T: float, dt: float, method, options):
+    """Runs in the worker pool."""
+    return model.solve_batch(u0, T, dt, method=method, **options)
+
+
+@dataclass
+class ServiceMetrics:
+    """
+    Counters of a SolveService. The latencies, from the call of solve_async
+    until the result is ready, are kept for the last max_latencies requests.
+    started and finished are the times of the first request and of the last
+    completed one.
+    """
+
+    requests: int = 0
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    batches: int = 0
+    # Wall time of the batched solves in the worker pool, summed.
+    solve_time: float = 0.0
+    max_latencies: int = 10000
+    latencies: Deque[float] = field(default_factory=collections.deque, repr=False)
+    started: Optional[float] = field(default=None, repr=False)
+    finished: Optional[float] = field(default=None, repr=False)
+
+    def record_latency(self, latency: float) -> None:
+        self.latencies.append(latency)
+        if len(self.latencies) > self.max_latencies:
+            self.latencies.popleft()
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.completed / self.batches if self.batches else 0.0
+
+    def latency(self, percentile: float = 50.0) -> float:
+        """Latency in seconds at the given percentile, nan before any request."""
+        if not self.latencies:
+            return float("nan")
+        return float(np.percentile(self.latencies, percentile))
+
+    @property
+    def throughput(self) -> float:
+        """
+        Completed requests per second from the first request to the last
+        completed one, so that idle time before and after does not count.
+        """
+        if self.started is None or self.finished is None:
+            return 0.0
+        elapsed = self.finished - self.started
+        return self.completed / elapsed if elapsed > 0 else 0.0
+
+
+class _Batch:
+    def __init__(self, model, T, dt, method, options) -> None:
+        self.model = model
+        self.T = T
+        self.dt = dt
+        self.method = method
+        self.options = options
+        self.u0: List[np.ndarray] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class SolveService:
+    """
+    Coalesces concurrent solve requests into batched solves.
+
+    Args.:
+    window: seconds to wait after the first request of a batch for more
+    compatible requests.
+    max_batch_size: a batch is solved right away once it has this many
+    requests.
+    max_pending: number of requests that may be in a batch or being solved
+    at once, see in_flight. Further calls of solve_async wait until earlier
+    ones are done.
+    executor: pool to run the solves in. By default a ThreadPoolExecutor
+    with max_workers threads is created and shut down by close. NumPy
+    releases the GIL in the vectorized right hand sides.
+    """
+
+    def __init__(
+        self,
+        window: float = 0.005,
+        max_batch_size: int = 1024,
+        max_pending: int = 10000,
+        executor: Optional[Executor] = None,
+        max_workers: Optional[int] = None,
+    ) -> None:
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_pending = max_pending
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_workers)
+        self.metrics = ServiceMetrics()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._batches: Dict[Tuple, _Batch] = {}
+        self._running = set()
+        self._closed = False
+        self.in_flight = 0
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of requests that are not done yet, including those that wait
+        for one of the max_pending slots.
+        """
+        return self.metrics.requests - (
+            self.metrics.completed + self.metrics.failed + self.metrics.cancelled
+        )
+
+    async def solve_async(
+        self,
+        model,
+        u0: np.ndarray,
+        T: float,
+        dt: float,
+        method: Optional[str] = None,
+        **options,
+    ):
+        """
+        Solves model from u0 like model.solve(u0, T, dt, method, **options),
+        as part of a batch of compatible requests.
+
+        Cancelling the call drops the request from its batch, or discards
+        its trajectory if the batch is already being solved.
+        """
+        if self._closed:
+            raise RuntimeError("The SolveService is closed")
+        u0 = np.asarray(u0, dtype=float)
+        if u0.shape != (model.num_states,):
+            raise InvalidInitialConditionError
+        if "events" in options:
+            raise ValueError("events are not supported by batched solves")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+        start = time.perf_counter()
+        if self.metrics.started is None:
+            self.metrics.started = start
+        self.metrics.requests += 1
+        try:
+            await self._slots.acquire()
+        except asyncio.CancelledError:
+            self.metrics.cancelled += 1
+            raise
+        self.in_flight += 1
+        try:
+            future = self._enqueue(model, u0, T, dt, method, options)
+            result = await future
+        except asyncio.CancelledError:
+            self.metrics.cancelled += 1
+            raise
+        except Exception:
+            self.metrics.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+        self.metrics.completed += 1
+        self.metrics.finished = time.perf_counter()
+        self.metrics.record_latency(self.metrics.finished - start)
+        return result
+
+    def _enqueue(self, model, u0, T, dt, method, options) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        key = _request_key(model, T, dt, method, options)
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = _Batch(model, T, dt, method, options)
+            self._batches[key] = batch
+            batch.timer = loop.call_later(self.window, self._flush, key)
+        future = loop.create_future()
+        batch.u0.append(u0)
+        batch.futures.append(future)
+        if len(batch.futures) >= self.max_batch_size:
+            self._flush(key)
+        return future
+
+    def _flush(self, key) -> None:
+        """Starts the solve of a batch, without the cancelled requests."""
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        requests = [
+            (u0, future)
+            for u0, future in zip(batch.u0, batch.futures)
+            if not future.cancelled()
+        ]
+        if not requests:
+            return
+        task = asyncio.ensure_future(self._solve(batch, requests))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        # If the solve is cancelled, possibly before it starts, its callers
+        # are cancelled too instead of waiting forever.
+        task.add_done_callback(lambda _: self._cancel(requests))
+
+    @staticmethod
+    def _cancel(requests: list) -> None:
+        for _, future in requests:
+            future.cancel()
+
+    async def _solve(self, batch: _Batch, requests: list) -> None:
+        loop = asyncio.get_running_loop()
+        u0 = np.stack([u0 for u0, _ in requests])
+        start = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(
+                self.executor,
+                _solve_batch,
+                batch.model,
+                u0,
+                batch.T,
+                batch.dt,
+                batch.method,
+                batch.options,
+            )
+        except Exception as error:
+            for _, future in requests:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        finally:
+            self.metrics.batches += 1
+            self.metrics.solve_time += time.perf_counter() - start
+
+        for i, (_, future) in enumerate(requests):
+            if not future.done():
+                single = batch.model._create_result(result.time, result.solution[i])
+                future.set_result(_attach(single, stats=result.stats))
+
+    async def flush(self) -> None:
+        """Solves all waiting batches now, and waits for all running solves."""
+        for key in list(self._batches):
+            self._flush(key)
+        while self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def close(self) -> None:
+        """
+        Stops taking new requests, serves all that were made, including
+        those waiting for a slot, then shuts down the own executor.
+        """
+        self._closed = True
+        while self.pending or self._batches or self._running:
+            await self.flush()
+            # Lets requests that got a slot join a new batch.
+            await asyncio.sleep(0)
+        if self._own_executor:
+            self.executor.shutdown()
+
+    async def __aenter__(self) -> "SolveService":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
@@ -0,0 +1,295 @@
+"""
+On-disk format for the result classes.
+
+A result is stored in a directory with three files:
+
+header.json    class of the result and its fields (L, g, ...), the model
+               class and its parameters, the solver method and SolveStats,
+               dtype and shape.
+time.bin       the time points as raw float64, or empty if they are a
+               UniformTimeGrid, which is then stored in the header.
+solution.bin   the solution as raw values, with time along the first axis
+               so that new time points can be appended to the end.
+
+load_result maps the raw files with np.memmap, so slicing out a time window
+only reads that part from disk. The values of a single state are spread
+over the whole of solution.bin, so reading one state touches every page of
+the file.
+"""
+import dataclasses
+import importlib
+import json
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import numpy as np
+
+from ode import SolveStats, UniformTimeGrid, _attach
+
+FORMAT_VERSION = 1
+HEADER = "header.json"
+TIME = "time.bin"
+SOLUTION = "solution.bin"
+
+
+def _qualified_name(cls: type) -> str:
+    return f"{cls.__module__}:{cls.__qualname__}"
+
+
+def _import_class(name: str) -> type:
+    module, qualname = name.split(":")
+    cls = importlib.import_module(module)
+    for attribute in qualname.split("."):
+        cls = getattr(cls, attribute)
+    return cls
+
+
+def _is_scalar(value) -> bool:
+    if isinstance(value, list):
+        return all(_is_scalar(item) for item in value)
+    return isinstance(value, (bool, int, float, str)) or value is None
+
+
+def _scalar(value):
+    """Plain Python value of a NumPy scalar, or list of a 1D array."""
+    if isinstance(value, np.ndarray) and value.ndim == 1:
+        return value.tolist()
+    return value.item() if isinstance(value, np.generic) else value
+
+
+# Fields that are not stored, the optional ones describe the solve.
+_SKIPPED_FIELDS = ("time", "solution", "cache", "stats", "t_events", "y_events")
+
+
+def result_fields(result) -> dict:
+    """
+    The fields of a result object other than time and solution, e.g. L and
+    g of a PendulumResults. Only plain scalars, and lists of them such as
+    the lengths of an NPendulumResults, are included.
+    """
+    if dataclasses.is_dataclass(result):
+        names = [field.name for field in dataclasses.fields(result)]
+    else:
+        names = list(result._fields)
+    fields = {}
+    for name in names:
+        value = _scalar(getattr(result, name))
+        if name not in _SKIPPED_FIELDS and _is_scalar(value):
+            fields[name] = value
+    return fields
+
+
+class ResultWriter:
+    """
+    Writes results to disk chunk by chunk, for example the chunks of
+    ODEModel.solve_stream.
+
+    Args.:
+    path: directory to write to, created if needed.
+    model: optional model, its class and parameters go into the header.
+    method: optional name of the solver method, for the header.
+    mode: "w" to overwrite existing files, "a" to append to a stored result.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        model=None,
+        method: Optional[str] = None,
+        mode: str = "w",
+    ) -> None:
+        if mode not in ("w", "a"):
+            raise ValueError(f"mode must be 'w' or 'a', not {mode!r}")
+        self.path = Path(path)
+        if mode == "a" and (self.path / HEADER).is_file():
+            self.header = load_header(self.path)
+            self._time = open(self.path / TIME, "ab")
+            self._solution = open(self.path / SOLUTION, "ab")
+            return
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        # The files are overwritten, so an old header would describe them wrongly.
+        (self.path / HEADER).unlink(missing_ok=True)
+        self.header = {
+            "format": FORMAT_VERSION,
+            "model_class": None,
+            "model_parameters": {},
+            "method": method,
+            "num_timepoints": 0,
+        }
+        if model is not None:
+            self.header["model_class"] = _qualified_name(type(model))
+            self.header["model_parameters"] = {
+                name: _scalar(value)
+                for name, value in model.parameters.items()
+                if _is_scalar(_scalar(value))
+            }
+        self._time = open(self.path / TIME, "wb")
+        self._solution = open(self.path / SOLUTION, "wb")
+
+    def append(self, result) -> None:
+        """Appends the time points of a result to the end of the file."""
+        solution = np.asarray(result.solution)
+        if self.header["num_timepoints"] == 0:
+            self.header["result_class"] = _qualified_name(type(result))
+            self.header["result_fields"] = result_fields(result)
+            self.header["dtype"] = solution.dtype.str
+            self.header["state_shape"] = list(solution.shape[:-1])
+            stats = getattr(result, "stats", None)
+            if stats is not None:
+                self.header["stats"] = dataclasses.asdict(stats)
+            if isinstance(result.time, UniformTimeGrid):
+                self.header["time_grid"] = {
+                    "t0": result.time.t0,
+                    "dt": result.time.dt,
+                }
+        elif list(solution.shape[:-1]) != self.header["state_shape"]:
+            raise ValueError(
+                f"Cannot append solution of shape {solution.shape} to "
+                f"solutions of shape {self.header['state_shape']}"
+            )
+
+        if "time_grid" in self.header:
+            self._check_time_grid(result.time)
+        else:
+            np.asarray(result.time, dtype=np.float64).tofile(self._time)
+        np.moveaxis(solution, -1, 0).astype(self.header["dtype"], copy=False).tofile(
+            self._solution
+        )
+        self.header["num_timepoints"] += solution.shape[-1]
+        self._time.flush()
+        self._solution.flush()
+        self._write_header()
+
+    def _check_time_grid(self, time) -> None:
+        """Appended time points must continue the stored UniformTimeGrid."""
+        grid = self.header["time_grid"]
+        t0 = grid["t0"] + grid["dt"] * self.header["num_timepoints"]
+        if not (
+            isinstance(time, UniformTimeGrid)
+            and np.isclose(time.dt, grid["dt"])
+            and (len(time) == 0 or np.isclose(time.t0, t0))
+        ):
+            raise ValueError(
+                "Appended time points must be a UniformTimeGrid with "
+                f"dt={grid['dt']} that continues at t={t0}"
+            )
+
+    def _write_header(self) -> None:
+        with open(self.path / HEADER, "w") as file:
+            json.dump(self.header, file, indent=2)
+
+    def close(self) -> None:
+        """
+        Closes the files and writes the header.
+
+        Raises ValueError if nothing was appended to a new file, whose
+        result class and state shape are then unknown. No header is written
+        in that case, so the directory is not mistaken for a saved result.
+        """
+        self._time.close()
+        self._solution.close()
+        if "result_class" not in self.header:
+            raise ValueError(f"Nothing was appended to {self.path}")
+        self._write_header()
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        try:
+            self.close()
+        except ValueError:
+            # Do not hide the error that ended the with block.
+            if exc_type is None:
+                raise
+
+
+def save_result(
+    result, path: Union[str, Path], model=None, method: Optional[str] = None
+) -> None:
+    """
+    Saves a result object, e.g. an ODEResult or a PendulumResults.
+
+    Args.:
+    result: the result to save.
+    path: directory to save it in.
+    model, method: optional model and solver method, stored in the header.
+    """
+    with ResultWriter(path, model, method) as writer:
+        writer.append(result)
+
+
+def save_stream(
+    chunks: Iterable,
+    path: Union[str, Path],
+    model=None,
+    method: Optional[str] = None,
+    mode: str = "w",
+) -> int:
+    """
+    Saves the chunks of a streaming solve as they are computed.
+
+    Returns: the total number of time points in the file.
+    """
+    with ResultWriter(path, model, method, mode) as writer:
+        for chunk in chunks:
+            writer.append(chunk)
+    return writer.header["num_timepoints"]
+
+
+def load_header(path: Union[str, Path]) -> dict:
+    with open(Path(path) / HEADER) as file:
+        return json.load(file)
+
+
+def load_result(path: Union[str, Path], mode: str = "r"):
+    """
+    Opens a saved result without reading the arrays into memory.
+
+    Args.:
+    path: directory written by save_result, save_stream or ResultWriter.
+    mode: memmap mode, "r" for read only, "r+" to allow changes or "c" for
+    copy on write.
+
+    Return: an instance of the saved result class, with time and solution as
+    memory-mapped arrays, or time as a UniformTimeGrid if it was saved as
+    one, and the SolveStats of the solve if the result had them. The
+    solution is a view with time along the last axis, like the arrays
+    returned by solve.
+    """
+    path = Path(path)
+    header = load_header(path)
+    num_timepoints = header["num_timepoints"]
+    state_shape = tuple(header["state_shape"])
+    if "time_grid" in header:
+        grid = header["time_grid"]
+        time = UniformTimeGrid(grid["t0"], grid["dt"], num_timepoints)
+    elif num_timepoints == 0:
+        time = np.empty(0)
+    else:
+        time = np.memmap(path / TIME, np.float64, mode, shape=(num_timepoints,))
+    if num_timepoints == 0:
+        solution = np.empty((0,) + state_shape, dtype=header["dtype"])
+    else:
+        solution = np.memmap(
+            path / SOLUTION,
+            np.dtype(header["dtype"]),
+            mode,
+            shape=(num_timepoints,) + state_shape,
+        )
+    result_class = _import_class(header["result_class"])
+    result = result_class(
+        time=time, solution=np.moveaxis(solution, 0, -1), **header["result_fields"]
+    )
+    if "stats" in header:
+        result = _attach(result, stats=SolveStats(**header["stats"]))
+    return result
+
+
+def load_model(path: Union[str, Path]):
+    """Recreates the model a saved result was computed with, if it was stored."""
+    header = load_header(path)
+    if header["model_class"] is None:
+        return None
+    return _import_class(header["model_class"])(**header["model_parameters"])
@@ -0,0 +1,230 @@
+import itertools
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ode import SolveStats
+
+
+def parameter_grid(grid: Dict[str, Sequence]) -> Dict[str, np.ndarray]:
+    """
+    Flattens a parameter grid to one array per parameter.
+
+    Args.:
+    grid: maps parameter names to the values to scan, e.g.
+    {"L": [1, 2], "g": [9.81, 3.71]}.
+
+    Return: dictionary with the same keys, where entry i of every array is
+    combination number i of the cartesian product, in C order.
+    """
+    names = list(grid)
+    combinations = list(itertools.product(*(grid[name] for name in names)))
+    return {
+        name: np.array([combination[i] for combination in combinations])
+        for i, name in enumerate(names)
+    }
+
+
+def _num_solves(parameters: Dict[str, np.ndarray]) -> int:
+    """Number of combinations of a flattened grid, which must not be empty."""
+    num_solves = len(next(iter(parameters.values()), ()))
+    if num_solves == 0:
+        raise ValueError("The parameter grid has no combinations")
+    return num_solves
+
+
+def _solve_chunk(
+    model_class,
+    parameters: Dict[str, np.ndarray],
+    start: int,
+    u0: np.ndarray,
+    T: float,
+    dt: float,
+    method: Optional[str],
+    options: dict,
+) -> Tuple[int, np.ndarray, np.ndarray, SolveStats]:
+    """Solves one chunk of a sweep, runs in the worker processes."""
+    num_solves = len(next(iter(parameters.values())))
+    solutions = []
+    stats = []
+    for i in range(num_solves):
+        model = model_class(
+            **{name: values[i].item() for name, values in parameters.items()}
+        )
+        if u0.ndim == 2:
+            result = model.solve_batch(u0, T, dt, method=method, **options)
+        else:
+            result = model.solve(u0, T, dt, method=method, **options)
+        solutions.append(result.solution)
+        stats.append(result.stats)
+    return start, result.time, np.stack(solutions), sum(stats)
+
+
+def _iter_chunks(
+    model_class,
+    grid: Dict[str, Sequence],
+    u0: np.ndarray,
+    T: float,
+    dt: float,
+    method: Optional[str],
+    max_workers: Optional[int],
+    chunksize: Optional[int],
+    options: dict,
+) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, SolveStats]]:
+    """Same as iter_sweep, but also yields the summed stats of every chunk."""
+    parameters = parameter_grid(grid)
+    num_solves = _num_solves(parameters)
+    u0 = np.asarray(u0)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, int(np.ceil(num_solves / (4 * max_workers))))
+
+    def chunk(start):
+        values = {name: v[start : start + chunksize] for name, v in parameters.items()}
+        return (model_class, values, start, u0, T, dt, method, options)
+
+    # Created one at a time, as they are submitted.
+    chunks = (chunk(start) for start in range(0, num_solves, chunksize))
+
+    def indices(start, solutions):
+        return np.arange(start, start + len(solutions))
+
+    if max_workers == 1:
+        for task in chunks:
+            start, time, solutions, stats = _solve_chunk(*task)
+            yield indices(start, solutions), time, solutions, stats
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # At most two chunks per worker are submitted at once, so that the
+        # memory for the pending tasks and their results does not grow with
+        # the size of the grid.
+        futures = set()
+        try:
+            while True:
+                for task in itertools.islice(chunks, 2 * max_workers - len(futures)):
+                    futures.add(executor.submit(_solve_chunk, *task))
+                if not futures:
+                    break
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, time, solutions, stats = future.result()
+                    yield indices(start, solutions), time, solutions, stats
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def iter_sweep(
+    model_class,
+    grid: Dict[str, Sequence],
+    u0: np.ndarray,
+    T: float,
+    dt: float,
+    method: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    chunksize: Optional[int] = None,
+    **options,
+) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Solves a model for every combination in a parameter grid, in parallel.
+
+    The combinations are split into chunks that are submitted to a process
+    pool, and every chunk is yielded as soon as it is done, so the order is
+    not the order of the grid.
+
+    Args.:
+    model_class: ODEModel subclass, called with one combination of the grid
+    as keyword arguments.
+    grid: maps parameter names to the values to scan.
+    u0: initial condition, shape (num_states,), or (N, num_states) to solve
+    an ensemble for every combination.
+    T, dt, method, options: passed on to solve or solve_batch.
+    max_workers: number of processes, 1 solves everything in this process.
+    chunksize: number of combinations per task, by default the grid is
+    split in about four tasks per worker.
+
+    Yields: (indices, time, solutions), where indices are the positions of
+    the combinations in parameter_grid(grid), and solutions has one
+    solution per index along the first axis.
+    """
+    for indices, time, solutions, _ in _iter_chunks(
+        model_class, grid, u0, T, dt, method, max_workers, chunksize, options
+    ):
+        yield indices, time, solutions
+
+
+@dataclass
+class SweepResult:
+    """
+    Results of a parameter sweep.
+
+    Entry i of every array in parameters and of solution belongs to
+    combination number i of the grid. stats is the sum of the SolveStats
+    of all solves, where wall_time adds up the time spent in every worker.
+    """
+
+    model_class: type
+    parameters: Dict[str, np.ndarray]
+    time: np.ndarray
+    solution: np.ndarray
+    stats: Optional[SolveStats] = None
+
+    @property
+    def num_solves(self) -> int:
+        return self.solution.shape[0]
+
+    def index(self, **parameters) -> int:
+        """Position of the combination with the given parameter values."""
+        mask = np.ones(self.num_solves, dtype=bool)
+        for name, value in parameters.items():
+            mask &= np.isclose(self.parameters[name], value)
+        matches = np.flatnonzero(mask)
+        if len(matches) != 1:
+            raise KeyError(f"{len(matches)} combinations match {parameters}")
+        return int(matches[0])
+
+    def result(self, **parameters):
+        """
+        The result object of the model for one combination, e.g. a
+        PendulumResults for a sweep over Pendulum.
+        """
+        i = self.index(**parameters)
+        model = self.model_class(
+            **{name: values[i].item() for name, values in self.parameters.items()}
+        )
+        return model._create_result(self.time, self.solution[i])
+
+
+def sweep(
+    model_class,
+    grid: Dict[str, Sequence],
+    u0: np.ndarray,
+    T: float,
+    dt: float,
+    method: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    chunksize: Optional[int] = None,
+    **options,
+) -> SweepResult:
+    """
+    Solves a model for every combination in a parameter grid, in parallel,
+    and gathers the solutions in one array. See iter_sweep for the
+    arguments.
+    """
+    parameters = parameter_grid(grid)
+    num_solves = _num_solves(parameters)
+    solution = None
+    stats = []
+    for indices, time, solutions, chunk_stats in _iter_chunks(
+        model_class, grid, u0, T, dt, method, max_workers, chunksize, options
+    ):
+        if solution is None:
+            solution = np.empty((num_solves,) + solutions.shape[1:])
+        solution[indices] = solutions
+        stats.append(chunk_stats)
+    return SweepResult(model_class, parameters, time, solution, sum(stats))
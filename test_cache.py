@@ -0,0 +1,141 @@
+import numpy as np
+import pytest
+
+from exp_decay import ExponentialDecay
+from pendulum import *
+from cache import *
+
+
+def test_repeated_solve_hits_memory():
+    cache = SolutionCache()
+    model = Pendulum()
+    u0 = np.array([np.pi / 6, 0.35])
+
+    first = cache.solve(model, u0, T=1, dt=0.01)
+    second = cache.solve(Pendulum(), u0.copy(), T=1, dt=0.01)
+
+    assert second is first
+    assert isinstance(second, PendulumResults)
+    assert cache.stats.misses == 1 and cache.stats.hits == 1
+    assert cache.stats.hit_rate == 0.5
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        dict(u0=np.array([0.1, 0.0])),
+        dict(T=2),
+        dict(dt=0.02),
+        dict(method="RK4"),
+        dict(rtol=1e-8),
+    ],
+)
+def test_different_arguments_miss(change):
+    cache = SolutionCache()
+    model = Pendulum()
+    arguments = dict(u0=np.array([np.pi / 6, 0.35]), T=1, dt=0.01)
+    cache.solve(model, **arguments)
+    cache.solve(model, **{**arguments, **change})
+    assert cache.stats.misses == 2
+
+
+def test_changed_parameters_miss():
+    cache = SolutionCache()
+    model = ExponentialDecay(0.4)
+    u0 = np.array([1.0])
+    first = cache.solve(model, u0, T=1, dt=0.1)
+    model.decay_constant = 0.8
+    second = cache.solve(model, u0, T=1, dt=0.1)
+
+    assert cache.stats.misses == 2
+    assert second.solution[0, -1] < first.solution[0, -1]
+
+
+def test_lru_eviction_respects_byte_limit():
+    model = ExponentialDecay(0.4)
+    result_bytes = 2 * 8 * 11
+    cache = SolutionCache(max_bytes=2 * result_bytes)
+
+    for u0 in (1.0, 2.0, 3.0):
+        cache.solve(model, np.array([u0]), T=1, dt=0.1)
+    assert len(cache) == 2
+    assert cache.nbytes <= cache.max_bytes
+    assert cache.stats.evictions == 1
+
+    cache.solve(model, np.array([1.0]), T=1, dt=0.1)
+    assert cache.stats.misses == 4
+
+
+def test_disk_store_survives_new_cache(tmp_path):
+    model = DampenedPendulum(B=0.5)
+    u0 = np.array([np.pi / 6, 0.35])
+    expected = SolutionCache(directory=tmp_path).solve(model, u0, T=1, dt=0.01)
+
+    cache = SolutionCache(directory=tmp_path)
+    computed = cache.solve(model, u0, T=1, dt=0.01)
+    assert cache.stats.disk_hits == 1 and cache.stats.misses == 0
+    assert isinstance(computed, PendulumResults)
+    assert np.array_equal(computed.solution, expected.solution)
+
+    cache.invalidate(model)
+    assert cache.key(model, u0, 1, 0.01) not in cache
+    cache.solve(model, u0, T=1, dt=0.01)
+    assert cache.stats.misses == 1
+
+
+def test_batches_are_cached():
+    cache = SolutionCache()
+    u0 = np.array([[0.1, 0.0], [0.2, 0.0]])
+    first = cache.solve(Pendulum(), u0, T=1, dt=0.1)
+    assert first.solution.shape == (2, 2, 11)
+    assert cache.solve(Pendulum(), u0, T=1, dt=0.1) is first
+
+
+def test_disk_hits_keep_stats(tmp_path):
+    model = Pendulum()
+    u0 = np.array([np.pi / 6, 0.35])
+    expected = SolutionCache(directory=tmp_path).solve(model, u0, T=1, dt=0.01)
+
+    computed = SolutionCache(directory=tmp_path).solve(model, u0, T=1, dt=0.01)
+    assert computed.stats == expected.stats
+
+
+def test_changed_solver_code_misses(monkeypatch):
+    cache = SolutionCache()
+    model = Pendulum()
+    key = cache.key(model, np.array([0.1, 0.0]), 1, 0.1)
+
+    monkeypatch.setattr("cache._solver_digest", lambda: "changed")
+    assert SolutionCache().key(model, np.array([0.1, 0.0]), 1, 0.1) != key
+
+
+def test_byte_budget_counts_cached_quantities():
+    model = Pendulum()
+    u0 = np.array([0.1, 0.0])
+    cache = SolutionCache()
+    result = cache.solve(model, u0, T=1, dt=0.01)
+    solution_nbytes = cache.nbytes
+
+    result.total_energy
+    cache.solve(model, u0, T=1, dt=0.01)
+    assert cache.nbytes == solution_nbytes + result._kinematics.nbytes
+
+
+@pytest.mark.parametrize("on_disk", [False, True])
+def test_dense_solves_bypass_the_cache(tmp_path, on_disk):
+    cache = SolutionCache(directory=tmp_path if on_disk else None)
+    result = cache.solve(Pendulum(), np.array([0.1, 0.0]), T=1000, dt=0.01, dense=True)
+    assert isinstance(result, DenseResult)
+    assert result._result is None
+    assert cache.stats.bypassed == 1 and len(cache) == 0
+    assert not list(tmp_path.iterdir())
+
+
+def test_solves_with_events_bypass_the_cache(tmp_path):
+    cache = SolutionCache(directory=tmp_path)
+    u0 = np.array([0.5, 0.0])
+    for _ in range(2):
+        result = cache.solve(Pendulum(), u0, T=10, dt=0.01, events=theta_crossing())
+        assert len(result.t_events[0]) > 0
+    assert cache.stats.bypassed == 2
+    assert cache.stats.misses == 0 and cache.stats.disk_hits == 0
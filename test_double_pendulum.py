@@ -1,3 +1,7 @@
+import subprocess
+import sys
+from pathlib import Path
+
 import numpy as np
 import pytest
 
@@ -83,3 +87,155 @@ def test_solve_double_pendulum_function_zero_ic():
         computed = getattr(solved_model, property)
         msg = f"The initial condition {u0} should give {property} with values of {expected}, not {computed}."
         assert np.all(computed == expected), msg
+
+
+def test_solve_batch_shapes_and_zero_ic():
+    u0 = np.array([[np.pi / 6, 0.35, 0, 0], [0, 0, 0, 0]])
+    T = 2
+    dt = 0.01
+
+    model = DoublePendulum()
+    batch = model.solve_batch(u0, T, dt)
+    num_timepoints = len(batch.time)
+
+    assert batch.solution.shape == (2, 4, num_timepoints)
+    assert batch.x2.shape == (2, num_timepoints)
+    assert np.all(batch.theta1[1] == 0)
+    assert np.all(batch.y2[1] == -(model.L1 + model.L2))
+
+    single = model.solve(u0[0], T, dt)
+    assert np.allclose(batch.theta2[0], single.theta2, atol=1e-2)
+
+
+@pytest.mark.parametrize("method", ["RK45", "DOPRI5"])
+def test_solve_batch_accuracy_does_not_depend_on_other_trajectories(method):
+    # One chaotic trajectory among many that barely move, which would
+    # otherwise dominate the error norm and let the steps grow too long.
+    hard = np.array([2.5, 0.0, 2.0, 0.0])
+    u0 = np.vstack([hard] + [[0.01, 0.0, 0.01, 0.0]] * 255)
+    T, dt, tol = 3, 0.01, 1e-6
+    model = DoublePendulum()
+    exact = model.solve(hard, T, dt, method="RK45", rtol=1e-12, atol=1e-12)
+
+    single = model.solve(hard, T, dt, method=method, rtol=tol, atol=tol)
+    batch = model.solve_batch(u0, T, dt, method=method, rtol=tol, atol=tol)
+    single_error = np.abs(single.solution - exact.solution).max()
+    batch_error = np.abs(batch.solution[0] - exact.solution).max()
+    assert batch_error < 2 * single_error
+
+
+def test_jacobian_matches_finite_differences():
+    model = DoublePendulum(L1=1.3, L2=0.7)
+    u = np.array([0.4, 0.3, -0.9, 1.2])
+    h = 1e-7
+    expected = np.array(
+        [(model(0, u + h * e) - model(0, u - h * e)) / (2 * h) for e in np.eye(4)]
+    ).T
+    assert np.allclose(model.jacobian(0, u), expected, atol=1e-6)
+
+    batch = np.stack([u, 2 * u], axis=1)
+    assert np.allclose(model.jacobian(0, batch)[..., 0], model.jacobian(0, u))
+
+
+def test_derived_quantities_are_cached_until_solution_changes():
+    model = DoublePendulum()
+    result = model.solve(np.array([np.pi / 6, 0.35, 0, 0]), T=1, dt=0.01)
+
+    assert np.shares_memory(result.total_energy, result.total_energy)
+    x2 = result.x2
+    result.solution = np.zeros_like(result.solution)
+    assert not np.shares_memory(result.x2, x2)
+    assert np.all(result.x2 == 0)
+
+
+def test_double_pendulum_kinematics_energy():
+    model = DoublePendulum(L1=1.3, L2=0.7)
+    result = model.solve(np.array([np.pi / 6, 0.35, 0, 0]), T=2, dt=0.001, method="RK4")
+
+    assert np.allclose(result.total_energy, result.total_energy[0], rtol=1e-6)
+    assert np.allclose(
+        result.velocity_x2[1:-1], np.gradient(result.x2, result.time)[1:-1], atol=1e-4
+    )
+
+    out = np.empty((11, len(result.time)))
+    chunked = result.kinematics(out=out, chunk_size=100)
+    assert chunked is out
+    assert np.array_equal(chunked[10], result.total_energy)
+
+
+def test_rhs_writes_into_out():
+    model = DoublePendulum(L1=1.3, L2=0.7)
+    u = np.array([0.4, 0.3, -0.9, 1.2])
+    out = np.empty(4)
+    assert model(0.0, u, out=out) is out
+    assert np.allclose(out, model(0.0, u))
+
+    ensemble = np.stack([u, 2 * u, -u], axis=1)
+    out = np.empty_like(ensemble)
+    assert model(0.0, ensemble, out=out) is out
+    for i in range(3):
+        assert np.allclose(out[:, i], model(0.0, ensemble[:, i]))
+
+
+def test_flip_event_stops_at_flip():
+    model = DoublePendulum()
+    u0 = np.array([2.5, 0, 2.8, 0])
+    result = model.solve(u0, T=5, dt=0.01, method="RK4", events=flip_event())
+    t_flip = result.t_events[0][0]
+    assert np.isclose(np.max(np.abs(result.y_events[0][0, [0, 2]])), np.pi)
+    assert t_flip < 5 and result.time[-1] <= t_flip
+    assert np.all(np.abs(result.theta1) <= np.pi)
+    assert np.all(np.abs(result.theta2) <= np.pi)
+    assert np.allclose(model.energy(result.solution), result.total_energy)
+
+
+def test_headless_solve_does_not_import_scipy_or_matplotlib():
+    code = (
+        "import sys\n"
+        "import numpy as np\n"
+        "from double_pendulum import DoublePendulum\n"
+        "DoublePendulum().solve(np.array([0.5, 0, 0, 0]), 1, 0.01, method='RK4')\n"
+        "print(sorted({name.split('.')[0] for name in sys.modules}))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parent,
+    ).stdout
+    assert "scipy" not in output
+    assert "matplotlib" not in output
+
+
+def test_derived_quantities_of_compact_results():
+    model = DoublePendulum(L1=1.3, L2=0.7)
+    u0 = np.array([np.pi / 6, 0.35, 0, 0])
+    expected = model.solve(u0, T=5, dt=0.01, method="RK4")
+    compact = model.solve(
+        u0, T=5, dt=0.01, method="RK4", dtype=np.float32, implicit_time=True
+    )
+    assert compact.solution.nbytes == expected.solution.nbytes // 2
+    assert np.allclose(compact.x2, expected.x2, atol=1e-5)
+    assert np.allclose(compact.total_energy, expected.total_energy, rtol=1e-5)
+    assert np.allclose(
+        np.gradient(compact.x2, compact.time),
+        np.gradient(expected.x2, expected.time),
+        atol=1e-4,
+    )
+
+
+@pytest.mark.parametrize("decimate", [False, True])
+def test_plot_energy_draws_the_energies(decimate):
+    model = DoublePendulum()
+    result = model.solve(np.array([np.pi / 6, 0.35, 0, 0]), 2, 0.01, method="RK4")
+    figure = plt.figure()
+    plot_energy(result, decimate=decimate, ax=figure.gca())
+    lines = figure.gca().lines
+    expected = [result.potential_energy, result.kinetic_energy, result.total_energy]
+    for line, energy in zip(lines, expected):
+        time = np.asarray(line.get_xdata())
+        index = np.searchsorted(result.time, time)
+        assert np.allclose(result.time[index], time)
+        assert np.allclose(line.get_ydata(), energy[index])
+    plt.close(figure)
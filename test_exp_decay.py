@@ -1,3 +1,4 @@
+import copy
 import pytest
 import numpy as np
 from pathlib import Path
@@ -129,3 +130,219 @@ def test_plot_ode_solution_saves_file():
 
     assert filename.is_file()
     filename.unlink()
+
+
+def test_solve_batch_matches_exact_solution():
+    a = 0.4
+    T = 10
+    dt = 0.01
+    u0 = np.array([[1.0], [2.5], [5.0]])
+
+    model = ExponentialDecay(a)
+    computed = model.solve_batch(u0, T, dt)
+
+    assert computed.solution.shape == (3, 1, len(computed.time))
+    assert computed.num_trajectories == 3
+    assert computed.num_states == 1
+
+    exact = u0 * np.exp(-a * computed.time)
+    relative_error = np.linalg.norm(computed.solution[:, 0] - exact) / np.linalg.norm(
+        exact
+    )
+    assert relative_error < 0.01, "Relative error too large."
+
+
+def test_solve_batch_with_wrong_number_of_states():
+    model = ExponentialDecay(0.4)
+    with pytest.raises(InvalidInitialConditionError):
+        model.solve_batch(u0=np.ones((3, 2)), T=10, dt=0.01)
+
+
+def test_jacobian():
+    model = ExponentialDecay(0.4)
+    assert np.allclose(model.jacobian(0.0, np.array([3.2])), [[-0.4]])
+    assert model.jacobian(0.0, np.ones((1, 5))).shape == (1, 1, 5)
+
+
+def test_solve_uses_given_method():
+    model = ExponentialDecay(0.4)
+    with pytest.raises(ValueError):
+        model.solve(u0=np.array([1.0]), T=10, dt=0.01, method="NotAMethod")
+
+
+@pytest.mark.parametrize("method", ["Radau", "BDF", "LSODA"])
+def test_solve_with_implicit_methods(method):
+    a = 0.4
+    model = ExponentialDecay(a)
+    computed = model.solve(np.array([5.0]), T=10, dt=0.01, method=method)
+    exact = 5.0 * np.exp(-a * computed.time)
+    assert np.allclose(computed.solution[0], exact, rtol=1e-2)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1000])
+def test_solve_stream_with_small_chunks(chunk_size):
+    a = 0.4
+    model = ExponentialDecay(a)
+    chunks = list(model.solve_stream(np.array([5.0]), T=1, dt=0.1, chunk_size=chunk_size))
+
+    time = np.concatenate([chunk.time for chunk in chunks])
+    solution = np.concatenate([chunk.solution for chunk in chunks], axis=-1)
+    assert np.allclose(time, np.arange(0, 1.1, 0.1))
+    assert np.allclose(solution[0], 5.0 * np.exp(-a * time), rtol=1e-2)
+
+
+def test_rhs_writes_into_out():
+    model = ExponentialDecay(0.4)
+    out = np.empty(1)
+    assert model(0.0, np.array([3.2]), out=out) is out
+    assert np.isclose(out[0], -1.28)
+
+
+def test_solve_records_stats():
+    model = ExponentialDecay(0.4)
+    result = model.solve(np.array([5.0]), T=1, dt=0.1, method="Radau")
+    assert result.stats.method == "Radau"
+    assert result.stats.success
+    assert result.stats.nfev > 0 and result.stats.njev > 0
+    assert result.stats.wall_time > 0
+    assert result.stats.rhs_calls is None
+
+
+@pytest.mark.parametrize("method", ["RK45", "DOPRI5"])
+def test_profile_counts_rhs_calls(method):
+    model = ExponentialDecay(0.4)
+    result = model.solve(np.array([5.0]), T=1, dt=0.1, method=method, profile=True)
+    assert result.stats.rhs_calls == result.stats.nfev
+    assert result.stats.accepted_steps > 0
+    assert 0 < result.stats.rhs_time < result.stats.wall_time
+
+
+class LegacyDecay(ODEModel):
+    """A model whose right hand side does not take out."""
+
+    num_states = 1
+
+    def __call__(self, t, u):
+        return -0.4 * u
+
+
+@pytest.mark.parametrize("method", [None, "RK45", "RK4", "DOPRI5"])
+def test_profile_with_model_without_out(method):
+    u0 = np.array([5.0])
+    result = LegacyDecay().solve(u0, T=1, dt=0.1, method=method, profile=True)
+    expected = ExponentialDecay(0.4).solve(u0, T=1, dt=0.1, method=method or "RK45")
+    assert result.stats.rhs_calls == result.stats.nfev
+    assert np.allclose(result.solution, expected.solution)
+
+
+def test_stats_add_up():
+    model = ExponentialDecay(0.4)
+    first = model.solve(np.array([5.0]), T=1, dt=0.1, method="RK4").stats
+    second = model.solve(np.array([5.0]), T=1, dt=0.1, method="RK45").stats
+    total = sum([first, second])
+    assert total.num_solves == 2
+    assert total.method == "mixed"
+    assert total.nfev == first.nfev + second.nfev
+    assert total.rejected_steps is None
+
+
+@pytest.mark.parametrize("chunk_size", [64, 1000, 2**16])
+def test_minmax_decimate_keeps_extrema(chunk_size):
+    time = np.linspace(0, 100, 100001)
+    values = np.array([np.sin(time), np.cos(3 * time)])
+    t, v = minmax_decimate(time, values, 300, chunk_size=chunk_size)
+    assert t.shape == v.shape and t.shape[1] <= 600
+    assert np.allclose(v.max(axis=1), values.max(axis=1))
+    assert np.allclose(v.min(axis=1), values.min(axis=1))
+    assert np.all(np.diff(t, axis=1) >= 0)
+    # The kept points lie on the curves.
+    assert np.allclose(v, [np.sin(t[0]), np.cos(3 * t[1])])
+
+
+def test_plot_ode_solution_decimates_long_results(tmp_path):
+    model = ExponentialDecay(0.8)
+    result = model.solve(u0=np.array([5.0]), T=20, dt=0.001, method="RK4")
+    plot_ode_solution(result, ["u"], filename=tmp_path / "plot.png")
+    (line,) = plt.gca().lines
+    assert len(line.get_xdata()) < 2000
+    plt.close()
+
+    plot_ode_solution(result, ["u"], filename=tmp_path / "full.png", decimate=False)
+    assert len(plt.gca().lines[0].get_xdata()) == len(result.time)
+    plt.close()
+
+
+def test_analytic_solution():
+    model = ExponentialDecay(0.4)
+    u0 = np.array([[5.0], [1.0], [-2.0]])
+    batch = model.solve_batch(u0, T=10, dt=0.1)
+    expected = u0[:, :, None] * np.exp(-0.4 * batch.time)
+    assert batch.stats.method == "analytic"
+    assert batch.stats.nfev == 0
+    assert np.allclose(batch.solution, expected)
+
+    numerical = model.solve(u0[0], T=10, dt=0.1, method="RK45", rtol=1e-10)
+    assert numerical.stats.method == "RK45"
+    assert np.allclose(numerical.solution, expected[0])
+
+
+class ShortLivedDecay(ExponentialDecay):
+    """Has an analytic solution only up to t = 1."""
+
+    def analytic_solution(self, t, u0):
+        if np.max(t) > 1:
+            return None
+        return super().analytic_solution(t, u0)
+
+
+def test_solve_stream_continues_numerically_without_analytic_solution():
+    model = ShortLivedDecay(0.4)
+    u0 = np.array([5.0])
+    chunks = model.solve_stream(u0, T=3, dt=0.1, chunk_size=5, rtol=1e-10, atol=1e-10)
+    streamed = np.concatenate([chunk.solution for chunk in chunks], axis=-1)
+    assert np.allclose(streamed, 5 * np.exp(-0.4 * np.arange(31) * 0.1))
+
+    with pytest.raises(ValueError):
+        list(model.solve_stream(u0, T=3, dt=0.1, chunk_size=5, method="analytic"))
+
+
+def test_uniform_time_grid_behaves_like_array():
+    grid = UniformTimeGrid(0.0, 0.1, 11)
+    values = np.arange(0, 1.05, 0.1)
+    assert len(grid) == 11 and grid.shape == (11,)
+    assert np.allclose(np.asarray(grid), values)
+    assert np.isclose(grid[-1], 1.0) and np.isclose(grid[3], 0.3)
+    sliced = grid[2::3]
+    assert isinstance(sliced, UniformTimeGrid)
+    assert np.allclose(sliced, values[2::3])
+    assert np.allclose(grid[[0, 5]], values[[0, 5]])
+    assert np.allclose(2 * grid + 1, 2 * values + 1)
+    assert np.allclose(np.diff(grid), 0.1)
+
+    copied = grid.copy()
+    copied[0] = 5.0
+    assert isinstance(copied, np.ndarray) and grid[0] == 0.0
+    assert np.isclose(grid.max(), 1.0) and grid.min() == 0.0
+    assert grid.astype(np.float32).dtype == np.float32
+    assert np.allclose(grid.tolist(), values)
+    assert np.allclose(copy.deepcopy(grid), values)
+
+
+@pytest.mark.parametrize("method", ["RK4", "RK45", "analytic"])
+def test_solve_with_compact_storage(method):
+    model = ExponentialDecay(0.4)
+    u0 = np.array([5.0])
+    expected = model.solve(u0, T=10, dt=0.01, method=method)
+    compact = model.solve(
+        u0, T=10, dt=0.01, method=method, dtype=np.float32, implicit_time=True
+    )
+    assert compact.solution.dtype == np.float32
+    assert isinstance(compact.time, UniformTimeGrid)
+    assert np.allclose(compact.time, expected.time)
+    assert np.allclose(compact.solution, expected.solution, rtol=1e-6)
+
+    u0 = np.array([[5.0], [1.0]])
+    batch = model.solve_batch(u0, T=10, dt=0.01, method=method)
+    compact = model.solve_batch(u0, T=10, dt=0.01, method=method, dtype=np.float32)
+    assert compact.solution.dtype == np.float32
+    assert np.allclose(compact.solution, batch.solution, rtol=1e-6)
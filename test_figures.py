@@ -0,0 +1,62 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+from double_pendulum import DoublePendulum
+from figures import *
+from pendulum import Pendulum, DampenedPendulum
+
+
+def jobs(directory):
+    u0 = np.array([np.pi / 6, 0.35])
+    result = Pendulum().solve(u0, T=2, dt=0.01)
+    return [
+        FigureJob(
+            directory / "solution.png",
+            "solution",
+            results=result,
+            plot_options={"state_labels": ["theta", "omega"]},
+        ),
+        FigureJob(directory / "energy_single.png", "energy", results=result),
+        FigureJob(
+            directory / "energy_dampened.png",
+            "energy",
+            model=DampenedPendulum(B=1.0),
+            u0=u0,
+            T=2,
+            dt=0.01,
+        ),
+        FigureJob(
+            directory / "energy_double.png",
+            "energy",
+            model=DoublePendulum(),
+            u0=np.array([np.pi / 6, 0.35, 0, 0]),
+            T=2,
+            dt=0.01,
+            title="Double pendulum",
+        ),
+    ]
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_export_figures_writes_every_file(tmp_path, max_workers):
+    figures_before = plt.get_fignums()
+    filenames = export_figures(jobs(tmp_path), max_workers=max_workers, chunksize=2)
+    assert filenames == [str(job.filename) for job in jobs(tmp_path)]
+    for filename in filenames:
+        assert plt.imread(filename).shape == (480, 640, 4)
+    # Nothing is left in the global pyplot state.
+    assert plt.get_fignums() == figures_before
+
+
+def test_reused_axes_give_same_figure(tmp_path):
+    first, second = jobs(tmp_path)[1], jobs(tmp_path / "again")[1]
+    (tmp_path / "again").mkdir()
+    export_figures([first], max_workers=1)
+    export_figures([jobs(tmp_path)[0], second], max_workers=1)
+    assert np.array_equal(plt.imread(first.filename), plt.imread(second.filename))
+
+
+def test_unknown_kind_raises(tmp_path):
+    with pytest.raises(ValueError):
+        export_figures([FigureJob(tmp_path / "x.png", "phase")], max_workers=1)
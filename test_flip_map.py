@@ -0,0 +1,41 @@
+import numpy as np
+
+from double_pendulum import DoublePendulum
+from flip_map import *
+
+
+def test_can_flip_matches_energy_condition():
+    theta1, theta2 = np.meshgrid(np.linspace(-3, 3, 61), np.linspace(-3, 3, 61))
+    expected = 2 * np.cos(theta1) + np.cos(theta2) <= 1
+    assert np.array_equal(can_flip(theta1, theta2), expected)
+
+
+def test_flip_times_match_single_solves():
+    angles = np.linspace(-3, 3, 9)
+    result = flip_map(angles, angles, T=3, dt=0.01, max_workers=1)
+    assert result.flip_time.shape == (9, 9)
+    assert np.isinf(result.flip_time[4, 4])
+
+    flipped = np.argwhere(np.isfinite(result.flip_time))
+    assert len(flipped) > 0
+    for i, j in flipped[:5]:
+        u0 = np.array([angles[j], 0, angles[i], 0])
+        solved = DoublePendulum().solve(u0, 3, 0.01, method="RK4")
+        theta1, theta2 = solved.solution[0], solved.solution[2]
+        over = (np.abs(theta1) > np.pi) | (np.abs(theta2) > np.pi)
+        assert np.isclose(solved.time[np.argmax(over)], result.flip_time[i, j])
+
+
+def test_tiles_in_parallel_give_same_map():
+    angles = np.linspace(-3, 3, 12)
+    serial = flip_map(angles, angles, T=2, dt=0.01, max_workers=1)
+    parallel = flip_map(angles, angles, T=2, dt=0.01, tile_size=10, max_workers=2)
+    assert np.array_equal(serial.flip_time, parallel.flip_time)
+
+
+def test_image_is_black_where_there_is_no_flip():
+    angles = np.linspace(-3, 3, 9)
+    result = flip_map(angles, angles, T=1, dt=0.01, max_workers=1)
+    image = result.image()
+    assert image.shape == (9, 9, 4) and image.dtype == np.uint8
+    assert np.all(image[~np.isfinite(result.flip_time[::-1])] == (0, 0, 0, 255))
@@ -0,0 +1,170 @@
+import numpy as np
+import pytest
+
+from exp_decay import ExponentialDecay
+from pendulum import Pendulum, DampenedPendulum
+from double_pendulum import DoublePendulum
+from integrators import *
+
+
+@pytest.mark.parametrize("method, tol", [("RK4", 1e-8), ("DOPRI5", 1e-6)])
+def test_solve_exp_decay_with_native_methods(method, tol):
+    a = 0.4
+    T = 10
+    dt = 0.01
+    model = ExponentialDecay(a)
+    computed = model.solve(np.array([5.0]), T, dt, method=method)
+
+    exact = 5.0 * np.exp(-a * computed.time)
+    relative_error = np.linalg.norm(computed.solution[0] - exact) / np.linalg.norm(
+        exact
+    )
+    assert relative_error < tol, f"Relative error too large for {method}."
+
+
+def test_rk4_is_fourth_order():
+    model = ExponentialDecay(1.0)
+    errors = []
+    for dt in (0.1, 0.05):
+        t_eval = np.arange(0, 1 + dt / 2, dt)
+        computed = integrate(model, np.array([1.0]), t_eval, "RK4")
+        errors.append(abs(computed[0, -1] - np.exp(-1.0)))
+    order = np.log2(errors[0] / errors[1])
+    assert abs(order - 4) < 0.2, f"Observed order {order}, expected 4."
+
+
+def test_dopri5_meets_tolerance_on_coarse_grid():
+    model = Pendulum()
+    u0 = np.array([np.pi / 6, 0.35])
+    t_eval = np.linspace(0, 10, 6)
+
+    reference = integrate(model, u0, np.linspace(0, 10, 10001), "RK4")
+    computed = integrate(model, u0, t_eval, "DOPRI5", rtol=1e-8, atol=1e-10)
+
+    assert np.allclose(computed, reference[:, ::2000], atol=1e-6)
+
+
+def test_max_step_splits_output_intervals():
+    model = ExponentialDecay(1.0)
+    integrator = RK4(model, np.array([1.0]), max_step=0.01)
+    integrator.step(0.0, 0.1)
+    assert integrator.naccepted == 10
+    assert integrator.nfev == 40
+
+
+def test_batch_matches_single_trajectories():
+    model = Pendulum()
+    u0 = np.array([[np.pi / 6, 0.35], [0.1, 0.0], [1.0, -1.0]])
+    T = 5
+    dt = 0.01
+
+    batch = model.solve_batch(u0, T, dt, method="RK4")
+    assert batch.solution.shape == (3, 2, len(batch.time))
+    for i in range(len(u0)):
+        single = model.solve(u0[i], T, dt, method="RK4")
+        assert np.allclose(batch.solution[i], single.solution)
+
+
+def test_unknown_option_raises_TypeError():
+    with pytest.raises(TypeError):
+        integrate(ExponentialDecay(1.0), np.array([1.0]), np.arange(3), "RK4", rtol=1)
+
+
+def pendulum_energy(model, u):
+    theta, omega = u[0], u[1]
+    return 0.5 * (model.L * omega) ** 2 + model.g * model.L * (1 - np.cos(theta))
+
+
+def double_pendulum_energy(model, u):
+    theta1, omega1, theta2, omega2 = u
+    kinetic = (
+        (model.L1 * omega1) ** 2
+        + 0.5 * (model.L2 * omega2) ** 2
+        + model.L1 * model.L2 * omega1 * omega2 * np.cos(theta1 - theta2)
+    )
+    potential = -2 * model.g * model.L1 * np.cos(theta1) - model.g * model.L2 * np.cos(
+        theta2
+    )
+    return kinetic + potential
+
+
+def test_verlet_energy_stays_bounded_for_an_hour():
+    model = Pendulum()
+    u0 = np.array([np.pi / 6, 0.35])
+    computed = model.solve(u0, T=3600, dt=0.1, method="Verlet")
+
+    energy = pendulum_energy(model, computed.solution)
+    relative_error = np.max(np.abs(energy - energy[0])) / energy[0]
+    assert relative_error < 5e-2, f"Energy error {relative_error} too large."
+
+    # The error should not grow: compare the first and last ten minutes.
+    first = np.max(np.abs(energy[:6000] - energy[0]))
+    last = np.max(np.abs(energy[-6000:] - energy[0]))
+    assert last < 1.5 * first
+
+
+def test_implicit_midpoint_energy_stays_bounded_for_double_pendulum():
+    model = DoublePendulum()
+    u0 = np.array([np.pi / 6, 0.35, 0, 0])
+    computed = model.solve(u0, T=300, dt=0.05, method="ImplicitMidpoint")
+
+    energy = double_pendulum_energy(model, computed.solution)
+    error = np.max(np.abs(energy - energy[0]))
+    assert error < 1e-2 * abs(energy[0]), f"Energy error {error} too large."
+
+
+def test_implicit_midpoint_agrees_with_rk4_for_pendulum():
+    model = Pendulum()
+    u0 = np.array([np.pi / 6, 0.35])
+    midpoint = model.solve(u0, T=5, dt=0.001, method="ImplicitMidpoint")
+    rk4 = model.solve(u0, T=5, dt=0.001, method="RK4")
+    assert np.allclose(midpoint.solution, rk4.solution, atol=1e-4)
+
+
+def test_symplectic_methods_work_on_batches():
+    model = Pendulum()
+    u0 = np.array([[np.pi / 6, 0.35], [1.0, 0.0]])
+    batch = model.solve_batch(u0, T=10, dt=0.05, method="Verlet")
+    single = model.solve(u0[1], T=10, dt=0.05, method="Verlet")
+    assert np.allclose(batch.solution[1], single.solution)
+
+
+@pytest.mark.parametrize("method", ["Verlet", "ImplicitMidpoint"])
+def test_symplectic_methods_reject_dampened_pendulum(method):
+    model = DampenedPendulum(B=1)
+    with pytest.raises(ValueError):
+        model.solve(np.array([0.1, 0.0]), T=1, dt=0.1, method=method)
+
+
+def test_verlet_rejects_non_separable_model():
+    with pytest.raises(ValueError):
+        DoublePendulum().solve(np.array([0.1, 0, 0, 0]), T=1, dt=0.1, method="Verlet")
+
+
+@pytest.mark.parametrize("method", ["RK4", "DOPRI5", "Verlet", "ImplicitMidpoint"])
+def test_retain_continues_remaining_trajectories(method):
+    model = Pendulum()
+    u0 = np.array([[0.1, 0.5, 1.0, 2.0], [0.0, 0.1, 0.2, 0.3]])
+    full = METHODS[method](model, u0)
+    part = METHODS[method](model, u0)
+    mask = np.array([True, False, True, False])
+    for k in range(20):
+        full.step(0.01 * k, 0.01)
+        part.step(0.01 * k, 0.01)
+        if k == 4:
+            part.retain(mask)
+    assert part.u.shape == (2, 2)
+    if method == "DOPRI5":
+        # The step size depends on the error of all trajectories.
+        assert np.allclose(part.u, full.u[:, mask], atol=1e-8)
+    else:
+        assert np.allclose(part.u, full.u[:, mask], rtol=0, atol=1e-14)
+
+
+def test_verlet_evaluates_acceleration_once_per_step():
+    model = Pendulum()
+    # Substeps of 0.1 / 3, whose start times are not sums of the steps.
+    u0 = np.array([np.pi / 6, 0.35])
+    result = model.solve(u0, T=10, dt=0.1, method="Verlet", max_step=0.04)
+    num_steps = 3 * (len(result.time) - 1)
+    assert result.stats.nfev == num_steps + 1
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from double_pendulum import DoublePendulum
+from n_pendulum import *
+from storage import load_model, load_result, save_result
+
+
+@pytest.fixture
+def chain():
+    model = NPendulum(L=[1.0, 0.5, 0.8, 1.2], M=[1.0, 2.0, 0.5, 3.0])
+    u0 = np.array([0.3, 0.0, -0.2, 0.1, 0.5, 0.0, -0.4, 0.2])
+    return model, u0
+
+
+def test_agrees_with_double_pendulum():
+    model = NPendulum(L=(1.3, 0.7))
+    double = DoublePendulum(L1=1.3, L2=0.7)
+    rng = np.random.default_rng(1)
+    u = rng.normal(size=4)
+    ensemble = rng.normal(size=(4, 5))
+
+    assert model.num_states == 4
+    assert np.allclose(model(0.0, u), double(0.0, u))
+    assert np.allclose(model(0.0, ensemble), double(0.0, ensemble))
+    assert np.allclose(model.energy(ensemble), double.energy(ensemble))
+    z = double.to_canonical(ensemble)
+    assert np.allclose(model.to_canonical(ensemble), z)
+    assert np.allclose(model.canonical_rhs(0.0, z), double.canonical_rhs(0.0, z))
+
+
+@pytest.mark.parametrize("cache", [True, False])
+def test_results_agree_with_double_pendulum(cache):
+    u0 = np.array([0.5, 0.3, -0.2, 0.1])
+    result = NPendulum(L=(1.3, 0.7)).solve(u0, T=2, dt=0.01, method="RK4")
+    expected = DoublePendulum(L1=1.3, L2=0.7).solve(u0, T=2, dt=0.01, method="RK4")
+    result.cache = expected.cache = cache
+
+    assert np.allclose(result.solution, expected.solution)
+    assert np.allclose(result.theta[1], expected.theta2)
+    assert np.allclose(result.x[1], expected.x2)
+    assert np.allclose(result.y[0], expected.y1)
+    assert np.allclose(result.velocity_x[1], expected.velocity_x2)
+    assert np.allclose(result.velocity_y[0], expected.velocity_y1)
+    assert np.allclose(result.potential_energy, expected.potential_energy)
+    assert np.allclose(result.kinetic_energy, expected.kinetic_energy)
+    assert np.allclose(result.total_energy, expected.total_energy)
+
+
+def test_rhs_writes_into_out_and_matches_ensemble(chain):
+    model, u0 = chain
+    ensemble = np.stack([u0, 0.5 * u0, -u0], axis=1)
+    out = np.empty_like(ensemble)
+    assert model(0.0, ensemble, out=out) is out
+    for i in range(3):
+        assert np.allclose(out[:, i], model(0.0, ensemble[:, i]))
+
+
+def test_canonical_round_trip(chain):
+    model, u0 = chain
+    assert np.allclose(model.from_canonical(model.to_canonical(u0)), u0)
+
+
+def test_energy_is_conserved_and_matches_results(chain):
+    model, u0 = chain
+    result = model.solve(u0, T=5, dt=0.01, method="DOP853", rtol=1e-10, atol=1e-10)
+
+    assert np.allclose(result.total_energy, result.total_energy[0], rtol=1e-7)
+    assert np.allclose(model.energy(result.solution), result.total_energy)
+    assert result.x.shape == (4, len(result.time))
+    assert np.allclose(result.kinematics(chunk_size=64), result.kinematics())
+    # The last bob is at the end of the chain.
+    length = np.hypot(result.x[-1], result.y[-1])
+    assert np.all(length <= model.L.sum() + 1e-12)
+
+
+def test_solve_batch(chain):
+    model, u0 = chain
+    batch = model.solve_batch(np.stack([u0, 0.5 * u0]), T=1, dt=0.01, method="RK4")
+    single = model.solve(0.5 * u0, T=1, dt=0.01, method="RK4")
+
+    assert batch.solution.shape == (2, 8, 101)
+    assert np.allclose(batch.solution[1], single.solution)
+    assert np.allclose(batch.total_energy[1], single.total_energy)
+
+
+def test_save_and_load(chain, tmp_path):
+    model, u0 = chain
+    result = model.solve(u0, T=1, dt=0.01, method="RK4")
+    save_result(result, tmp_path / "chain", model=model)
+
+    loaded = load_result(tmp_path / "chain")
+    assert isinstance(loaded, NPendulumResults)
+    assert np.array_equal(loaded.M, model.M)
+    assert np.allclose(loaded.total_energy, result.total_energy)
+    assert np.array_equal(load_model(tmp_path / "chain").L, model.L)
@@ -73,3 +73,357 @@ def test_solve_pendulum_function_zero_ic():
     assert np.all(
         comp_y == -model.L
     ), f"initial condition (0,0) should give y only containing -L."
+
+
+def test_solve_batch_matches_single_solves():
+    u0 = np.array([[np.pi / 6, 0.35], [0.1, 0.0], [0, 0]])
+    T = 5
+    dt = 0.01
+
+    model = DampenedPendulum(B=0.5)
+    batch = model.solve_batch(u0, T, dt, rtol=1e-8, atol=1e-8)
+
+    assert batch.solution.shape == (3, 2, len(batch.time))
+    assert batch.theta.shape == (3, len(batch.time))
+    assert batch.total_energy.shape == (3, len(batch.time))
+
+    for i in range(len(u0)):
+        single = model.solve(u0[i], T, dt, rtol=1e-8, atol=1e-8)
+        assert np.allclose(batch.theta[i], single.theta, atol=1e-6)
+        assert np.allclose(batch.x[i], single.x, atol=1e-6)
+        assert np.allclose(batch.total_energy[i], single.total_energy, atol=1e-6)
+
+
+@pytest.mark.parametrize("model", [Pendulum(L=1.42), DampenedPendulum(B=2.5)])
+def test_jacobian_matches_finite_differences(model):
+    u = np.array([np.pi / 6, 0.35])
+    h = 1e-7
+    expected = np.array(
+        [(model(0, u + h * e) - model(0, u - h * e)) / (2 * h) for e in np.eye(2)]
+    ).T
+    assert np.allclose(model.jacobian(0, u), expected, atol=1e-6)
+
+
+def test_solve_batch_with_stiff_dampened_pendulum():
+    u0 = np.array([[np.pi / 6, 0.35], [0.1, 0.0]])
+    model = DampenedPendulum(B=1000)
+    batch = model.solve_batch(u0, T=1, dt=0.01, method="Radau")
+    single = model.solve(u0[0], T=1, dt=0.01, method="Radau")
+    assert np.allclose(batch.theta[0], single.theta, atol=1e-3)
+
+
+def test_derived_quantities_are_cached():
+    model = Pendulum()
+    result = model.solve(np.array([np.pi / 6, 0.35]), T=1, dt=0.01)
+
+    assert np.shares_memory(result.kinetic_energy, result.kinetic_energy)
+    assert np.shares_memory(result.x, result.x)
+
+    total = result.total_energy
+    result.solution = np.zeros_like(result.solution)
+    assert not np.shares_memory(result.total_energy, total)
+    assert np.allclose(result.total_energy, 0)
+
+
+def test_caching_can_be_turned_off():
+    model = Pendulum()
+    result = model.solve(np.array([np.pi / 6, 0.35]), T=1, dt=0.01)
+    result.cache = False
+
+    assert not np.shares_memory(result.kinetic_energy, result.kinetic_energy)
+    assert np.all(result.kinetic_energy == result.kinetic_energy)
+    assert "_cached" not in vars(result)
+
+
+def test_uncached_quantities_only_keep_their_row():
+    model = Pendulum()
+    u0 = np.array([[np.pi / 6, 0.35], [0.1, 0.0]])
+    result = model.solve_batch(u0, T=40, dt=0.001, method="RK4")
+    expected = result.kinematics()
+    result.cache = False
+
+    for i, name in enumerate(
+        ["x", "y", "velocity_x", "velocity_y"]
+        + ["potential_energy", "kinetic_energy", "total_energy"]
+    ):
+        row = getattr(result, name)
+        assert row.base is None and row.shape == expected[i].shape
+        assert np.array_equal(row, expected[i])
+
+
+def test_kinematics_match_finite_differences():
+    model = Pendulum(L=1.42)
+    result = model.solve(np.array([np.pi / 6, 0.35]), T=2, dt=0.001, method="RK4")
+
+    vx = np.gradient(result.x, result.time)
+    vy = np.gradient(result.y, result.time)
+    assert np.allclose(result.velocity_x[1:-1], vx[1:-1], atol=1e-4)
+    assert np.allclose(result.velocity_y[1:-1], vy[1:-1], atol=1e-4)
+    assert np.allclose(result.total_energy, result.total_energy[0], rtol=1e-6)
+
+
+def test_pendulum_kinematics_with_out_and_chunks():
+    theta = np.linspace(-1, 1, 1001)
+    omega = np.cos(3 * theta)
+    expected = pendulum_kinematics(theta, omega, L=2.0, g=9.81)
+
+    out = np.empty((7, 1001))
+    computed = pendulum_kinematics(theta, omega, L=2.0, g=9.81, out=out, chunk_size=64)
+    assert computed is out
+    assert np.array_equal(computed, expected)
+    assert np.allclose(expected[5], 0.5 * (expected[2] ** 2 + expected[3] ** 2))
+
+    with pytest.raises(ValueError):
+        pendulum_kinematics(theta, omega, L=2.0, g=9.81, out=np.empty((7, 10)))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100, 5000])
+def test_solve_stream_matches_solve(chunk_size):
+    model = DampenedPendulum(B=0.5)
+    u0 = np.array([np.pi / 6, 0.35])
+    T = 5
+    dt = 0.01
+    expected = model.solve(u0, T, dt, method="RK4")
+
+    chunks = list(model.solve_stream(u0, T, dt, chunk_size=chunk_size, method="RK4"))
+    assert all(isinstance(chunk, PendulumResults) for chunk in chunks)
+    assert all(len(chunk.time) <= chunk_size for chunk in chunks)
+
+    time = np.concatenate([chunk.time for chunk in chunks])
+    theta = np.concatenate([chunk.theta for chunk in chunks])
+    energy = np.concatenate([chunk.total_energy for chunk in chunks])
+    assert np.allclose(time, expected.time)
+    assert np.allclose(theta, expected.theta)
+    assert np.allclose(energy, expected.total_energy)
+
+
+def test_solve_stream_with_solve_ivp_and_batches():
+    model = Pendulum()
+    u0 = np.array([[np.pi / 6, 0.35], [0.1, 0.0]])
+    T = 5
+    dt = 0.01
+    expected = model.solve_batch(u0, T, dt, rtol=1e-8, atol=1e-8)
+
+    chunks = list(model.solve_stream(u0, T, dt, chunk_size=128, rtol=1e-8, atol=1e-8))
+    assert chunks[0].solution.shape == (2, 2, 128)
+    theta = np.concatenate([chunk.theta for chunk in chunks], axis=-1)
+    assert np.allclose(theta, expected.theta, atol=1e-6)
+
+
+def test_dense_solve_evaluates_at_any_time():
+    model = Pendulum()
+    u0 = np.array([np.pi / 6, 0.35])
+    T = 10
+    reference = model.solve(u0, T, dt=0.001, method="RK4")
+
+    dense = model.solve(u0, T, dt=0.01, dense=True, rtol=1e-10, atol=1e-10)
+    assert dense.num_steps < len(reference.time)
+
+    times = np.array([0.0, 0.0015, 1.2345, 9.999, 10.0])
+    result = dense.at(times)
+    assert isinstance(result, PendulumResults)
+    expected = np.array([np.interp(times, reference.time, reference.theta)])
+    assert np.allclose(result.theta, expected, atol=1e-5)
+    assert np.allclose(result.total_energy, reference.total_energy[0], rtol=1e-5)
+
+    # Behaves like the result on the dt grid given to solve.
+    assert dense.num_timepoints == 1001
+    assert np.allclose(dense.theta[::10], reference.theta[::100], atol=1e-5)
+
+    with pytest.raises(ValueError):
+        dense.at([T + 1])
+
+
+def test_dense_solve_batch_and_native_method():
+    model = DampenedPendulum(B=0.5)
+    u0 = np.array([[np.pi / 6, 0.35], [0.1, 0.0]])
+    dense = model.solve_batch(u0, T=5, dt=0.01, method="RK4", dense=True)
+    grid = model.solve_batch(u0, T=5, dt=0.01, method="RK4")
+
+    resampled = dense.resample(0.02)
+    assert resampled.solution.shape == (2, 2, 251)
+    assert np.allclose(resampled.theta, grid.theta[:, ::2])
+    assert np.allclose(dense(2.005), grid.solution[:, :, 200:202].mean(axis=-1), atol=1e-4)
+
+
+@pytest.mark.parametrize("model", [Pendulum(L=1.42), DampenedPendulum(B=2.5)])
+def test_rhs_writes_into_out(model):
+    u = np.array([np.pi / 6, 0.35])
+    out = np.empty(2)
+    assert model(0.0, u, out=out) is out
+    assert np.allclose(out, model(0.0, u))
+
+    ensemble = np.array([[np.pi / 6, 0.1, -1.0], [0.35, 0.0, 2.0]])
+    out = np.empty_like(ensemble)
+    assert model(0.0, ensemble, out=out) is out
+    for i in range(3):
+        assert np.allclose(out[:, i], model(0.0, ensemble[:, i]))
+
+
+def test_solve_batch_attaches_stats():
+    model = Pendulum()
+    u0 = np.array([[np.pi / 6, 0.35], [0.1, 0.0]])
+    result = model.solve_batch(u0, T=1, dt=0.1, method="Verlet", profile=True)
+    assert isinstance(result.stats, SolveStats)
+    assert result.stats.accepted_steps == 10
+    assert result.stats.rhs_calls == result.stats.nfev
+
+
+@pytest.mark.parametrize("method", ["RK45", "DOPRI5", "RK4"])
+def test_theta_crossing_events(method):
+    model = Pendulum()
+    u0 = np.array([np.pi / 6, 0.35])
+    options = {"rtol": 1e-9, "atol": 1e-12} if method != "RK4" else {}
+    result = model.solve(
+        u0, 5, 0.01, method=method, events=theta_crossing(direction=-1), **options
+    )
+    # Crossings from above are one period apart.
+    t_events = result.t_events[0]
+    assert len(t_events) == 3
+    assert np.allclose(np.diff(t_events), t_events[1] - t_events[0], atol=1e-6)
+    assert np.allclose(result.y_events[0][:, 0], 0, atol=1e-6)
+    assert np.all(result.y_events[0][:, 1] < 0)
+    assert result.time[-1] == pytest.approx(5)
+
+
+@pytest.mark.parametrize(
+    "method, options", [("DOPRI5", {}), ("RK4", {"max_step": 0.1})]
+)
+def test_events_between_coarse_output_times(method, options):
+    model = Pendulum()
+    u0 = np.array([0.5, 0.0])
+    expected = model.solve(
+        u0, 10, 0.01, events=theta_crossing(), rtol=1e-10, atol=1e-12
+    )
+    result = model.solve(u0, 10, 2.0, method=method, events=theta_crossing(), **options)
+    assert len(result.t_events[0]) == len(expected.t_events[0]) == 10
+    assert np.allclose(result.t_events[0], expected.t_events[0], atol=1e-3)
+    assert np.allclose(result.y_events[0][:, 0], 0, atol=1e-6)
+
+
+@pytest.mark.parametrize("method", ["RK45", "RK4", "DOPRI5"])
+def test_terminal_event_truncates_output(method):
+    model = DampenedPendulum(B=0.5)
+    u0 = np.array([np.pi / 6, 0.35])
+    result = model.solve(u0, 20, 0.01, method=method, events=energy_below(model, 0.1))
+    t_event = result.t_events[0][0]
+    assert result.stats.status == 1
+    assert result.time[-1] <= t_event < result.time[-1] + 0.01
+    assert result.solution.shape == (2, len(result.time))
+    assert model.energy(result.y_events[0][0]) == pytest.approx(0.1)
+
+
+def test_energy_matches_results():
+    model = Pendulum(L=2.0)
+    result = model.solve(np.array([np.pi / 6, 0.35]), 1, 0.01)
+    assert np.allclose(model.energy(result.solution), result.total_energy)
+
+
+def test_solve_batch_rejects_events():
+    with pytest.raises(ValueError):
+        Pendulum().solve_batch(np.zeros((2, 2)), 1, 0.1, events=theta_crossing())
+
+
+def test_plot_energy_decimates_dense_results(tmp_path):
+    model = Pendulum()
+    u0 = np.array([np.pi / 6, 0.35])
+    result = model.solve(u0, 20, 0.001, method="RK4", dense=True)
+    plot_energy(result, filename=tmp_path / "energy.png")
+    assert result._result is None
+    lines = plt.gca().lines
+    assert len(lines) == 3
+    assert all(len(line.get_xdata()) < 2000 for line in lines)
+    assert np.max(lines[2].get_ydata()) == pytest.approx(1.3755, abs=1e-3)
+    plt.close()
+
+
+@pytest.mark.parametrize(
+    "u0",
+    [
+        [np.pi / 6, 0.35],
+        [-0.5, -1.0],
+        [2.5, 0.3],
+        [0.2, 7.0],
+        [1.0, -7.0],
+        [7.0, 0.4],
+    ],
+    ids=["swing", "swing back", "large swing", "rotate", "rotate back", "turned"],
+)
+def test_analytic_solution_matches_integration(u0):
+    model = Pendulum(L=1.3)
+    u0 = np.array(u0)
+    expected = model.solve(u0, T=10, dt=0.01, method="DOP853", rtol=1e-12, atol=1e-12)
+    computed = model.solve(u0, T=10, dt=0.01, method="analytic")
+    assert computed.stats.method == "analytic"
+    assert np.allclose(computed.solution, expected.solution, atol=1e-8)
+
+
+def test_solve_uses_analytic_solution_by_default():
+    model = Pendulum()
+    u0 = np.array([[0.5, 0.35], [2.5, 0.0], [0.2, 7.0]])
+    batch = model.solve_batch(u0, T=5, dt=0.01)
+    assert batch.stats.method == "analytic"
+    for i in range(len(u0)):
+        single = model.solve(u0[i], T=5, dt=0.01)
+        assert single.stats.method == "analytic"
+        assert np.allclose(batch.solution[i], single.solution)
+
+    chunks = model.solve_stream(u0[0], T=5, dt=0.01, chunk_size=128)
+    streamed = np.concatenate([chunk.solution for chunk in chunks], axis=-1)
+    assert np.allclose(streamed, batch.solution[0])
+
+    # Events and dense output fall back to the numerical default.
+    assert model.solve(u0[0], T=5, dt=0.01, dense=True).stats.method == "RK45"
+
+
+@pytest.mark.parametrize(
+    "u0", [[np.pi, 0.0], [0.0, 2 * np.sqrt(9.81)]], ids=["top", "separatrix"]
+)
+def test_separatrix_is_solved_numerically(u0):
+    model = Pendulum()
+    u0 = np.array(u0)
+    expected = model.solve(u0, T=1, dt=0.1, method="RK45", rtol=1e-10, atol=1e-10)
+    with pytest.raises(ValueError):
+        model.solve(u0, T=1, dt=0.1, method="analytic")
+
+    single = model.solve(u0, T=1, dt=0.1, rtol=1e-10, atol=1e-10)
+    assert single.stats.method == "RK45"
+    assert np.allclose(single.solution, expected.solution)
+
+    batch = model.solve_batch(
+        np.array([[0.5, 0.0], u0]), T=1, dt=0.1, rtol=1e-10, atol=1e-10
+    )
+    assert batch.stats.method == "RK45"
+    assert np.allclose(batch.solution[1], expected.solution, atol=1e-8)
+
+    chunks = model.solve_stream(u0, T=1, dt=0.1, chunk_size=4, rtol=1e-10, atol=1e-10)
+    streamed = np.concatenate([chunk.solution for chunk in chunks], axis=-1)
+    assert np.allclose(streamed, expected.solution, atol=1e-8)
+
+
+def test_small_angle_solution():
+    model = Pendulum(L=2.0)
+    u0 = np.array([0.01, 0.005])
+    small = model.solve(u0, T=10, dt=0.01, method="analytic", small_angle=True)
+    exact = model.solve(u0, T=10, dt=0.01, method="analytic")
+    assert np.allclose(small.solution, exact.solution, atol=1e-5)
+
+
+def test_dampened_pendulum_has_no_analytic_solution():
+    u0 = np.array([0.5, 0.1])
+    assert DampenedPendulum(B=0.5).solve(u0, T=1, dt=0.01).stats.method == "RK45"
+    with pytest.raises(ValueError):
+        DampenedPendulum(B=0.5).solve(u0, T=1, dt=0.01, method="analytic")
+    undamped = DampenedPendulum(B=0).solve(u0, T=1, dt=0.01)
+    assert np.allclose(undamped.solution, Pendulum().solve(u0, T=1, dt=0.01).solution)
+
+
+def test_analytic_method_rejects_events():
+    with pytest.raises(ValueError):
+        Pendulum().solve(
+            np.array([0.5, 0.0]),
+            T=1,
+            dt=0.01,
+            method="analytic",
+            events=theta_crossing(),
+        )
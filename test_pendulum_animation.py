@@ -0,0 +1,82 @@
+import sys
+
+import numpy as np
+import pytest
+
+from double_pendulum import DoublePendulum
+from pendulum_animation import *
+
+
+@pytest.fixture(scope="module")
+def results():
+    model = DoublePendulum()
+    return model.solve(np.array([2.5, 0, 2.8, 0]), T=4, dt=0.001, method="RK4")
+
+
+def test_ring_buffer_keeps_last_points_in_order():
+    buffer = RingBuffer(3)
+    for i in range(5):
+        buffer.append(i, -i)
+    x, y = buffer.ordered()
+    assert list(x) == [2, 3, 4]
+    assert list(y) == [-2, -3, -4]
+
+
+def test_resample_to_frame_times(results):
+    resampled = resample(results, fps=25, speed=2.0)
+    assert np.allclose(np.diff(resampled.time), 2.0 / 25)
+    assert len(resampled.time) == 51
+    expected = np.interp(resampled.time, results.time, results.x2)
+    assert np.allclose(resampled.x2, expected, atol=1e-5)
+
+
+def test_blitted_frames_match_full_redraw(results):
+    animation = DoublePendulumAnimation(results, fps=10, trail=5)
+    frames = list(frame.copy() for frame in animation.frames())
+    assert len(frames) == animation.num_frames == 41
+    width, height = animation.size
+    assert frames[-1].shape == (height, width, 4)
+    assert not np.array_equal(frames[0], frames[-1])
+
+    for artist in animation.artists:
+        artist.set_animated(False)
+    animation.canvas.draw()
+    assert np.array_equal(frames[-1], np.asarray(animation.canvas.buffer_rgba()))
+
+
+def test_save_streams_frames_to_encoder(results, tmp_path):
+    # Stand-in for ffmpeg that counts the bytes it receives.
+    encoder = tmp_path / "encoder"
+    encoder.write_text(
+        f"#!{sys.executable}\n"
+        "import sys\n"
+        "size = len(sys.stdin.buffer.read())\n"
+        "open(sys.argv[-1], 'w').write(str(size))\n"
+    )
+    encoder.chmod(0o755)
+    animation = DoublePendulumAnimation(results, fps=10)
+    animation.save(tmp_path / "out.mp4", ffmpeg=str(encoder))
+    width, height = animation.size
+    assert int((tmp_path / "out.mp4").read_text()) == 41 * width * height * 4
+
+
+def test_save_without_ffmpeg_raises(results, tmp_path):
+    with pytest.raises(RuntimeError):
+        animate_double_pendulum(
+            results, tmp_path / "out.mp4", fps=5, ffmpeg="no-such-ffmpeg"
+        )
+
+
+def test_save_reports_output_of_failing_encoder(results, tmp_path):
+    # Exits without reading the frames, as ffmpeg does for a bad codec.
+    encoder = tmp_path / "encoder"
+    encoder.write_text(
+        f"#!{sys.executable}\n"
+        "import sys\n"
+        "sys.stderr.write('Unknown encoder nonsense')\n"
+        "sys.exit(1)\n"
+    )
+    encoder.chmod(0o755)
+    animation = DoublePendulumAnimation(results, fps=10)
+    with pytest.raises(RuntimeError, match="Unknown encoder nonsense"):
+        animation.save(tmp_path / "out.mp4", ffmpeg=str(encoder))
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from pendulum import *
+from double_pendulum import *
+from reducers import *
+from storage import load_result, save_result
+
+
+def test_pendulum_reducers_match_full_solution():
+    model = Pendulum()
+    u0 = np.array([np.pi / 6, 0.35])
+    reducers = [MaxAbsolute(0), EnergyStatistics(model), ZeroCrossingPeriod(0)]
+    max_theta, energy, period = reduce_solve(
+        model, u0, 20, 0.01, reducers, chunk_size=77, method="RK4"
+    )
+
+    full = model.solve(u0, 20, 0.01, method="RK4")
+    assert max_theta == pytest.approx(np.max(np.abs(full.theta)))
+    assert energy.mean == pytest.approx(np.mean(full.total_energy))
+    assert energy.min == pytest.approx(np.min(full.total_energy))
+    assert energy.drift == pytest.approx(full.total_energy[-1] - full.total_energy[0])
+    assert energy.max_relative_deviation < 1e-6
+
+    crossings = model.solve(
+        u0, 20, 0.01, method="RK4", events=theta_crossing(direction=1)
+    ).t_events[0]
+    assert period == pytest.approx(np.mean(np.diff(crossings)), rel=1e-4)
+
+
+def test_reducers_on_batches_give_one_value_per_trajectory():
+    model = Pendulum()
+    u0 = np.array([[np.pi / 6, 0.35], [0.1, 0.0], [1.0, 0.0]])
+    max_theta, energy, period = reduce_solve(
+        model,
+        u0,
+        10,
+        0.01,
+        [MaxAbsolute(0), EnergyStatistics(model), ZeroCrossingPeriod(0)],
+        chunk_size=50,
+        method="RK4",
+    )
+    assert max_theta.shape == energy.mean.shape == period.shape == (3,)
+    assert np.allclose(max_theta[1:], [0.1, 1.0], atol=1e-6)
+    # Larger amplitudes have longer periods.
+    assert period[1] < period[0] < period[2]
+
+
+def test_period_is_nan_without_crossings():
+    model = DampenedPendulum(B=10.0)
+    (period,) = reduce_solve(
+        model, np.array([0.5, 0.0]), 1, 0.01, [ZeroCrossingPeriod(0)]
+    )
+    assert np.isnan(period)
+
+
+@pytest.mark.parametrize("chunk_size", [7, 100, 5000])
+def test_poincare_section_does_not_depend_on_chunks(chunk_size):
+    model = DoublePendulum()
+    u0 = np.array([[np.pi / 2, 0, np.pi / 2, 0], [1.0, 0, 0.5, 0]])
+    (section,) = reduce_solve(
+        model, u0, 20, 0.01, [PoincareSection()], chunk_size, method="RK4"
+    )
+    (single,) = reduce_solve(
+        model, u0[1], 20, 0.01, [PoincareSection()], chunk_size, method="RK4"
+    )
+    assert single.trajectory is None
+    assert len(single.time) > 3
+    assert np.allclose(single.points, section.points[section.trajectory == 1])
+
+    full = model.solve(u0[1], 20, 0.01, method="RK4")
+    theta2 = np.interp(single.time, full.time, full.theta2)
+    assert np.allclose(np.mod(theta2 + np.pi, 2 * np.pi) - np.pi, 0, atol=1e-3)
+
+
+def test_reduce_result_reads_stored_result_in_chunks(tmp_path):
+    model = Pendulum()
+    result = model.solve(np.array([np.pi / 6, 0.35]), 10, 0.01)
+    save_result(result, tmp_path / "result", model=model)
+    stored = load_result(tmp_path / "result")
+    (max_theta,) = reduce_result(stored, [MaxAbsolute(0)], chunk_size=64)
+    assert max_theta == pytest.approx(np.max(np.abs(result.theta)))
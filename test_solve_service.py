@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import unittest.mock
+
+import numpy as np
+import pytest
+
+from double_pendulum import DoublePendulum
+from exp_decay import ExponentialDecay
+from ode import InvalidInitialConditionError, ODEResult
+from pendulum import DampenedPendulum, PendulumResults
+from solve_service import *
+
+
+def test_concurrent_requests_are_coalesced():
+    model = DoublePendulum()
+    u0s = [np.array([0.1 * i, 0.0, 0.2, 0.0]) for i in range(8)]
+
+    async def main():
+        async with SolveService(window=0.05) as service:
+            results = await asyncio.gather(
+                *(
+                    service.solve_async(model, u0, T=1, dt=0.01, method="RK4")
+                    for u0 in u0s
+                )
+            )
+        return service, results
+
+    service, results = asyncio.run(main())
+    assert service.metrics.batches == 1
+    assert service.metrics.completed == 8
+    assert service.metrics.mean_batch_size == 8
+    assert service.metrics.latency(95) > 0
+    for u0, result in zip(u0s, results):
+        expected = model.solve(u0, T=1, dt=0.01, method="RK4")
+        assert np.allclose(result.solution, expected.solution)
+        assert np.allclose(result.total_energy, expected.total_energy)
+        assert result.stats.method == "RK4"
+
+
+def test_different_parameters_are_solved_separately():
+    async def main():
+        async with SolveService(window=0.01) as service:
+            results = await asyncio.gather(
+                service.solve_async(DampenedPendulum(B=0.1), [0.5, 0], T=1, dt=0.1),
+                service.solve_async(DampenedPendulum(B=0.2), [0.5, 0], T=1, dt=0.1),
+                service.solve_async(DampenedPendulum(B=0.1), [0.2, 0], T=1, dt=0.1),
+                service.solve_async(ExponentialDecay(0.4), [1.0], T=1, dt=0.1),
+            )
+        return service, results
+
+    service, results = asyncio.run(main())
+    assert service.metrics.batches == 3
+    assert isinstance(results[0], PendulumResults)
+    assert isinstance(results[3], ODEResult)
+    expected = DampenedPendulum(B=0.2).solve(np.array([0.5, 0]), T=1, dt=0.1)
+    assert np.allclose(results[1].solution, expected.solution, atol=1e-6)
+
+
+def test_max_batch_size_and_backpressure():
+    model = ExponentialDecay(0.4)
+
+    async def main():
+        service = SolveService(window=10, max_batch_size=2, max_pending=2)
+        tasks = [
+            asyncio.ensure_future(service.solve_async(model, [float(i)], T=1, dt=0.1))
+            for i in range(1, 6)
+        ]
+        peak = 0
+        while sum(task.done() for task in tasks) < 4:
+            peak = max(peak, service.in_flight)
+            await asyncio.sleep(0)
+        # The last request has no partner, close solves it without waiting.
+        await service.close()
+        return service, peak, await asyncio.gather(*tasks)
+
+    service, peak, results = asyncio.run(main())
+    assert peak <= 2
+    assert service.metrics.completed == 5
+    for i, result in enumerate(results, start=1):
+        assert np.allclose(result.solution[0], i * np.exp(-0.4 * result.time))
+
+
+def test_cancelled_requests_are_dropped():
+    model = ExponentialDecay(0.4)
+
+    async def main():
+        async with SolveService(window=0.05) as service:
+            tasks = [
+                asyncio.ensure_future(service.solve_async(model, [u], T=1, dt=0.1))
+                for u in (1.0, 2.0, 3.0)
+            ]
+            await asyncio.sleep(0)
+            tasks[1].cancel()
+            done = await asyncio.gather(*tasks, return_exceptions=True)
+        return service, done
+
+    service, done = asyncio.run(main())
+    assert isinstance(done[1], asyncio.CancelledError)
+    assert np.allclose(done[2].solution[0, 0], 3.0)
+    assert service.metrics.cancelled == 1
+    assert service.metrics.completed == 2
+    assert service.pending == 0
+
+
+def test_invalid_requests_raise():
+    async def main():
+        async with SolveService() as service:
+            with pytest.raises(InvalidInitialConditionError):
+                await service.solve_async(DoublePendulum(), [0.1, 0.0], T=1, dt=0.1)
+            with pytest.raises(ValueError):
+                await service.solve_async(
+                    DoublePendulum(), [0.1, 0, 0, 0], T=1, dt=0.1, method="Unknown"
+                )
+        return service
+
+    service = asyncio.run(main())
+    assert service.metrics.failed == 1
+
+
+def test_equal_numpy_and_python_parameters_are_coalesced():
+    async def main():
+        async with SolveService(window=0.05) as service:
+            await asyncio.gather(
+                service.solve_async(DampenedPendulum(B=0.1), [0.5, 0], T=1, dt=0.1),
+                service.solve_async(
+                    DampenedPendulum(B=np.float64(0.1)),
+                    [0.2, 0],
+                    T=1,
+                    dt=np.float64(0.1),
+                ),
+            )
+        return service
+
+    assert asyncio.run(main()).metrics.batches == 1
+
+
+def test_throughput_does_not_count_idle_time():
+    model = ExponentialDecay(0.4)
+
+    async def main():
+        async with SolveService(window=0.001) as service:
+            await asyncio.sleep(0.5)
+            await asyncio.gather(
+                *(service.solve_async(model, [1.0], T=1, dt=0.1) for _ in range(4))
+            )
+            await asyncio.sleep(0.5)
+        return service
+
+    metrics = asyncio.run(main()).metrics
+    assert metrics.throughput > 4 / 0.5
+
+
+@pytest.mark.parametrize("started", [False, True])
+def test_cancelled_solve_cancels_its_requests(started):
+    model = ExponentialDecay(0.4)
+    entered = threading.Event()
+    release = threading.Event()
+
+    def blocking_solve(*args):
+        entered.set()
+        release.wait()
+
+    async def main():
+        service = SolveService(window=0.001)
+        requests = [
+            asyncio.ensure_future(service.solve_async(model, [u], T=1, dt=0.1))
+            for u in (1.0, 2.0)
+        ]
+        with unittest.mock.patch("solve_service._solve_batch", blocking_solve):
+            while not service._running or (started and not entered.is_set()):
+                await asyncio.sleep(0.001)
+            for task in service._running:
+                task.cancel()
+            _, waiting = await asyncio.wait(requests, timeout=5)
+        release.set()
+        await service.close()
+        return waiting, requests
+
+    waiting, requests = asyncio.run(main())
+    assert not waiting
+    assert all(request.cancelled() for request in requests)
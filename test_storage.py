@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from exp_decay import ExponentialDecay
+from double_pendulum import *
+from storage import *
+
+
+def test_save_and_load_ode_result(tmp_path):
+    model = ExponentialDecay(0.4)
+    result = model.solve(np.array([5.0]), T=10, dt=0.01)
+    save_result(result, tmp_path / "decay", model=model, method="RK45")
+
+    loaded = load_result(tmp_path / "decay")
+    assert isinstance(loaded, ODEResult)
+    assert isinstance(loaded.time, np.memmap)
+    assert np.array_equal(loaded.time, result.time)
+    assert np.array_equal(loaded.solution, result.solution)
+
+    header = load_header(tmp_path / "decay")
+    assert header["method"] == "RK45"
+    assert header["model_parameters"] == {"decay_constant": 0.4}
+    assert load_model(tmp_path / "decay").decay_constant == 0.4
+
+
+def test_load_pendulum_results_keeps_fields(tmp_path):
+    model = DampenedPendulum(B=0.5, L=2.0)
+    result = model.solve(np.array([np.pi / 6, 0.35]), T=5, dt=0.01)
+    save_result(result, tmp_path / "pendulum", model=model)
+
+    loaded = load_result(tmp_path / "pendulum")
+    assert isinstance(loaded, PendulumResults)
+    assert loaded.L == 2.0 and loaded.g == 9.81
+    assert np.allclose(loaded.total_energy, result.total_energy)
+    assert load_model(tmp_path / "pendulum").B == 0.5
+
+    # Slicing a window of a single state does not copy.
+    window = loaded.theta[100:200]
+    assert np.shares_memory(window, loaded.solution)
+    assert np.array_equal(window, result.theta[100:200])
+
+
+def test_save_stream_of_batches_and_append(tmp_path):
+    model = DoublePendulum()
+    u0 = np.array([[np.pi / 6, 0.35, 0, 0], [0.1, 0, 0.2, 0]])
+    T = 2
+    dt = 0.01
+    expected = model.solve_batch(u0, T, dt, method="RK4")
+
+    chunks = model.solve_stream(u0, T, dt, chunk_size=50, method="RK4")
+    first = [next(chunks), next(chunks)]
+    assert save_stream(first, tmp_path / "double", model, "RK4") == 100
+    total = save_stream(chunks, tmp_path / "double", mode="a")
+    assert total == len(expected.time)
+
+    loaded = load_result(tmp_path / "double")
+    assert isinstance(loaded, DoublePendulumResults)
+    assert loaded.solution.shape == expected.solution.shape
+    assert np.allclose(loaded.solution, expected.solution)
+    assert np.allclose(loaded.time, expected.time)
+    assert load_header(tmp_path / "double")["method"] == "RK4"
+
+
+def test_append_with_wrong_shape_raises_ValueError(tmp_path):
+    with ResultWriter(tmp_path / "wrong") as writer:
+        writer.append(ODEResult(np.arange(3.0), np.zeros((2, 3))))
+        with pytest.raises(ValueError):
+            writer.append(ODEResult(np.arange(3.0), np.zeros((4, 3))))
+
+
+def test_compact_results_keep_dtype_and_time_grid(tmp_path):
+    model = DoublePendulum()
+    u0 = np.array([np.pi / 6, 0.35, 0, 0])
+    chunks = model.solve_stream(
+        u0,
+        T=5,
+        dt=0.01,
+        chunk_size=128,
+        method="RK4",
+        dtype=np.float32,
+        implicit_time=True,
+    )
+    save_stream(chunks, tmp_path / "compact", model=model)
+
+    loaded = load_result(tmp_path / "compact")
+    expected = model.solve(u0, T=5, dt=0.01, method="RK4")
+    assert loaded.solution.dtype == np.float32
+    assert isinstance(loaded.time, UniformTimeGrid)
+    assert np.allclose(loaded.time, expected.time)
+    assert (tmp_path / "compact" / "time.bin").stat().st_size == 0
+    assert np.allclose(loaded.total_energy, expected.total_energy, rtol=1e-5)
+
+    # Time points that do not continue the grid cannot be appended.
+    with ResultWriter(tmp_path / "compact", mode="a") as writer:
+        with pytest.raises(ValueError):
+            writer.append(expected)
+
+
+def test_empty_stream_raises_ValueError(tmp_path):
+    with pytest.raises(ValueError):
+        save_stream(iter([]), tmp_path / "empty")
+    assert not (tmp_path / "empty" / HEADER).exists()
+    save_result(ExponentialDecay(0.4).solve(np.array([1.0]), 1, 0.1), tmp_path / "old")
+    with pytest.raises(ValueError):
+        save_stream(iter([]), tmp_path / "old")
+    assert not (tmp_path / "old" / HEADER).exists()
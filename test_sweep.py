@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from pendulum import *
+from sweep import *
+
+
+def test_parameter_grid_is_cartesian_product():
+    computed = parameter_grid({"L": [1, 2], "g": [9.81, 3.71, 1.62]})
+    assert np.all(computed["L"] == [1, 1, 1, 2, 2, 2])
+    assert np.all(computed["g"] == [9.81, 3.71, 1.62] * 2)
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_sweep_matches_single_solves(max_workers):
+    u0 = np.array([np.pi / 6, 0.35])
+    grid = {"B": [0.0, 0.5, 1.0, 2.0], "L": [1.0, 2.0]}
+    T = 2
+    dt = 0.01
+
+    computed = sweep(
+        DampenedPendulum, grid, u0, T, dt, method="RK4", max_workers=max_workers
+    )
+
+    assert computed.solution.shape == (8, 2, len(computed.time))
+    for B in grid["B"]:
+        for L in grid["L"]:
+            expected = DampenedPendulum(B=B, L=L).solve(u0, T, dt, method="RK4")
+            result = computed.result(B=B, L=L)
+            assert isinstance(result, PendulumResults)
+            assert result.L == L
+            assert np.allclose(result.solution, expected.solution)
+
+
+def test_iter_sweep_streams_every_combination_once():
+    u0 = np.array([0.1, 0.0])
+    grid = {"L": np.linspace(1, 2, 7)}
+    seen = []
+    for indices, time, solutions in iter_sweep(
+        Pendulum, grid, u0, T=1, dt=0.1, max_workers=2, chunksize=2
+    ):
+        assert len(indices) == len(solutions) <= 2
+        seen.extend(indices)
+    assert sorted(seen) == list(range(7))
+
+
+def test_sweep_with_ensemble_of_initial_conditions():
+    u0 = np.array([[0.1, 0.0], [0.2, 0.0], [0.3, 0.0]])
+    computed = sweep(Pendulum, {"L": [1, 2]}, u0, T=1, dt=0.1, max_workers=1)
+    assert computed.solution.shape == (2, 3, 2, len(computed.time))
+
+
+def test_index_of_missing_combination_raises_KeyError():
+    computed = sweep(Pendulum, {"L": [1, 2]}, np.array([0.1, 0]), 1, 0.1, max_workers=1)
+    with pytest.raises(KeyError):
+        computed.index(L=3)
+
+
+def test_sweep_aggregates_stats():
+    u0 = np.array([np.pi / 6, 0.35])
+    grid = {"B": [0.0, 0.5, 1.0]}
+    computed = sweep(
+        DampenedPendulum, grid, u0, 1, 0.1, method="RK4", max_workers=1, chunksize=2
+    )
+    assert computed.stats.num_solves == 3
+    assert computed.stats.accepted_steps == 3 * 10
+    assert computed.stats.nfev == 4 * computed.stats.accepted_steps
+
+
+@pytest.mark.parametrize("grid", [{}, {"L": []}, {"L": [1, 2], "g": []}])
+def test_empty_grid_raises_ValueError(grid):
+    with pytest.raises(ValueError):
+        sweep(Pendulum, grid, np.array([0.1, 0]), 1, 0.1, max_workers=1)
+
+
+def test_sweep_with_more_chunks_than_submitted_at_once():
+    u0 = np.array([0.1, 0.0])
+    grid = {"L": np.linspace(1, 2, 11)}
+    computed = sweep(
+        Pendulum, grid, u0, 1, 0.1, method="RK4", max_workers=2, chunksize=1
+    )
+    for L in grid["L"]:
+        expected = Pendulum(L=L).solve(u0, 1, 0.1, method="RK4")
+        assert np.allclose(computed.result(L=L).solution, expected.solution)
@@ -0,0 +1,86 @@
+import numpy as np
+
+from work_precision import *
+
+
+def test_configurations_skip_methods_that_do_not_apply():
+    computed = list(
+        configurations(
+            models=["DampenedPendulum", "DoublePendulum"],
+            methods=["RK4", "Verlet", "ImplicitMidpoint", "RK45"],
+            tolerances=[1e-3, 1e-6],
+            dts=[0.1],
+        )
+    )
+    keys = [configuration.key() for configuration in computed]
+    assert "DampenedPendulum/Verlet/None/0.1/10.0" not in keys
+    assert "DampenedPendulum/ImplicitMidpoint/None/0.1/10.0" not in keys
+    assert "DoublePendulum/ImplicitMidpoint/None/0.1/10.0" in keys
+    # One fixed step run per dt, one adaptive run per tolerance.
+    assert keys.count("DoublePendulum/RK4/None/0.1/10.0") == 1
+    assert len([key for key in keys if "/RK45/" in key]) == 4
+
+
+def test_run_suite_measures_error_and_drift():
+    records = run_suite(
+        configurations(["Pendulum"], ["RK4", "Verlet"], dts=[0.1, 0.01], Ts=[2.0]),
+        repeat=1,
+    )
+    assert len(records) == 4
+    for record in records:
+        assert record["wall_time"] > 0
+        assert record["peak_memory"] > 0
+        assert record["rhs_calls"] > 0
+        assert record["energy_drift"] is not None
+    rk4 = [record for record in records if record["method"] == "RK4"]
+    assert rk4[1]["error"] < rk4[0]["error"]
+
+
+def test_wall_time_is_measured_without_profiling(monkeypatch):
+    model = MODELS["Pendulum"][0]
+    solve = model.solve
+    timed = []
+
+    def recording_solve(*args, profile=False, **kwargs):
+        result = solve(*args, profile=profile, **kwargs)
+        if not profile:
+            timed.append(result.stats.wall_time)
+        return result
+
+    monkeypatch.setattr(model, "solve", recording_solve)
+    configuration = Configuration("Pendulum", "RK4", None, 0.1, 2.0)
+    # The error against the reference does not matter here.
+    record = run_configuration(configuration, lambda *key: np.zeros(0), repeat=1)
+    # The timed solve and the one traced by tracemalloc.
+    assert len(timed) == 2
+    assert record["wall_time"] == timed[0]
+    assert record["rhs_calls"] > 0
+
+
+def test_results_round_trip_and_regressions(tmp_path):
+    records = run_suite(configurations(["DampenedPendulum"], ["RK4"], dts=[0.1]), 1)
+    filename = tmp_path / "results.json"
+    save_results(records, filename)
+    baseline = load_results(filename)
+    assert baseline == records
+    assert regressions(records, baseline) == []
+
+    baseline[0]["wall_time"] = records[0]["wall_time"] / 10
+    slower = regressions(records, baseline, min_difference=0.0)
+    assert [regression["key"] for regression in slower] == [
+        "DampenedPendulum/RK4/None/0.1/10.0"
+    ]
+
+
+def test_main_fails_on_regression(tmp_path):
+    arguments = ["--models", "Pendulum", "--methods", "RK4", "--dt", "0.1"]
+    arguments += ["--T", "1", "--repeat", "1", "--quiet"]
+    baseline = tmp_path / "baseline.json"
+    assert main(arguments + ["--output", str(baseline)]) == 0
+
+    records = load_results(baseline)
+    records[0]["wall_time"] = -1.0
+    save_results(records, baseline)
+    arguments += ["--baseline", str(baseline), "--plot", str(tmp_path / "wp.png")]
+    assert main(arguments) == 1
+    assert (tmp_path / "wp.png").is_file()
@@ -0,0 +1,336 @@
+"""
+Work-precision benchmarks of the solvers on the pendulum models.
+
+Every model is solved with every method that applies to it, across
+tolerances, output steps dt and end times T. For each configuration the
+wall time, the number of calls of the right hand side, the peak memory and
+the error against a high accuracy reference are recorded, together with
+the relative drift of the total energy for the conservative models.
+
+Run with
+    python work_precision.py --output results.json --plot work_precision.png
+and add --baseline results.json to a later run to exit with status 1 when
+a configuration has become slower than in the stored results.
+"""
+import argparse
+import json
+import platform
+import sys
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import scipy
+import matplotlib.pyplot as plt
+
+from pendulum import Pendulum, DampenedPendulum
+from double_pendulum import DoublePendulum
+
+# name: (model, initial condition, whether the total energy is conserved)
+MODELS = {
+    "Pendulum": (Pendulum(), np.array([np.pi / 6, 0.35]), True),
+    "DampenedPendulum": (
+        DampenedPendulum(B=0.5),
+        np.array([np.pi / 6, 0.35]),
+        False,
+    ),
+    "DoublePendulum": (
+        DoublePendulum(),
+        np.array([np.pi / 6, 0.35, 0.0, 0.0]),
+        True,
+    ),
+}
+
+# Native methods that take exactly one step per output interval.
+FIXED_STEP_METHODS = ("RK4", "Verlet", "ImplicitMidpoint")
+ADAPTIVE_METHODS = ("RK45", "DOP853", "DOPRI5", "Radau", "BDF", "LSODA")
+
+REFERENCE_METHOD = "DOP853"
+REFERENCE_TOLERANCE = 1e-12
+
+
+@dataclass(frozen=True)
+class Configuration:
+    """One point of the benchmark grid, tolerance is None for fixed steps."""
+
+    model: str
+    method: str
+    tolerance: Optional[float]
+    dt: float
+    T: float
+
+    @property
+    def options(self) -> dict:
+        if self.tolerance is None:
+            return {}
+        return {"rtol": self.tolerance, "atol": self.tolerance}
+
+    def key(self) -> str:
+        return f"{self.model}/{self.method}/{self.tolerance}/{self.dt}/{self.T}"
+
+
+def applies(model, method: str) -> bool:
+    """Whether a method can be used for a model, see the symplectic integrators."""
+    if method == "Verlet":
+        return model.structure == "separable"
+    if method == "ImplicitMidpoint":
+        return model.structure in ("hamiltonian", "separable")
+    return True
+
+
+def configurations(
+    models: Sequence[str] = tuple(MODELS),
+    methods: Sequence[str] = FIXED_STEP_METHODS + ADAPTIVE_METHODS,
+    tolerances: Sequence[float] = (1e-3, 1e-6, 1e-9),
+    dts: Sequence[float] = (0.1, 0.01),
+    Ts: Sequence[float] = (10.0,),
+) -> Iterator[Configuration]:
+    """
+    The cartesian product of the arguments, where the fixed step methods are
+    only run once per dt and T since they ignore the tolerance.
+    """
+    for name in models:
+        model = MODELS[name][0]
+        for method in methods:
+            if not applies(model, method):
+                continue
+            fixed = method in FIXED_STEP_METHODS
+            for tolerance in (None,) if fixed else tolerances:
+                for dt in dts:
+                    for T in Ts:
+                        yield Configuration(name, method, tolerance, dt, T)
+
+
+class _References:
+    """High accuracy solutions, computed once per model and time grid."""
+
+    def __init__(self) -> None:
+        self._solutions = {}
+
+    def __call__(self, name: str, dt: float, T: float) -> np.ndarray:
+        if (name, dt, T) not in self._solutions:
+            model, u0, _ = MODELS[name]
+            result = model.solve(
+                u0,
+                T,
+                dt,
+                method=REFERENCE_METHOD,
+                rtol=REFERENCE_TOLERANCE,
+                atol=REFERENCE_TOLERANCE,
+            )
+            self._solutions[name, dt, T] = result.solution
+        return self._solutions[name, dt, T]
+
+
+def energy_drift(result) -> float:
+    """Largest deviation of the total energy from its initial value, relative."""
+    energy = result.total_energy
+    return float(np.max(np.abs(energy - energy[0])) / max(abs(energy[0]), 1e-300))
+
+
+def run_configuration(
+    configuration: Configuration, references: _References, repeat: int = 3
+) -> dict:
+    """
+    Benchmarks one configuration.
+
+    The wall time is the best of repeat solves without profiling, and the
+    calls of the right hand side are counted in a separate profiled solve,
+    since the profiling adds to the time. The peak memory is measured with
+    tracemalloc in another solve, since tracing slows down the allocations.
+
+    Returns: the fields of the configuration, and wall_time [s], rhs_calls,
+    accepted_steps, peak_memory [bytes], error (largest absolute deviation
+    from the reference over the grid), energy_drift (None when the energy is
+    not conserved) and status.
+    """
+    model, u0, conservative = MODELS[configuration.model]
+    c = configuration
+
+    def solve(profile=False):
+        return model.solve(
+            u0, c.T, c.dt, method=c.method, profile=profile, **c.options
+        )
+
+    wall_time = min(solve().stats.wall_time for _ in range(max(1, repeat)))
+    result = solve(profile=True)
+
+    tracemalloc.start()
+    try:
+        solve()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    reference = references(c.model, c.dt, c.T)
+    if result.solution.shape == reference.shape:
+        error = float(np.max(np.abs(result.solution - reference)))
+    else:
+        # The solver stopped early.
+        error = float("inf")
+
+    return {
+        **asdict(configuration),
+        "wall_time": wall_time,
+        "rhs_calls": result.stats.rhs_calls,
+        "accepted_steps": result.stats.accepted_steps,
+        "peak_memory": peak_memory,
+        "error": error,
+        "energy_drift": energy_drift(result) if conservative else None,
+        "status": result.stats.status,
+    }
+
+
+def run_suite(
+    configurations: Iterable[Configuration], repeat: int = 3, verbose: bool = False
+) -> List[dict]:
+    """Benchmarks every configuration, see run_configuration."""
+    references = _References()
+    records = []
+    for configuration in configurations:
+        record = run_configuration(configuration, references, repeat)
+        if verbose:
+            print(
+                f"{configuration.key():<48}{1000 * record['wall_time']:>10.2f} ms"
+                f"{record['rhs_calls']:>10}{record['error']:>12.2e}"
+            )
+        records.append(record)
+    return records
+
+
+def save_results(records: List[dict], filename: str) -> None:
+    """Writes the records to a JSON file, with the versions used."""
+    document = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "machine": platform.machine(),
+        "records": records,
+    }
+    with open(filename, "w") as file:
+        json.dump(document, file, indent=1)
+
+
+def load_results(filename: str) -> List[dict]:
+    with open(filename) as file:
+        return json.load(file)["records"]
+
+
+def _key(record: dict) -> str:
+    return Configuration(
+        *(record[name] for name in ("model", "method", "tolerance", "dt", "T"))
+    ).key()
+
+
+def regressions(
+    records: List[dict],
+    baseline: List[dict],
+    threshold: float = 0.2,
+    min_difference: float = 1e-3,
+) -> List[dict]:
+    """
+    The records that are slower than the record of the same configuration in
+    the baseline, by more than the relative threshold and by more than
+    min_difference seconds, which keeps timer noise on very short solves from
+    being reported. Configurations missing from the baseline are skipped.
+
+    Returns: dictionaries with the key of the configuration, the baseline
+    and the new wall time.
+    """
+    baseline_times = {_key(record): record["wall_time"] for record in baseline}
+    slower = []
+    for record in records:
+        key = _key(record)
+        if key not in baseline_times:
+            continue
+        before, after = baseline_times[key], record["wall_time"]
+        if after > before * (1 + threshold) and after - before > min_difference:
+            slower.append({"key": key, "baseline": before, "wall_time": after})
+    return slower
+
+
+def plot_work_precision(records: List[dict], filename: Optional[str] = None) -> None:
+    """
+    Plots the wall time against the error, one panel per model and one line
+    per method, with the points of a line ordered by the error.
+    """
+    models = list(dict.fromkeys(record["model"] for record in records))
+    fig, axes = plt.subplots(
+        1, len(models), figsize=(5 * len(models), 4), squeeze=False
+    )
+    for ax, model in zip(axes[0], models):
+        lines: Dict[str, list] = {}
+        for record in records:
+            if record["model"] == model and np.isfinite(record["error"]):
+                lines.setdefault(record["method"], []).append(record)
+        for method, points in lines.items():
+            points.sort(key=lambda record: record["error"])
+            ax.loglog(
+                [max(record["error"], 1e-16) for record in points],
+                [record["wall_time"] for record in points],
+                "o-",
+                label=method,
+            )
+        ax.set_title(model)
+        ax.set_xlabel("max error")
+        ax.set_ylabel("wall time [s]")
+        ax.legend(fontsize="small")
+    fig.tight_layout()
+    if filename is not None:
+        fig.savefig(filename)
+        plt.close(fig)
+    else:
+        plt.show()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--models", nargs="+", default=list(MODELS), choices=MODELS)
+    parser.add_argument(
+        "--methods",
+        nargs="+",
+        default=list(FIXED_STEP_METHODS + ADAPTIVE_METHODS),
+    )
+    parser.add_argument(
+        "--tolerances", nargs="+", type=float, default=[1e-3, 1e-6, 1e-9]
+    )
+    parser.add_argument("--dt", nargs="+", type=float, default=[0.1, 0.01])
+    parser.add_argument("--T", nargs="+", type=float, default=[10.0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--plot", help="image file for the work-precision plot")
+    parser.add_argument("--baseline", help="JSON results to check for regressions")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown that counts as a regression",
+    )
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    records = run_suite(
+        configurations(args.models, args.methods, args.tolerances, args.dt, args.T),
+        repeat=args.repeat,
+        verbose=not args.quiet,
+    )
+    if args.output:
+        save_results(records, args.output)
+    if args.plot:
+        plot_work_precision(records, args.plot)
+    if args.baseline:
+        slower = regressions(records, load_results(args.baseline), args.threshold)
+        for regression in slower:
+            print(
+                f"Regression: {regression['key']} took "
+                f"{1000 * regression['wall_time']:.2f} ms, "
+                f"baseline {1000 * regression['baseline']:.2f} ms"
+            )
+        if slower:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())